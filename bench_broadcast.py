@@ -0,0 +1,293 @@
+"""
+Симулятор рассылки против локальной заглушки Bot API.
+
+Поднимает на 127.0.0.1 aiohttp-сервер, который отвечает как api.telegram.org, и
+запускает через него настоящее задание рассылки (broadcast.start_broadcast_job) на
+временной БД с синтетической аудиторией. Заглушка добавляет задержку ответа, 429
+(случайные и при превышении лимита скорости), 403 от заблокировавших бота и
+случайные 5xx. После каждого прогона печатаются скорость, время, число повторов и
+проверка итога: каждому ли получателю ушло ровно одно сообщение и совпадает ли
+сводка админу с тем, что реально доставлено.
+
+Работает офлайн, рабочую data.db и настоящий Telegram не трогает:
+    python bench_broadcast.py [--users 1000,10000,100000] [--workers 8] [--rate 30]
+                              [--burst 5] [--latency-ms 40] [--jitter-ms 20]
+                              [--p403 0.05] [--p5xx 0.002] [--p429 0.0005]
+                              [--flood-limit 0] [--retry-after 1] [--mode text|copy]
+                              [--seed 42] [--json results.json] [--verbose]
+
+Настройки движка (BROADCAST_WORKERS/RATE/BURST/CHUNK_SIZE) передаются через окружение
+до импорта broadcast, поэтому прогон идёт ровно тем кодом, что и в боте.
+Код выхода 1, если хоть одна проверка не прошла.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter, deque
+from datetime import datetime
+from pathlib import Path
+
+# чат админа, куда задание пишет ход рассылки и итог; ошибки в нём не симулируются
+ADMIN_CHAT = -100
+STUB_TOKEN = '123456:bench-stub'
+# методы, которыми задание отправляет сообщение получателю
+DELIVERY_METHODS = {'sendmessage', 'sendphoto', 'sendvideo', 'sendanimation', 'senddocument',
+                    'copymessage', 'copymessages'}
+
+
+class StubBotAPI:
+    """Заглушка Bot API с настраиваемыми сбоями; считает, что и кому доставлено."""
+
+    def __init__(self, args: argparse.Namespace, blocked: set[int]) -> None:
+        self.latency = args.latency_ms / 1000
+        self.jitter = args.jitter_ms / 1000
+        self.p429 = args.p429
+        self.p5xx = args.p5xx
+        self.flood_limit = args.flood_limit
+        self.retry_after = args.retry_after
+        self.blocked = blocked
+        self.rnd = random.Random(args.seed)
+        self.delivered: Counter = Counter()
+        self.attempted: set[int] = set()
+        self.responses: Counter = Counter()
+        self.admin_messages: list[str] = []
+        self._window: deque[float] = deque()
+        self._message_id = 0
+
+    def _flooded(self) -> bool:
+        if not self.flood_limit:
+            return False
+        # скользящее окно в секунду, как flood control у Telegram
+        now = time.monotonic()
+        while self._window and self._window[0] <= now - 1:
+            self._window.popleft()
+        if len(self._window) >= self.flood_limit:
+            return True
+        self._window.append(now)
+        return False
+
+    def _message(self, chat_id: int, text: str | None = None) -> dict:
+        self._message_id += 1
+        message = {'message_id': self._message_id, 'date': int(time.time()), 'chat': {'id': chat_id, 'type': 'private'}}
+        if text is not None:
+            message['text'] = text
+        return message
+
+    def _error(self, code: int, description: str, **parameters) -> dict:
+        self.responses[code] += 1
+        payload = {'ok': False, 'error_code': code, 'description': description}
+        if parameters:
+            payload['parameters'] = parameters
+        return payload
+
+    def _answer(self, method: str, params: dict) -> dict:
+        chat_id = int(params.get('chat_id', 0))
+        if chat_id == ADMIN_CHAT or method not in DELIVERY_METHODS:
+            # ход рассылки (editMessageText) и итог админу
+            if method == 'sendmessage':
+                self.admin_messages.append(params.get('text', ''))
+            return {'ok': True, 'result': self._message(chat_id, params.get('text'))}
+        self.attempted.add(chat_id)
+        if self._flooded() or self.rnd.random() < self.p429:
+            return self._error(429, f'Too Many Requests: retry after {self.retry_after}', retry_after=self.retry_after)
+        if chat_id in self.blocked:
+            return self._error(403, 'Forbidden: bot was blocked by the user')
+        if self.rnd.random() < self.p5xx:
+            return self._error(self.rnd.choice((500, 502)), 'Internal Server Error')
+        self.responses[200] += 1
+        self.delivered[chat_id] += 1
+        if method == 'copymessages':
+            ids = json.loads(params.get('message_ids', '[]'))
+            return {'ok': True, 'result': [{'message_id': self._message(chat_id)['message_id']} for _ in ids]}
+        if method == 'copymessage':
+            return {'ok': True, 'result': {'message_id': self._message(chat_id)['message_id']}}
+        return {'ok': True, 'result': self._message(chat_id, params.get('text'))}
+
+    async def handle(self, request):
+        from aiohttp import web
+
+        params = dict(await request.post())
+        delay = max(0.0, self.rnd.gauss(self.latency, self.jitter)) if self.latency else 0.0
+        if delay:
+            await asyncio.sleep(delay)
+        payload = self._answer(request.match_info['method'].lower(), params)
+        # aiogram выбирает класс ошибки по HTTP-статусу, как у настоящего API
+        return web.json_response(payload, status=payload.get('error_code', 200))
+
+
+def _reset(db, users: int) -> None:
+    """Чистая аудитория из users пользователей и пустая история рассылок."""
+    with db._transaction() as con:
+        con.execute('DELETE FROM broadcast_deliveries')
+        con.execute('DELETE FROM broadcast_jobs')
+        con.execute('DELETE FROM users')
+        con.executemany(
+            "INSERT INTO users(user_id, username, first_name, last_name, last_seen) VALUES(?,?,?,?,datetime('now'))",
+            ((uid, f'user{uid}', 'Имя', 'Фамилия') for uid in range(1, users + 1)),
+        )
+
+
+def _parse_summary(text: str) -> dict:
+    numbers = {}
+    for key, label in (('sent', 'Отправлено'), ('failed', 'Не доставлено'), ('total', 'Всего пользователей')):
+        match = re.search(rf'{label}: (\d+)', text)
+        numbers[key] = int(match.group(1)) if match else None
+    return numbers
+
+
+async def _simulate(args: argparse.Namespace, users: int, db, db_async, broadcast) -> dict:
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiohttp import web
+
+    _reset(db, users)
+    rnd = random.Random(args.seed)
+    blocked = set(rnd.sample(range(1, users + 1), int(users * args.p403)))
+    stub = StubBotAPI(args, blocked)
+
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', stub.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f'http://127.0.0.1:{port}'), limit=max(100, args.workers * 2))
+    stub_bot = Bot(STUB_TOKEN, session=session)
+    broadcast.bot = stub_bot
+    broadcast._limiter = broadcast.TokenBucket(args.rate, args.burst)
+    try:
+        source = {}
+        if args.mode == 'copy':
+            source = {'source_chat_id': ADMIN_CHAT, 'source_message_ids': [1]}
+        started = time.perf_counter()
+        job = await broadcast.start_broadcast_job(
+            None if source else 'Бенчмарк рассылки', None, 'bench', ADMIN_CHAT, **source)
+        task = broadcast._jobs.get(job['id'])
+        if task is not None:
+            await task
+        wall = time.perf_counter() - started
+        job = await db_async.get_broadcast_job(job['id'])
+        reasons = await db_async.get_broadcast_failure_reasons(job['id'])
+    finally:
+        await stub_bot.session.close()
+        await runner.cleanup()
+
+    con = db._connect()
+    unreachable = {row[0] for row in con.execute(
+        "SELECT user_id FROM broadcast_deliveries WHERE job_id=? AND reason='unreachable'", (job['id'],))}
+    summary = _parse_summary(stub.admin_messages[-1] if stub.admin_messages else '')
+    delivered = len(stub.delivered)
+    checks = {
+        'job_done': job['status'] == 'done',
+        'everyone_attempted': len(stub.attempted) == users,
+        'no_duplicates': all(count == 1 for count in stub.delivered.values()),
+        'sent_matches_delivered': job['sent'] == delivered,
+        'total_is_sent_plus_failed': job['total'] == job['sent'] + job['failed'] == users,
+        'unreachable_are_blocked': unreachable <= blocked,
+        'summary_matches': summary == {'sent': delivered, 'failed': users - delivered, 'total': users},
+    }
+    requests = sum(stub.responses.values())
+    return {
+        'users': users,
+        'wall_seconds': round(wall, 2),
+        'msgs_per_sec': round(delivered / wall, 1) if wall else None,
+        'delivered': delivered,
+        'failed': job['failed'],
+        'failure_reasons': reasons,
+        'requests': requests,
+        'retries': requests - len(stub.attempted),
+        'responses': {str(code): count for code, count in sorted(stub.responses.items())},
+        'blocked': len(blocked),
+        'checks': checks,
+        'ok': all(checks.values()),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', default='1000', help='размеры аудитории через запятую')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('BROADCAST_WORKERS', '8')))
+    parser.add_argument('--rate', type=float, default=float(os.getenv('BROADCAST_RATE', '30')),
+                        help='сообщений в секунду (TokenBucket)')
+    parser.add_argument('--burst', type=float, default=float(os.getenv('BROADCAST_BURST', '5')))
+    parser.add_argument('--chunk', type=int, default=int(os.getenv('BROADCAST_CHUNK_SIZE', '200')),
+                        help='получателей на страницу чтения из БД')
+    parser.add_argument('--latency-ms', type=float, default=40.0, help='средняя задержка ответа заглушки')
+    parser.add_argument('--jitter-ms', type=float, default=20.0, help='разброс задержки (σ)')
+    parser.add_argument('--p403', type=float, default=0.05, help='доля пользователей, заблокировавших бота')
+    parser.add_argument('--p5xx', type=float, default=0.002, help='вероятность 5xx на запрос')
+    parser.add_argument('--p429', type=float, default=0.0005, help='вероятность случайного 429 на запрос')
+    parser.add_argument('--flood-limit', type=int, default=0,
+                        help='429, если запросов за секунду больше этого (0 = без лимита)')
+    parser.add_argument('--retry-after', type=int, default=1, help='retry_after в ответах 429, секунд')
+    parser.add_argument('--mode', choices=('text', 'copy'), default='text', help='sendMessage или copyMessage')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', dest='json_path', help="записать результаты в JSON ('-' = stdout)")
+    parser.add_argument('--verbose', action='store_true', help='не приглушать логи движка рассылки')
+    args = parser.parse_args()
+    sizes = [int(part) for part in args.users.split(',') if part.strip()]
+
+    tmpdir = tempfile.TemporaryDirectory(prefix='versavija-bench-broadcast-')
+    os.environ['DB_PATH'] = str(Path(tmpdir.name) / 'bench.db')
+    os.environ['BROADCAST_WORKERS'] = str(args.workers)
+    os.environ['BROADCAST_CHUNK_SIZE'] = str(args.chunk)
+    # config требует токен; запросы всё равно уходят только в заглушку
+    os.environ.setdefault('BOT_TOKEN', STUB_TOKEN)
+
+    # окружение читается при импорте, поэтому модули подключаются только здесь
+    import broadcast
+    import db
+    import db_async
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.ERROR)
+    log = sys.stderr if args.json_path == '-' else sys.stdout
+    db.init_db()
+
+    results = []
+    loop = asyncio.new_event_loop()
+    print(f'{"users":>7} {"wall s":>8} {"msg/s":>8} {"sent":>7} {"failed":>7} {"retries":>8} '
+          f'{"429":>6} {"403":>6} {"5xx":>6}  checks', file=log)
+    for users in sizes:
+        row = loop.run_until_complete(_simulate(args, users, db, db_async, broadcast))
+        results.append(row)
+        responses = row['responses']
+        failed_checks = [name for name, passed in row['checks'].items() if not passed]
+        print(f'{users:7} {row["wall_seconds"]:8.2f} {row["msgs_per_sec"] or 0:8.1f} {row["delivered"]:7} '
+              f'{row["failed"]:7} {row["retries"]:8} {responses.get("429", 0):6} {responses.get("403", 0):6} '
+              f'{sum(v for k, v in responses.items() if k.startswith("5")):6}  '
+              f'{"ok" if row["ok"] else "FAIL: " + ", ".join(failed_checks)}', file=log)
+    loop.close()
+    db_async.shutdown_executor()
+    db.close_connections()
+
+    if args.json_path:
+        report = {
+            'meta': {
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'settings': {k: v for k, v in vars(args).items() if k not in ('json_path', 'verbose')},
+            },
+            'results': results,
+        }
+        if args.json_path == '-':
+            json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+            print()
+        else:
+            Path(args.json_path).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+    tmpdir.cleanup()
+    return 0 if all(row['ok'] for row in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
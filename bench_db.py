@@ -0,0 +1,420 @@
+"""
+Бенчмарк слоя данных на синтетической БД реалистичного объёма.
+
+Строит временную БД (по умолчанию 100k пользователей, 1M лайков, 50k записей,
+5k фото портфолио, 2k ключей настроек) и замеряет каждую публичную функцию db.py
+и db_async.py: по одному вызову подряд и под конкурентной нагрузкой (потоки для db.py,
+задачи asyncio для db_async). Печатает p50/p95/p99 и пропускную способность;
+с --json пишет те же результаты в машиночитаемом виде.
+
+Работает офлайн, рабочую data.db не трогает:
+    python bench_db.py [--scale 0.1] [--iterations 500] [--concurrency 32]
+                       [--only get_setting,toggle_photo_like] [--json results.json]
+                       [--db /tmp/scratch.db] [--connect-per-call]
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Объёмы при --scale 1
+USERS = 100_000
+LIKES = 1_000_000
+BOOKINGS = 50_000
+CATEGORIES = 20
+PHOTOS_PER_CATEGORY = 250
+SETTINGS = 2_000
+PROMOTIONS = 200
+
+STATUSES = ('active', 'confirmed', 'cancelled', 'done')
+BASE_DAY = datetime(2030, 1, 1, 10, 0)
+DEFAULT_MENU = [{'text': f'Кнопка {n}', 'callback': f'btn_{n}'} for n in range(12)]
+BENCH_USER = 10_000_000
+
+# Служебные функции без запросов к данным, а также разрушающие набор данных
+SKIPPED = {
+    'init_db': 'миграции, выполняются один раз при старте',
+    'clear_all_bookings': 'удаляет все записи бенчмарка',
+    'close_connections': 'закрытие соединений',
+    'mark_thread_read_only': 'настройка потока',
+    'write_batch': 'контекстный менеджер пакета записи',
+    'settings_cache_stats': 'счётчики кэша',
+    'clear_settings_cache': 'сброс кэша',
+    'shutdown_executor': 'остановка движка',
+}
+
+
+class Volumes:
+    def __init__(self, scale: float) -> None:
+        self.users = max(100, int(USERS * scale))
+        self.likes = max(1_000, int(LIKES * scale))
+        self.bookings = max(100, int(BOOKINGS * scale))
+        self.categories = CATEGORIES
+        self.photos = max(10, int(PHOTOS_PER_CATEGORY * scale))
+        self.settings = max(50, int(SETTINGS * scale))
+        self.promotions = PROMOTIONS
+
+    def as_dict(self) -> dict:
+        return {
+            'users': self.users,
+            'photo_likes': self.likes,
+            'bookings': self.bookings,
+            'portfolio_photos': self.categories * self.photos,
+            'settings': self.settings,
+            'promotions': self.promotions,
+        }
+
+
+def _booking_ts(n: int) -> str:
+    # записи по одной в час на протяжении нескольких лет, начиная с BASE_DAY
+    return (BASE_DAY + timedelta(hours=n)).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def _seed(db, vol: Volumes) -> None:
+    """Заполнить БД напрямую через executemany в одной транзакции."""
+    db.init_db()
+    rnd = random.Random(42)
+    with db._transaction() as con:
+        con.executemany(
+            "INSERT INTO users(user_id, username, first_name, last_name, last_seen) VALUES(?,?,?,?,datetime('now'))",
+            ((uid, f'user{uid}', 'Имя', 'Фамилия') for uid in range(1, vol.users + 1)),
+        )
+        # (категория, фото) фиксированы остатком от деления, поэтому тройки уникальны
+        per_user = vol.categories * vol.photos
+        con.executemany(
+            'INSERT INTO photo_likes(category_slug, photo_index, user_id) VALUES(?,?,?)',
+            (
+                (f'cat{i % vol.categories}', (i // vol.categories) % vol.photos, 1 + (i // per_user) * 7919 % vol.users)
+                for i in range(vol.likes)
+            ),
+        )
+        con.executemany(
+            '''INSERT INTO bookings(user_id, username, chat_id, start_ts, status, category, reminder_sent)
+               VALUES(?,?,?,?,?,?,?)''',
+            (
+                (uid, f'user{uid}', uid, _booking_ts(n), rnd.choice(STATUSES), 'Семейная', int(n < vol.bookings // 2))
+                for n in range(vol.bookings)
+                for uid in (rnd.randint(1, vol.users),)
+            ),
+        )
+        con.executemany(
+            'INSERT INTO portfolio_photos(category_slug, position, file_id, file_unique_id) VALUES(?,?,?,?)',
+            (
+                (f'cat{c}', p, f'file-{c}-{p}', f'uniq-{c}-{p}')
+                for c in range(vol.categories)
+                for p in range(vol.photos)
+            ),
+        )
+        con.executemany(
+            'INSERT INTO settings(key, value) VALUES(?,?)',
+            ((f'bench_key_{n}', json.dumps({'n': n, 'payload': 'x' * 64})) for n in range(vol.settings)),
+        )
+        con.executemany(
+            'INSERT INTO promotions(title, description, start_date, end_date, created_by) VALUES(?,?,?,?,?)',
+            (
+                (f'Акция {n}', 'Описание', f'20{20 + n % 10}-01-01', f'20{21 + n % 10}-01-01', 'admin')
+                for n in range(vol.promotions)
+            ),
+        )
+    db.set_setting('portfolio_categories', json.dumps(
+        [{'text': f'Категория {c}', 'slug': f'cat{c}'} for c in range(vol.categories)], ensure_ascii=False))
+    db.save_menu(DEFAULT_MENU)
+    db.save_pending_actions({'admin': {'action': 'add_photo_to', 'payload': {'slug': 'cat0'}}})
+    db.clear_settings_cache()
+
+
+def _cases(vol: Volumes) -> dict:
+    """name -> (call(module, i), max_calls). Одинаковые вызовы для db и db_async."""
+    mid = vol.bookings // 2
+
+    def bid(i):
+        return 1 + i * 7919 % vol.bookings
+
+    def cat(i):
+        return f'cat{i % vol.categories}'
+
+    def week(i):
+        return _booking_ts(mid + i % 1000)[:10], _booking_ts(mid + i % 1000 + 24 * 7)[:10]
+
+    return {
+        'schema_version': (lambda m, i: m.schema_version(), None),
+        'get_setting': (lambda m, i: m.get_setting(f'bench_key_{i % vol.settings}'), None),
+        'get_setting_json': (lambda m, i: m.get_setting_json('portfolio_categories'), None),
+        'get_setting_cached': (lambda m, i: m.get_setting_cached('portfolio_categories'), None),
+        'get_setting_json_cached': (lambda m, i: m.get_setting_json_cached('portfolio_categories'), None),
+        'set_setting': (lambda m, i: m.set_setting(f'bench_write_{i % 100}', str(i)), None),
+        'get_menu': (lambda m, i: m.get_menu(DEFAULT_MENU), None),
+        'merge_menu_defaults': (lambda m, i: m.merge_menu_defaults(DEFAULT_MENU), None),
+        'save_menu': (lambda m, i: m.save_menu(DEFAULT_MENU), None),
+        'get_pending_actions': (lambda m, i: m.get_pending_actions(), None),
+        'save_pending_actions': (lambda m, i: m.save_pending_actions({'admin': {'action': 'noop', 'payload': {'i': i}}}), None),
+        'add_booking': (lambda m, i: m.add_booking(1 + i % vol.users, 'bench', 1, _booking_ts(vol.bookings + i), 'Семейная'), None),
+        'get_bookings_between': (lambda m, i: m.get_bookings_between(*week(i)), None),
+        'is_slot_taken': (lambda m, i: m.is_slot_taken(_booking_ts(i % vol.bookings)), None),
+        'get_booking': (lambda m, i: m.get_booking(bid(i)), None),
+        'get_active_booking_for_user': (lambda m, i: m.get_active_booking_for_user(1 + i * 104729 % vol.users), None),
+        'update_booking_time_and_category': (
+            lambda m, i: m.update_booking_time_and_category(bid(i), _booking_ts(bid(i)), 'Семейная'),
+            None,
+        ),
+        'update_booking_time_category_location': (
+            lambda m, i: m.update_booking_time_category_location(
+                bid(i), _booking_ts(bid(i)), 'Семейная', 55.75, 37.62, 'Москва', 'bench', None),
+            None,
+        ),
+        'update_booking_status': (lambda m, i: m.update_booking_status(bid(i), STATUSES[i % 2]), None),
+        'mark_booking_reminder_sent': (lambda m, i: m.mark_booking_reminder_sent(bid(i)), None),
+        'get_due_reminders': (
+            lambda m, i: m.get_due_reminders(_booking_ts(mid + i % 1000), _booking_ts(mid + i % 1000 + 24)),
+            None,
+        ),
+        'add_user': (lambda m, i: m.add_user(1 + i * 104729 % vol.users, 'bench', 'Имя', 'Фамилия'), None),
+        'touch_users': (
+            lambda m, i: m.touch_users([(1 + (i * 100 + n) * 104729 % vol.users, '2030-01-01 10:00:00') for n in range(100)]),
+            None,
+        ),
+        'get_all_users': (lambda m, i: m.get_all_users(), 10),
+        'count_users': (lambda m, i: m.count_users(), 10),
+        'get_user_ids_page': (lambda m, i: m.get_user_ids_page(i * 7919 % vol.users, 500), None),
+        'add_promotion': (lambda m, i: m.add_promotion('bench', 'bench', '2030-01-01', '2030-02-01', 'bench'), None),
+        'get_active_promotions': (lambda m, i: m.get_active_promotions(), None),
+        'get_all_promotions': (lambda m, i: m.get_all_promotions(), None),
+        'delete_promotion': (lambda m, i: m.delete_promotion(vol.promotions + 1 + i), None),
+        'cleanup_expired_promotions': (lambda m, i: m.cleanup_expired_promotions(), None),
+        'toggle_photo_like': (lambda m, i: m.toggle_photo_like(cat(i), i % vol.photos, BENCH_USER + i % 50), None),
+        'toggle_photo_like_count': (
+            lambda m, i: m.toggle_photo_like_count(cat(i), i % vol.photos, BENCH_USER + i % 50),
+            None,
+        ),
+        'set_photo_like': (
+            lambda m, i: m.set_photo_like(cat(i), i % vol.photos, BENCH_USER + i % 50, bool(i % 2)),
+            None,
+        ),
+        'get_photo_likes_count': (lambda m, i: m.get_photo_likes_count(cat(i), i % vol.photos), None),
+        'get_photo_like_states': (
+            lambda m, i: m.get_photo_like_states([(cat(i), (i + n) % vol.photos) for n in range(10)], 1 + i % vol.users),
+            None,
+        ),
+        'user_has_liked_photo': (lambda m, i: m.user_has_liked_photo(cat(i), i % vol.photos, 1 + i % vol.users), None),
+        'count_portfolio_photos': (lambda m, i: m.count_portfolio_photos(cat(i)), None),
+        'get_portfolio_photo': (lambda m, i: m.get_portfolio_photo(cat(i), i % vol.photos), None),
+        'get_portfolio_photos': (lambda m, i: m.get_portfolio_photos(cat(i)), None),
+        'add_portfolio_photo': (
+            lambda m, i: m.add_portfolio_photo('bench_scratch', f'scratch-{time.perf_counter_ns()}-{i}'),
+            None,
+        ),
+        'add_portfolio_photos': (
+            lambda m, i: m.add_portfolio_photos(
+                'bench_album', [(f'album-{time.perf_counter_ns()}-{i}-{n}', None) for n in range(10)]),
+            None,
+        ),
+        'delete_portfolio_photo': (lambda m, i: m.delete_portfolio_photo('bench_scratch', 0), None),
+        'set_portfolio_photos': (lambda m, i: m.set_portfolio_photos('bench_set', [(f'set-{n}', f'set-u{n}') for n in range(50)]), None),
+        'clear_portfolio_photos': (lambda m, i: m.clear_portfolio_photos('bench_set'), None),
+        'get_viewer_positions': (lambda m, i: m.get_viewer_positions(0.0, 1000), None),
+        'get_media_file_ids': (lambda m, i: m.get_media_file_ids(), None),
+        'quarantine_media': (lambda m, i: m.quarantine_media([('portfolio', 'bench_scratch', f'missing-{i}', None)]), None),
+        'save_viewer_positions': (
+            lambda m, i: m.save_viewer_positions([(1 + (i * 100 + n) % vol.users, 'cat0', str(n), 1e9 + i) for n in range(100)]),
+            None,
+        ),
+        'create_broadcast_job': (lambda m, i: m.create_broadcast_job('bench', None, 'bench', None), 3),
+        'get_broadcast_job': (lambda m, i: m.get_broadcast_job(1), None),
+        'get_running_broadcast_jobs': (lambda m, i: m.get_running_broadcast_jobs(), None),
+        'claim_broadcast_recipients': (
+            lambda m, i: m.claim_broadcast_recipients(1, [1 + (i * 200 + n) % vol.users for n in range(200)]),
+            100,
+        ),
+        'release_broadcast_recipients': (
+            lambda m, i: m.release_broadcast_recipients(1, [1 + (i * 200 + n) % vol.users for n in range(200)]),
+            100,
+        ),
+        'get_pending_broadcast_recipients': (lambda m, i: m.get_pending_broadcast_recipients(1), 100),
+        'record_broadcast_results': (
+            lambda m, i: m.record_broadcast_results(1, [(1 + (i * 200 + n) % vol.users, n % 10 != 0, None) for n in range(200)]),
+            100,
+        ),
+        'close_interrupted_broadcast_deliveries': (lambda m, i: m.close_interrupted_broadcast_deliveries(1), None),
+        'set_broadcast_job_status': (lambda m, i: m.set_broadcast_job_status(2, ('running', 'paused')[i % 2]), None),
+        'set_broadcast_progress_message': (lambda m, i: m.set_broadcast_progress_message(2, i), None),
+        'set_broadcast_media_file_id': (lambda m, i: m.set_broadcast_media_file_id(2, f'file-{i}'), None),
+        'finish_broadcast_job': (lambda m, i: m.finish_broadcast_job(2 + i % 2), None),
+        'get_broadcast_failure_reasons': (lambda m, i: m.get_broadcast_failure_reasons(1), 100),
+    }
+
+
+def _summary(layer: str, mode: str, name: str, samples: list[float], wall: float) -> dict:
+    q = statistics.quantiles(samples, n=100, method='inclusive') if len(samples) > 1 else samples * 99
+    return {
+        'layer': layer,
+        'mode': mode,
+        'function': name,
+        'calls': len(samples),
+        'p50_us': round(q[49], 1),
+        'p95_us': round(q[94], 1),
+        'p99_us': round(q[98], 1),
+        'mean_us': round(statistics.fmean(samples), 1),
+        'ops_per_sec': round(len(samples) / wall, 1) if wall else None,
+    }
+
+
+def _run_sync(db, call, calls: int, concurrency: int, reconnect: bool) -> tuple[list[float], float]:
+    samples: list[float] = []
+    lock = threading.Lock()
+
+    def one(i: int) -> None:
+        start = time.perf_counter()
+        call(db, i)
+        if reconnect:
+            # прежнее поведение: соединение закрывается после каждого вызова
+            db.close_connections()
+        elapsed = (time.perf_counter() - start) * 1e6
+        with lock:
+            samples.append(elapsed)
+
+    wall_start = time.perf_counter()
+    if concurrency <= 1:
+        for i in range(calls):
+            one(i)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(calls)))
+    return samples, time.perf_counter() - wall_start
+
+
+async def _run_async(db_async, call, calls: int, concurrency: int) -> tuple[list[float], float]:
+    samples: list[float] = []
+    counter = iter(range(calls))
+
+    async def worker() -> None:
+        for i in counter:
+            start = time.perf_counter()
+            await call(db_async, i)
+            samples.append((time.perf_counter() - start) * 1e6)
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return samples, time.perf_counter() - wall_start
+
+
+def _public_names(db, db_async) -> tuple[set, set]:
+    sync_names = {
+        name for name, fn in inspect.getmembers(db, inspect.isfunction)
+        if fn.__module__ == db.__name__ and not name.startswith('_')
+    }
+    async_names = set(db_async.__all__) | {
+        name for name, fn in vars(db_async).items()
+        if inspect.iscoroutinefunction(fn) and not name.startswith('_')
+    }
+    return sync_names, async_names
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='множитель объёмов данных (1.0 = 100k пользователей, 1M лайков)')
+    parser.add_argument('--iterations', type=int, default=500, help='вызовов на функцию в каждом режиме')
+    parser.add_argument('--concurrency', type=int, default=32, help='потоков/задач в конкурентном режиме')
+    parser.add_argument('--only', default='', help='список функций через запятую')
+    parser.add_argument('--db', help='путь к новому файлу БД (по умолчанию временный каталог)')
+    parser.add_argument('--json', dest='json_path', help="записать результаты в JSON ('-' = stdout)")
+    parser.add_argument('--connect-per-call', action='store_true',
+                        help='добавить режим «новое соединение на каждый вызов» для db.py')
+    args = parser.parse_args()
+
+    tmpdir = None
+    if args.db:
+        db_path = Path(args.db)
+        if db_path.exists():
+            parser.error(f'{db_path} уже существует: укажите новый файл')
+    else:
+        tmpdir = tempfile.TemporaryDirectory(prefix='versavija-bench-')
+        db_path = Path(tmpdir.name) / 'bench.db'
+    os.environ['DB_PATH'] = str(db_path)
+
+    # DB_PATH читается при импорте, поэтому модули подключаются только здесь
+    import db
+    import db_async
+
+    log = sys.stderr if args.json_path == '-' else sys.stdout
+    vol = Volumes(args.scale)
+    seed_start = time.perf_counter()
+    _seed(db, vol)
+    seed_seconds = time.perf_counter() - seed_start
+    print(f'seeded {vol.as_dict()} in {seed_seconds:.1f}s ({db_path.stat().st_size / 2**20:.0f} MiB)', file=log)
+
+    cases = _cases(vol)
+    only = {name.strip() for name in args.only.split(',') if name.strip()}
+    sync_names, async_names = _public_names(db, db_async)
+    uncovered = sorted((sync_names | async_names) - set(cases) - set(SKIPPED))
+    if uncovered:
+        print(f'no benchmark case for: {", ".join(uncovered)}', file=sys.stderr)
+
+    results = []
+    loop = asyncio.new_event_loop()
+    print(f'{"layer":9} {"mode":17} {"function":38} {"p50 us":>9} {"p95 us":>9} {"p99 us":>9} {"ops/s":>10}', file=log)
+    for name, (call, max_calls) in cases.items():
+        if only and name not in only:
+            continue
+        calls = min(args.iterations, max_calls or args.iterations)
+        runs = []
+        if name in sync_names:
+            if args.connect_per_call:
+                runs.append(('db', 'connect-per-call', lambda: _run_sync(db, call, calls, 1, reconnect=True)))
+            runs.append(('db', 'single', lambda: _run_sync(db, call, calls, 1, reconnect=False)))
+            runs.append((
+                'db', f'threads x{args.concurrency}',
+                lambda: _run_sync(db, call, calls, args.concurrency, reconnect=False),
+            ))
+        if name in async_names:
+            runs.append(('db_async', 'single', lambda: loop.run_until_complete(_run_async(db_async, call, calls, 1))))
+            runs.append((
+                'db_async', f'tasks x{args.concurrency}',
+                lambda: loop.run_until_complete(_run_async(db_async, call, calls, args.concurrency)),
+            ))
+        for layer, mode, run in runs:
+            samples, wall = run()
+            row = _summary(layer, mode, name, samples, wall)
+            results.append(row)
+            print(f'{layer:9} {mode:17} {name:38} {row["p50_us"]:9.1f} {row["p95_us"]:9.1f} '
+                  f'{row["p99_us"]:9.1f} {row["ops_per_sec"]:10.0f}', file=log)
+    loop.close()
+    db_async.shutdown_executor()
+    print('settings cache:', db.settings_cache_stats(), file=log)
+
+    if args.json_path:
+        report = {
+            'meta': {
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'volumes': vol.as_dict(),
+                'seed_seconds': round(seed_seconds, 2),
+                'iterations': args.iterations,
+                'concurrency': args.concurrency,
+                'uncovered': uncovered,
+            },
+            'results': results,
+        }
+        if args.json_path == '-':
+            json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+            print()
+        else:
+            Path(args.json_path).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
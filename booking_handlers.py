@@ -17,6 +17,7 @@ from admin_utils import get_all_admin_ids, is_admin_view_enabled
 from bot_constants import DEFAULT_MENU, MENU_MESSAGES
 from config import DEFAULT_CITY_CENTER, DEFAULT_CITY_NAME, MAP_ZOOM_DEFAULT, bot
 from keyboards import build_main_keyboard_from_menu
+from portfolio_catalog import portfolio_catalog
 from utils import (
     fetch_yandex_address_from_html,
     fetch_yandex_coords_from_html,
@@ -62,31 +63,9 @@ async def _build_loc_suffix(
         return ''
 
 
-DEFAULT_PORTFOLIO_CATEGORIES = [
-    {"text": "👨‍👩‍👧‍👦 Семейная", "slug": "family"},
-    {"text": "💕 Love Story", "slug": "love_story"},
-    {"text": "👤 Индивидуальная", "slug": "personal"},
-    {"text": "🎉 Репортажная (банкеты, мероприятия)", "slug": "reportage"},
-    {"text": "💍 Свадебная", "slug": "wedding"},
-    {"text": "💋 Lingerie (будуарная)", "slug": "lingerie"},
-    {"text": "👶 Детская (школы/садики)", "slug": "children"},
-    {"text": "👩‍👶 Мама с ребёнком", "slug": "mom_child"},
-    {"text": "✝️ Крещение", "slug": "baptism"},
-    {"text": "⛪ Венчание", "slug": "wedding_church"},
-]
-
-
 async def get_portfolio_categories() -> list:
-    raw = await db_async.get_setting('portfolio_categories', None)
-    if raw:
-        try:
-            cats = json.loads(raw)
-            if isinstance(cats, list) and cats:
-                return cats
-        except Exception:
-            pass
-    await db_async.set_setting('portfolio_categories', json.dumps(DEFAULT_PORTFOLIO_CATEGORIES, ensure_ascii=False))
-    return DEFAULT_PORTFOLIO_CATEGORIES
+    """Копия списка категорий из каталога: вызывающий может менять её как угодно."""
+    return [dict(c) for c in await portfolio_catalog.categories()]
 
 
 async def _add_booking_status_user(user_id: int) -> None:
@@ -313,8 +292,7 @@ async def catch_yandex_link(message: Message) -> None:
             start_dt = datetime.fromisoformat(date_iso).replace(
                 tzinfo=BOOK_TZ, hour=int(hour), minute=0, second=0, microsecond=0
             )
-            cats = await get_portfolio_categories()
-            cat = next((c for c in cats if c.get('slug') == slug), {'text': slug})
+            cat = await portfolio_catalog.category(slug) or {'text': slug}
             human = start_dt.strftime('%d.%m.%Y %H:%M')
             addr_line = ''
             if pend.get('loc_addr'):
@@ -398,8 +376,7 @@ async def catch_yandex_link(message: Message) -> None:
         start_dt = datetime.fromisoformat(date_iso).replace(
             tzinfo=BOOK_TZ, hour=int(hour), minute=0, second=0, microsecond=0
         )
-        cats = await get_portfolio_categories()
-        cat = next((c for c in cats if c.get('slug') == slug), {'text': slug})
+        cat = await portfolio_catalog.category(slug) or {'text': slug}
         human = start_dt.strftime('%d.%m.%Y %H:%M')
         addr_line = ''
         if pend.get('loc_addr'):
@@ -465,7 +442,7 @@ async def booking_pick_hour(query: CallbackQuery) -> None:
     ):
         await query.answer('Слот занят')
         return
-    cats = await get_portfolio_categories()
+    cats = await portfolio_catalog.categories()
     rows = []
     row = []
     for c in cats:
@@ -503,8 +480,7 @@ async def booking_pick_category(query: CallbackQuery) -> None:
         f'pending_booking_{query.from_user.id}',
         json.dumps({'date': date_iso, 'hour': hour, 'slug': slug, 'await_loc': True}, ensure_ascii=False),
     )
-    cats = await get_portfolio_categories()
-    cat = next((c for c in cats if c.get('slug') == slug), {'text': slug})
+    cat = await portfolio_catalog.category(slug) or {'text': slug}
     human = start_dt.strftime('%d.%m.%Y %H:%M')
     text = (
         f'Вы выбрали {human}\nКатегория: {cat.get("text")}\n\n'
@@ -532,8 +508,7 @@ async def booking_skip_location(query: CallbackQuery) -> None:
     start_dt = datetime.fromisoformat(date_iso).replace(
         tzinfo=BOOK_TZ, hour=hour, minute=0, second=0, microsecond=0
     )
-    cats = await get_portfolio_categories()
-    cat = next((c for c in cats if c.get('slug') == slug), {'text': slug})
+    cat = await portfolio_catalog.category(slug) or {'text': slug}
     human = start_dt.strftime('%d.%m.%Y %H:%M')
     addr_line = ''
     if pend.get('loc_addr'):
@@ -574,8 +549,7 @@ async def booking_confirm(query: CallbackQuery) -> None:
         await query.message.answer(MENU_MESSAGES['select_date'], reply_markup=build_booking_date_kb())
         return
 
-    cats = await get_portfolio_categories()
-    cat = next((c for c in cats if c.get('slug') == slug), {'text': slug})
+    cat = await portfolio_catalog.category(slug) or {'text': slug}
     res_raw = await db_async.get_setting(f'resched_{query.from_user.id}', None)
     try:
         res_info = json.loads(res_raw) if res_raw else {}
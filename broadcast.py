@@ -0,0 +1,680 @@
+"""Движок рассылки: пул отправителей с общим ограничителем скорости.
+
+Все воркеры берут токен из одного TokenBucket (по умолчанию ~30 сообщений/с, лимит
+Telegram для бота). Когда Telegram отвечает TelegramRetryAfter, ведро ставится на
+паузу целиком, и ждут все воркеры, а не только получивший ошибку.
+
+Задание отправляет текст, медиа по file_id, локальный файл (загружается один раз, дальше
+рассылается его file_id) или копирует готовое сообщение админа через copy_message /
+copy_messages: так сохраняются форматирование и альбомы, а запрос не несёт содержимого.
+
+Рассылка из админки оформляется как задание в БД (broadcast_jobs/broadcast_deliveries)
+и выполняется фоновой задачей: получатели читаются из users постранично (keyset по
+user_id), поэтому память не растёт с аудиторией, а первое сообщение уходит сразу.
+Итог каждого получателя записывается, а после перезапуска незавершённые задания
+продолжаются с того же места.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import Counter, deque
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, Optional, Union
+
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNotFound,
+    TelegramRetryAfter,
+)
+from aiogram.types import FSInputFile, Message
+
+import db_async
+from config import bot
+from keyboards import build_broadcast_progress_keyboard
+
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', '8'))
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '30'))  # сообщений в секунду на весь бот
+BROADCAST_BURST = float(os.getenv('BROADCAST_BURST', '5'))
+BROADCAST_MAX_RETRIES = 2
+# сколько получателей задание читает из БД за раз
+BROADCAST_CHUNK_SIZE = int(os.getenv('BROADCAST_CHUNK_SIZE', '200'))
+# как часто обновлять сообщение о ходе рассылки (правки тоже расходуют лимиты Telegram)
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv('BROADCAST_PROGRESS_INTERVAL', '5'))
+# окно, по которому считается текущая скорость
+BROADCAST_RATE_WINDOW = 30.0
+# Bad Request, относящиеся к чату получателя, а не к самой рассылке: только они
+# (и блокировки) засчитываются пользователю, см. db.CHAT_FAILURES
+CHAT_BAD_REQUESTS = ('user is deactivated', 'peer_id_invalid')
+
+
+class TokenBucket:
+    """Ограничитель скорости с общей паузой после FloodWait."""
+
+    def __init__(self, rate: float = BROADCAST_RATE, capacity: float = BROADCAST_BURST) -> None:
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Остановить выдачу токенов на seconds (для всех ожидающих)."""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        # после паузы не выпускаем накопленную пачку разом
+        self._tokens = 0.0
+        self._updated = self._paused_until
+
+    async def acquire(self) -> None:
+        # lock выстраивает воркеры в очередь, токены выдаются по порядку
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class BroadcastResult:
+    def __init__(self, total: int) -> None:
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.failures: Counter = Counter()
+        # пропущены без отправки: недоступны по итогам прошлых рассылок
+        self.suppressed = 0
+        # не дошла очередь: рассылку остановили раньше
+        self.not_sent = 0
+
+    def summary_text(self, title: str = "✅ Рассылка завершена!") -> str:
+        summary_lines = [
+            title,
+            f"📨 Отправлено: {self.sent}",
+            f"❌ Не доставлено: {self.failed}",
+            f"📊 Всего пользователей: {self.total}",
+        ]
+        if self.not_sent:
+            summary_lines.append(f"⏹ Не отправлено (рассылка остановлена): {self.not_sent}")
+        if self.suppressed:
+            summary_lines.append(f"🚫 Пропущено (недоступны с прошлых рассылок): {self.suppressed}")
+        if self.failures:
+            breakdown = ', '.join(f"{reason}: {count}" for reason, count in self.failures.most_common())
+            summary_lines.append(f"ℹ️ Причины недоставки: {breakdown}")
+        return "\n".join(summary_lines)
+
+
+async def _broadcast_send_with_retry(
+    user_id: int,
+    dispatcher: Callable[[], Awaitable[None]],
+    max_retries: int = 2,
+    on_retry_after: Optional[Callable[[float], None]] = None,
+) -> tuple[bool, Optional[str]]:
+    """Отправить сообщение пользователю с учётом FloodWait/retry.
+
+    on_retry_after(delay) вызывается при FloodWait, чтобы притормозить остальных отправителей.
+    Возвращает (success: bool, reason: str | None).
+    """
+    attempt = 0
+    while True:
+        try:
+            await dispatcher()
+            return True, None
+        except TelegramRetryAfter as exc:
+            attempt += 1
+            delay = exc.retry_after + 0.5
+            if on_retry_after is not None:
+                on_retry_after(delay)
+            if attempt > max_retries:
+                logging.warning('FloodWait limit для %s: %s', user_id, exc)
+                return False, 'flood_wait'
+            logging.info('FloodWait %ss при рассылке пользователю %s, повтор #%s', delay, user_id, attempt)
+            await asyncio.sleep(delay)
+        except (TelegramForbiddenError, TelegramNotFound) as exc:
+            logging.info('Пользователь %s недоступен для рассылки: %s', user_id, exc)
+            return False, 'unreachable'
+        except TelegramBadRequest as exc:
+            if 'chat not found' in str(exc).lower():
+                # удалённый аккаунт или чат, в который бот не писал: то же, что блокировка
+                logging.info('Пользователь %s недоступен для рассылки: %s', user_id, exc)
+                return False, 'unreachable'
+            if any(text in str(exc).lower() for text in CHAT_BAD_REQUESTS):
+                logging.info('Чат пользователя %s недоступен для рассылки: %s', user_id, exc)
+                return False, 'chat_unavailable'
+            logging.warning('Неверный запрос при рассылке пользователю %s: %s', user_id, exc)
+            return False, 'bad_request'
+        except Exception as exc:
+            attempt += 1
+            logging.warning('Ошибка рассылки пользователю %s (попытка %s/%s): %s', user_id, attempt, max_retries + 1, exc)
+            if attempt > max_retries:
+                return False, exc.__class__.__name__.lower()
+            await asyncio.sleep(1.0)
+
+
+async def run_broadcast(
+    user_ids: Union[Iterable[int], AsyncIterable[int]],
+    send: Callable[[int], Awaitable[None]],
+    *,
+    workers: int = BROADCAST_WORKERS,
+    limiter: Optional[TokenBucket] = None,
+    max_retries: int = BROADCAST_MAX_RETRIES,
+    on_result: Optional[Callable[[int, bool, Optional[str]], None]] = None,
+    on_retry_after: Optional[Callable[[float], None]] = None,
+) -> BroadcastResult:
+    """Разослать send(user_id) всем получателям пулом из workers отправителей.
+
+    user_ids может быть асинхронным итератором: получатели читаются по мере отправки.
+    total в результате — число фактически взятых получателей.
+    on_result(user_id, success, reason) вызывается после каждого получателя,
+    on_retry_after(delay) — при каждом FloodWait (после паузы общего limiter).
+    """
+    limiter = limiter or TokenBucket()
+    if isinstance(user_ids, AsyncIterable):
+        source: AsyncIterator[int] = user_ids.__aiter__()
+    else:
+        user_ids = list(user_ids)
+        workers = min(workers, len(user_ids))
+        source = _aiter_list(user_ids)
+    result = BroadcastResult(0)
+    def _retry_after(delay: float) -> None:
+        limiter.pause(delay)
+        if on_retry_after is not None:
+            on_retry_after(delay)
+
+    # асинхронный генератор нельзя продвигать из нескольких задач одновременно
+    source_lock = asyncio.Lock()
+
+    async def _next() -> Optional[int]:
+        async with source_lock:
+            try:
+                user_id = await source.__anext__()
+            except StopAsyncIteration:
+                return None
+            result.total += 1
+            return user_id
+
+    async def _worker() -> None:
+        # один общий источник: каждый получатель достаётся ровно одному воркеру
+        while (user_id := await _next()) is not None:
+            async def _dispatch(user_id: int = user_id) -> None:
+                await limiter.acquire()
+                await send(user_id)
+
+            success, reason = await _broadcast_send_with_retry(
+                user_id, _dispatch, max_retries=max_retries, on_retry_after=_retry_after,
+            )
+            if success:
+                result.sent += 1
+            else:
+                result.failed += 1
+                result.failures[reason or 'unknown'] += 1
+            if on_result is not None:
+                on_result(user_id, success, reason)
+
+    await asyncio.gather(*(_worker() for _ in range(max(1, workers))))
+    return result
+
+
+async def _aiter_list(items: list[int]) -> AsyncIterator[int]:
+    for item in items:
+        yield item
+
+
+# ----- Фоновые задания рассылки -----
+# один лимит на весь бот, сколько бы заданий ни шло одновременно
+_limiter = TokenBucket()
+_jobs: dict[int, asyncio.Task] = {}
+_progress: dict[int, BroadcastProgress] = {}
+
+
+def _job_kind(job: dict) -> str:
+    if job['source_message_ids']:
+        return "альбом" if len(job['source_message_ids']) > 1 else "копия сообщения"
+    if job['image_file_id'] or job['media_path']:
+        return _MEDIA_NAMES.get(job['media_type'] or 'photo', "с вложением")
+    return "только текст"
+
+
+_MONTHS = ('январь', 'февраль', 'март', 'апрель', 'май', 'июнь',
+           'июль', 'август', 'сентябрь', 'октябрь', 'ноябрь', 'декабрь')
+
+
+def describe_segment(segment: Optional[dict]) -> str:
+    """Название аудитории для админа."""
+    kind = (segment or {}).get('type', 'all')
+    if kind == 'active':
+        return f"активные за {segment['days']} дн." if segment.get('days') else f"активные с {segment['since']}"
+    if kind == 'active_booking':
+        return "с активной записью"
+    if kind == 'liked_category':
+        return f"лайкали «{segment.get('title') or segment['category']}»"
+    if kind == 'subscriber':
+        return "подписчики канала"
+    if kind == 'birthday_month':
+        return f"именинники месяца ({_MONTHS[int(segment['month']) - 1]})"
+    return "все пользователи"
+
+
+_MEDIA_NAMES = {
+    'photo': "с изображением",
+    'video': "с видео",
+    'animation': "с анимацией",
+    'document': "с файлом",
+}
+
+
+def _uploaded_file_id(message: Message, media_type: str) -> str:
+    if media_type == 'photo':
+        return message.photo[-1].file_id
+    return getattr(message, media_type).file_id
+
+
+def _make_sender(job: dict) -> Callable[[int], Awaitable[None]]:
+    """Функция отправки одному получателю для данного задания."""
+    source_ids = job['source_message_ids']
+    if source_ids:
+        if len(source_ids) == 1:
+            async def _copy(user_id: int) -> None:
+                await bot.copy_message(user_id, job['source_chat_id'], source_ids[0])
+            return _copy
+
+        async def _copy_album(user_id: int) -> None:
+            await bot.copy_messages(user_id, job['source_chat_id'], source_ids)
+        return _copy_album
+
+    if not (job['image_file_id'] or job['media_path']):
+        async def _send_text(user_id: int) -> None:
+            await bot.send_message(user_id, job['text'])
+        return _send_text
+
+    media_type = job['media_type'] or 'photo'
+    send_media = getattr(bot, f'send_{media_type}')
+    upload_lock = asyncio.Lock()
+
+    async def _send_media(user_id: int) -> None:
+        if not job['image_file_id']:
+            async with upload_lock:
+                if not job['image_file_id']:
+                    # файл загружается один раз; остальные ждут и отправляют полученный file_id
+                    message = await send_media(user_id, FSInputFile(job['media_path']), caption=job['text'])
+                    job['image_file_id'] = _uploaded_file_id(message, media_type)
+                    try:
+                        await db_async.set_broadcast_media_file_id(job['id'], job['image_file_id'])
+                    except Exception:
+                        # сообщение уже доставлено: ошибка записи не должна вызвать повтор отправки,
+                        # а file_id до перезапуска хранится в job
+                        logging.exception('Рассылка #%s: не удалось сохранить file_id загрузки', job['id'])
+                    return
+        await send_media(user_id, job['image_file_id'], caption=job['text'])
+    return _send_media
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds < 60:
+        return f'{seconds} с'
+    if seconds < 3600:
+        return f'{seconds // 60} мин {seconds % 60} с'
+    return f'{seconds // 3600} ч {seconds % 3600 // 60} мин'
+
+
+class BroadcastProgress:
+    """Счётчики выполняющегося задания: для сообщения админу, логов и метрик."""
+
+    def __init__(self, job: dict) -> None:
+        self.job_id = job['id']
+        self.total = job['total']
+        self.sent = job['sent']
+        self.failed = job['failed']
+        self.kind = _job_kind(job)
+        self.audience = describe_segment(job['segment'])
+        self.started = time.monotonic()
+        # отметки времени последних результатов для текущей скорости
+        self._recent: deque[float] = deque()
+        self.pauses = 0
+        self.paused_seconds = 0.0
+        # 'paused' / 'cancelled': задание дорабатывает начатые отправки и останавливается
+        self.stop_request: Optional[str] = None
+
+    def record(self, success: bool) -> None:
+        if success:
+            self.sent += 1
+        else:
+            self.failed += 1
+        now = time.monotonic()
+        self._recent.append(now)
+        while self._recent and self._recent[0] < now - BROADCAST_RATE_WINDOW:
+            self._recent.popleft()
+
+    def on_retry_after(self, delay: float) -> None:
+        self.pauses += 1
+        self.paused_seconds += delay
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.total - self.sent - self.failed)
+
+    @property
+    def rate(self) -> float:
+        """Сообщений в секунду за последние BROADCAST_RATE_WINDOW секунд."""
+        now = time.monotonic()
+        while self._recent and self._recent[0] < now - BROADCAST_RATE_WINDOW:
+            self._recent.popleft()
+        window = min(BROADCAST_RATE_WINDOW, now - self.started)
+        return len(self._recent) / window if window > 0 else 0.0
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        rate = self.rate
+        return self.remaining / rate if rate > 0 else None
+
+    def as_dict(self) -> dict:
+        eta = self.eta_seconds
+        return {
+            'job_id': self.job_id,
+            'total': self.total,
+            'sent': self.sent,
+            'failed': self.failed,
+            'remaining': self.remaining,
+            'msgs_per_sec': round(self.rate, 2),
+            'rate_limit_pauses': self.pauses,
+            'rate_limit_paused_sec': round(self.paused_seconds, 1),
+            'eta_sec': round(eta) if eta is not None else None,
+            'elapsed_sec': round(time.monotonic() - self.started, 1),
+            'stop_request': self.stop_request,
+        }
+
+    def text(self, state: str = 'идёт') -> str:
+        lines = [
+            f"📤 Рассылка #{self.job_id} ({self.kind}): {state}",
+            f"🎯 Аудитория: {self.audience}",
+            f"📨 Отправлено: {self.sent}",
+            f"❌ Не доставлено: {self.failed}",
+            f"⏳ Осталось: {self.remaining} из {self.total}",
+        ]
+        if state == 'идёт':
+            lines.append(f"⚡ Скорость: {self.rate:.1f} сообщ./с")
+            eta = self.eta_seconds
+            if eta is not None:
+                lines.append(f"🕒 Примерно до конца: {_format_duration(eta)}")
+        if self.pauses:
+            lines.append(f"🐢 Пауз из-за лимита Telegram: {self.pauses} ({_format_duration(self.paused_seconds)})")
+        return "\n".join(lines)
+
+
+def broadcast_metrics() -> list[dict]:
+    """Метрики всех выполняющихся в этом процессе заданий (для логов и мониторинга)."""
+    return [progress.as_dict() for progress in _progress.values()]
+
+
+async def _show_progress(job: dict, text: str, paused: Optional[bool] = None) -> None:
+    """Обновить сообщение о ходе рассылки; paused=None убирает кнопки."""
+    if not job['chat_id']:
+        return
+    markup = build_broadcast_progress_keyboard(job['id'], paused) if paused is not None else None
+    try:
+        if job['progress_message_id']:
+            try:
+                await bot.edit_message_text(
+                    text, chat_id=job['chat_id'], message_id=job['progress_message_id'], reply_markup=markup,
+                )
+                return
+            except TelegramBadRequest as exc:
+                if 'not modified' in str(exc):
+                    return
+                # сообщение удалили: дальше показываем прогресс в новом
+                logging.info('Сообщение о рассылке #%s недоступно: %s', job['id'], exc)
+        message = await bot.send_message(job['chat_id'], text, reply_markup=markup)
+        job['progress_message_id'] = message.message_id
+        await db_async.set_broadcast_progress_message(job['id'], message.message_id)
+    except TelegramRetryAfter:
+        # следующее обновление всё равно придёт через BROADCAST_PROGRESS_INTERVAL
+        pass
+    except Exception:
+        logging.exception('Не удалось обновить прогресс рассылки #%s', job['id'])
+
+
+async def _progress_loop(job: dict, progress: BroadcastProgress) -> None:
+    shown = None
+    while True:
+        await asyncio.sleep(BROADCAST_PROGRESS_INTERVAL)
+        logging.info('Рассылка #%s: %s', job['id'], progress.as_dict())
+        text = progress.text()
+        if text != shown:
+            await _show_progress(job, text, paused=False)
+            shown = text
+
+
+async def _run_job(job_id: int) -> None:
+    job = await db_async.get_broadcast_job(job_id)
+    if not job or job['status'] != 'running':
+        return
+    # получатели, взятые до перезапуска, могли уже получить сообщение: не повторяем
+    interrupted = await db_async.close_interrupted_broadcast_deliveries(job_id)
+    if interrupted:
+        logging.warning('Рассылка #%s: %s получателей прервано перезапуском', job_id, interrupted)
+        job = await db_async.get_broadcast_job(job_id)
+
+    progress = BroadcastProgress(job)
+    _progress[job_id] = progress
+
+    _send = _make_sender(job)
+
+    outcomes: list[tuple[int, bool, Optional[str]]] = []
+    # взятые, но ещё не отданные воркерам получатели текущей страницы
+    claimed: list[int] = []
+
+    def _on_result(user_id: int, success: bool, reason: Optional[str]) -> None:
+        outcomes.append((user_id, success, reason))
+        progress.record(success)
+
+    async def _flush() -> None:
+        batch = outcomes[:]
+        outcomes.clear()
+        await db_async.record_broadcast_results(job_id, batch)
+
+    async def _pages() -> AsyncIterator[list[int]]:
+        # сначала те, кого вернули в очередь при прошлой остановке
+        pending = await db_async.get_pending_broadcast_recipients(job_id)
+        if pending:
+            yield pending
+        async for page in db_async.iter_user_id_pages(job['last_user_id'], BROADCAST_CHUNK_SIZE, job['segment']):
+            yield page
+
+    async def _recipients() -> AsyncIterator[int]:
+        # следующая страница читается, только когда воркеры разобрали предыдущую
+        async for page in _pages():
+            await _flush()
+            await db_async.claim_broadcast_recipients(job_id, page)
+            claimed[:] = reversed(page)
+            while claimed and not progress.stop_request:
+                yield claimed.pop()
+            if progress.stop_request:
+                return
+
+    async def _stop() -> None:
+        await _flush()
+        if claimed:
+            await db_async.release_broadcast_recipients(job_id, claimed[:])
+
+    await _show_progress(job, progress.text(), paused=False)
+    progress_task = asyncio.create_task(_progress_loop(job, progress))
+    status = 'done'
+    try:
+        try:
+            await run_broadcast(
+                _recipients(), _send, limiter=_limiter, on_result=_on_result,
+                on_retry_after=progress.on_retry_after,
+            )
+        finally:
+            progress_task.cancel()
+            # фиксируем итоги и возвращаем неотправленных даже при отмене задачи
+            await asyncio.shield(_stop())
+        status = progress.stop_request or 'done'
+        if status == 'paused':
+            await db_async.set_broadcast_job_status(job_id, 'paused')
+        else:
+            await db_async.finish_broadcast_job(job_id, status)
+    except asyncio.CancelledError:
+        # остановка бота: задание остаётся running и продолжится после старта
+        raise
+    except Exception:
+        logging.exception('Рассылка #%s прервана ошибкой', job_id)
+        status = 'failed'
+        await db_async.finish_broadcast_job(job_id, 'failed')
+    finally:
+        _progress.pop(job_id, None)
+
+    if status == 'paused':
+        logging.info('Рассылка #%s на паузе: %s', job_id, progress.as_dict())
+        await _show_progress(job, progress.text('на паузе'), paused=True)
+        return
+    await _report(job_id)
+
+
+async def _report(job_id: int) -> None:
+    """Показать итог завершённого или остановленного задания."""
+    job = await db_async.get_broadcast_job(job_id)
+    result = BroadcastResult(job['total'])
+    result.sent = job['sent']
+    result.failed = job['failed']
+    result.suppressed = job['suppressed']
+    if job['status'] != 'done':
+        # total исправляется только у завершённых заданий, остаток просто не отправлялся
+        result.not_sent = max(0, result.total - result.sent - result.failed)
+    result.failures.update(await db_async.get_broadcast_failure_reasons(job_id))
+    logging.info('Рассылка #%s (%s): %s/%s', job_id, job['status'], result.sent, result.total)
+    if not job['chat_id']:
+        return
+    title = {
+        'done': "✅ Рассылка завершена!",
+        'cancelled': "⏹ Рассылка остановлена.",
+        'failed': "⚠️ Рассылка прервана ошибкой.",
+    }.get(job['status'], "✅ Рассылка завершена!")
+    state = 'завершена' if job['status'] == 'done' else 'остановлена'
+    await _show_progress(job, BroadcastProgress(job).text(state))
+    try:
+        await bot.send_message(job['chat_id'], result.summary_text(title))
+    except Exception:
+        logging.exception('Не удалось отправить итог рассылки #%s', job_id)
+
+
+def _start_job(job_id: int) -> None:
+    if job_id in _jobs:
+        return
+    task = asyncio.create_task(_run_job(job_id), name=f'broadcast-{job_id}')
+    _jobs[job_id] = task
+    task.add_done_callback(lambda _task: _jobs.pop(job_id, None))
+
+
+async def start_broadcast_job(text: Optional[str], image_file_id: Optional[str], created_by: Optional[str],
+                              chat_id: Optional[int], segment: Optional[dict] = None, *,
+                              media_type: Optional[str] = None, media_path: Optional[str] = None,
+                              source_chat_id: Optional[int] = None,
+                              source_message_ids: Optional[list[int]] = None) -> dict:
+    """Создать задание и запустить его в фоне; возвращает запись задания.
+
+    Что отправлять: text с вложением image_file_id (или локальным файлом media_path) вида
+    media_type ('photo' по умолчанию, 'video', 'animation', 'document'), либо копии
+    сообщений source_message_ids из чата source_chat_id (тогда text не нужен).
+    Ход рассылки задание показывает в чате chat_id одним сообщением, которое обновляется
+    не чаще раза в BROADCAST_PROGRESS_INTERVAL секунд и несёт кнопки паузы и остановки.
+    segment ограничивает аудиторию (см. db._segment_query); отбор выполняется в SQL
+    при чтении страниц, поэтому стоимость рассылки зависит только от размера сегмента.
+    """
+    if media_path and not os.path.isfile(media_path):
+        raise FileNotFoundError(media_path)
+    job_id = await db_async.create_broadcast_job(
+        text, image_file_id, created_by, chat_id, segment,
+        media_type=media_type, media_path=media_path,
+        source_chat_id=source_chat_id, source_message_ids=source_message_ids,
+    )
+    job = await db_async.get_broadcast_job(job_id)
+    if job['total']:
+        _start_job(job_id)
+    else:
+        await db_async.finish_broadcast_job(job_id, 'done')
+    return job
+
+
+async def _stop_job(job_id: int, request: str) -> bool:
+    task = _jobs.get(job_id)
+    progress = _progress.get(job_id)
+    if task is None or progress is None:
+        return False
+    # воркеры доотправляют начатое, остальные взятые получатели возвращаются в очередь
+    progress.stop_request = request
+    await asyncio.shield(task)
+    return True
+
+
+async def pause_broadcast_job(job_id: int) -> bool:
+    """Приостановить выполняющееся задание; False, если оно не выполняется."""
+    return await _stop_job(job_id, 'paused')
+
+
+async def resume_broadcast_job(job_id: int) -> bool:
+    """Продолжить задание, поставленное на паузу."""
+    job = await db_async.get_broadcast_job(job_id)
+    if not job or job['status'] != 'paused':
+        return False
+    await db_async.set_broadcast_job_status(job_id, 'running')
+    _start_job(job_id)
+    return True
+
+
+async def cancel_broadcast_job(job_id: int) -> bool:
+    """Остановить задание насовсем (выполняющееся или на паузе) и прислать итог."""
+    if await _stop_job(job_id, 'cancelled'):
+        return True
+    job = await db_async.get_broadcast_job(job_id)
+    if not job or job['status'] not in ('running', 'paused'):
+        return False
+    await db_async.finish_broadcast_job(job_id, 'cancelled')
+    await _report(job_id)
+    return True
+
+
+async def resume_broadcast_jobs() -> int:
+    """Продолжить задания, прерванные остановкой бота."""
+    jobs = await db_async.get_running_broadcast_jobs()
+    for job in jobs:
+        logging.info('Продолжаю рассылку #%s (%s/%s)', job['id'], job['sent'] + job['failed'], job['total'])
+        _start_job(job['id'])
+    return len(jobs)
+
+
+async def stop_broadcast_jobs() -> None:
+    """Остановить фоновые задания (они продолжатся при следующем запуске)."""
+    tasks = list(_jobs.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+__all__ = [
+    "BROADCAST_MAX_RETRIES",
+    "BROADCAST_RATE",
+    "BROADCAST_WORKERS",
+    "BroadcastProgress",
+    "BroadcastResult",
+    "TokenBucket",
+    "broadcast_metrics",
+    "describe_segment",
+    "cancel_broadcast_job",
+    "pause_broadcast_job",
+    "resume_broadcast_job",
+    "resume_broadcast_jobs",
+    "run_broadcast",
+    "start_broadcast_job",
+    "stop_broadcast_jobs",
+]
@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from aiogram import F, Router
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
+
+from admin_utils import is_admin_view_enabled
+import db_async
+from broadcast import (
+    cancel_broadcast_job,
+    describe_segment,
+    pause_broadcast_job,
+    resume_broadcast_job,
+    start_broadcast_job,
+)
+from keyboards import (
+    build_broadcast_category_keyboard,
+    build_broadcast_confirm_keyboard,
+    build_broadcast_image_keyboard,
+    build_broadcast_segment_keyboard,
+)
+from portfolio_catalog import portfolio_catalog
+
+broadcast_router = Router(name="broadcast")
+
+# Части альбома приходят отдельными апдейтами почти одновременно
+ALBUM_COLLECT_DELAY = 1.0
+_albums: dict[str, list[int]] = {}
+
+
+class BroadcastStates(StatesGroup):
+    awaiting_text = State()
+    awaiting_image = State()
+    confirming = State()
+
+
+def _admin_key_from_username(username: str | None) -> str:
+    return (username or '').lstrip('@').lower()
+
+
+def _cancel_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="❌ Отмена", callback_data="broadcast_cancel")]
+    ])
+
+
+async def perform_broadcast(
+    text: Optional[str],
+    image_file_id: Optional[str] = None,
+    message: Optional[Message] = None,
+    created_by: Optional[str] = None,
+    source_chat_id: Optional[int] = None,
+    source_message_ids: Optional[list[int]] = None,
+    segment: Optional[dict] = None,
+) -> int:
+    """Поставить рассылку в фоновое задание и сразу вернуть его id.
+
+    Получатели — сегмент segment (None — все пользователи).
+    С source_message_ids рассылаются копии этих сообщений (copy_message), а не text.
+    Ход рассылки (с кнопками паузы и остановки) и итог задание показывает в чате message.
+    """
+    job = await start_broadcast_job(
+        text, image_file_id, created_by, message.chat.id if message else None, segment,
+        source_chat_id=source_chat_id, source_message_ids=source_message_ids,
+    )
+    logging.info('Broadcast job #%s created by %s for %s users', job['id'], created_by, job['total'])
+    if message and not job['total']:
+        await message.answer(f"ℹ️ Нет получателей для рассылки ({describe_segment(segment)}).")
+    return job['id']
+
+
+async def _confirmation(data: dict) -> tuple[str, InlineKeyboardMarkup]:
+    segment = data.get('segment')
+    audience = describe_segment(segment)
+    recipients = await db_async.count_users(segment)
+    if data.get('source_message_ids'):
+        lines = [
+            "👆 Так будет выглядеть сообщение (копия с форматированием и вложениями).",
+            "Не удаляйте исходное сообщение до конца рассылки.",
+        ]
+    else:
+        lines = [
+            "👆 Так будет выглядеть сообщение.",
+            f"🖼 Изображение: {'Прикреплено' if data.get('image_file_id') else 'Без изображения'}",
+        ]
+    lines += ["", f"🎯 Аудитория: {audience} — получателей: {recipients}", "", "Отправить?"]
+    return "\n".join(lines), build_broadcast_confirm_keyboard(audience)
+
+
+async def _ask_confirmation(message: Message, state: FSMContext) -> None:
+    data = await state.get_data()
+    await state.set_state(BroadcastStates.confirming)
+    source_ids = data.get('source_message_ids')
+    if source_ids:
+        # пользователи получат копию ровно этих сообщений
+        if len(source_ids) > 1:
+            await message.bot.copy_messages(message.chat.id, data['source_chat_id'], source_ids)
+        else:
+            await message.bot.copy_message(message.chat.id, data['source_chat_id'], source_ids[0])
+    elif data.get('image_file_id'):
+        await message.answer_photo(data['image_file_id'], caption=data['text'])
+    else:
+        await message.answer(data['text'])
+    text, markup = await _confirmation(data)
+    await message.answer(text, reply_markup=markup)
+
+
+def _segment_from_key(key: str, categories: list) -> Optional[dict]:
+    if key.startswith('active_'):
+        days = int(key.removeprefix('active_'))
+        since = datetime.now(timezone.utc) - timedelta(days=days)
+        # тот же формат, что у last_seen
+        return {'type': 'active', 'days': days, 'since': since.strftime('%Y-%m-%d %H:%M:%S')}
+    if key == 'booking':
+        return {'type': 'active_booking'}
+    if key == 'subscriber':
+        return {'type': 'subscriber'}
+    if key == 'birthday':
+        return {'type': 'birthday_month', 'month': datetime.now().month}
+    if key.startswith('liked:'):
+        slug = key.removeprefix('liked:')
+        title = next((c.get('text') for c in categories if isinstance(c, dict) and c.get('slug') == slug), slug)
+        return {'type': 'liked_category', 'category': slug, 'title': title}
+    return None
+
+
+async def _collect_album(message: Message, state: FSMContext) -> None:
+    parts = _albums.setdefault(message.media_group_id, [])
+    parts.append(message.message_id)
+    if len(parts) > 1:
+        return
+    # первая часть ждёт остальные и одна продолжает диалог
+    await asyncio.sleep(ALBUM_COLLECT_DELAY)
+    parts = sorted(_albums.pop(message.media_group_id))
+    await state.update_data(source_chat_id=message.chat.id, source_message_ids=parts)
+    await _ask_confirmation(message, state)
+
+
+@broadcast_router.callback_query(F.data == 'admin_broadcast')
+async def cb_broadcast_start(query: CallbackQuery, state: FSMContext) -> None:
+    if not await is_admin_view_enabled(_admin_key_from_username(query.from_user.username), query.from_user.id):
+        await query.answer('🚫 Нет доступа.')
+        return
+    await query.answer()
+    await state.set_state(BroadcastStates.awaiting_text)
+    await state.update_data(text=None, image_file_id=None, source_chat_id=None, source_message_ids=None, segment=None)
+    await query.message.answer(
+        '📝 Отправьте текст сообщения для рассылки.\n\n'
+        'Можно прислать и готовое сообщение — с форматированием, фото, видео или альбомом: '
+        'пользователи получат его копию как есть.',
+        reply_markup=_cancel_keyboard(),
+    )
+
+
+@broadcast_router.message(BroadcastStates.awaiting_text)
+async def msg_broadcast_text(message: Message, state: FSMContext) -> None:
+    if message.media_group_id:
+        await _collect_album(message, state)
+        return
+    if not message.text or message.entities:
+        # форматированный текст или вложение: рассылаем копию сообщения
+        await state.update_data(source_chat_id=message.chat.id, source_message_ids=[message.message_id])
+        await _ask_confirmation(message, state)
+        return
+    text = message.text.strip()
+    if not text:
+        await message.answer('Ожидаю текст сообщения для рассылки.', reply_markup=_cancel_keyboard())
+        return
+    await state.update_data(text=text)
+    await state.set_state(BroadcastStates.awaiting_image)
+    await message.answer('🖼 Пришлите изображение или выберите «Без фото»:', reply_markup=build_broadcast_image_keyboard())
+
+
+@broadcast_router.message(BroadcastStates.awaiting_image)
+async def msg_broadcast_image(message: Message, state: FSMContext) -> None:
+    if not message.photo:
+        await message.answer('Пришлите фотографию или нажмите «Без фото».', reply_markup=build_broadcast_image_keyboard())
+        return
+    await state.update_data(image_file_id=message.photo[-1].file_id)
+    await _ask_confirmation(message, state)
+
+
+@broadcast_router.callback_query(F.data == 'broadcast_no_image', BroadcastStates.awaiting_image)
+async def cb_broadcast_no_image(query: CallbackQuery, state: FSMContext) -> None:
+    await query.answer()
+    await state.update_data(image_file_id=None)
+    await _ask_confirmation(query.message, state)
+
+
+@broadcast_router.callback_query(F.data == 'broadcast_confirm', BroadcastStates.confirming)
+async def cb_broadcast_confirm(query: CallbackQuery, state: FSMContext) -> None:
+    username = _admin_key_from_username(query.from_user.username)
+    if not await is_admin_view_enabled(username, query.from_user.id):
+        await query.answer('🚫 Нет доступа.')
+        return
+    data = await state.get_data()
+    await state.clear()
+    await query.answer()
+    # задание уходит в фон, обработчик апдейта освобождается сразу
+    await perform_broadcast(
+        data.get('text'), data.get('image_file_id'), query.message, created_by=username,
+        source_chat_id=data.get('source_chat_id'), source_message_ids=data.get('source_message_ids'),
+        segment=data.get('segment'),
+    )
+
+
+@broadcast_router.callback_query(F.data == 'broadcast_segment', BroadcastStates.confirming)
+async def cb_broadcast_segment_menu(query: CallbackQuery) -> None:
+    await query.answer()
+    await query.message.edit_text('🎯 Кому отправить рассылку?', reply_markup=build_broadcast_segment_keyboard())
+
+
+@broadcast_router.callback_query(F.data.startswith('broadcast_segment:'), BroadcastStates.confirming)
+async def cb_broadcast_segment(query: CallbackQuery, state: FSMContext) -> None:
+    key = query.data.removeprefix('broadcast_segment:')
+    if key == 'liked':
+        await query.answer()
+        categories = await portfolio_catalog.categories()
+        await query.message.edit_text(
+            '❤️ Пользователи, лайкнувшие фото категории:',
+            reply_markup=build_broadcast_category_keyboard(categories),
+        )
+        return
+    if key != 'back':
+        categories = await portfolio_catalog.categories() if key.startswith('liked:') else []
+        await state.update_data(segment=_segment_from_key(key, categories))
+    await query.answer()
+    text, markup = await _confirmation(await state.get_data())
+    await query.message.edit_text(text, reply_markup=markup)
+
+
+@broadcast_router.callback_query(F.data.regexp(r'^broadcast_job_(pause|resume|cancel):\d+$'))
+async def cb_broadcast_job_control(query: CallbackQuery) -> None:
+    if not await is_admin_view_enabled(_admin_key_from_username(query.from_user.username), query.from_user.id):
+        await query.answer('🚫 Нет доступа.')
+        return
+    action, job_id = query.data.removeprefix('broadcast_job_').split(':')
+    # ответ сразу: пауза ждёт, пока воркеры доотправят начатое
+    if action == 'pause':
+        await query.answer('⏸ Ставлю рассылку на паузу…')
+        done = await pause_broadcast_job(int(job_id))
+    elif action == 'resume':
+        await query.answer('▶️ Продолжаю рассылку')
+        done = await resume_broadcast_job(int(job_id))
+    else:
+        await query.answer('⏹ Останавливаю рассылку…')
+        done = await cancel_broadcast_job(int(job_id))
+    if not done:
+        await query.message.answer(f'ℹ️ Рассылка #{job_id} уже завершена или не выполняется.')
+
+
+@broadcast_router.callback_query(F.data.in_({'broadcast_cancel', 'broadcast_confirm', 'broadcast_no_image'}))
+async def cb_broadcast_cancel(query: CallbackQuery, state: FSMContext) -> None:
+    # сюда же попадают кнопки устаревшего диалога (состояние уже сброшено)
+    await query.answer()
+    if await state.get_state() in BroadcastStates.__all_states__:
+        await state.clear()
+    await query.message.answer('❌ Рассылка отменена.')
+
+
+__all__ = [
+    "BroadcastStates",
+    "broadcast_router",
+    "perform_broadcast",
+]
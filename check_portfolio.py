@@ -1,12 +1,11 @@
 #!/usr/bin/env python3
-from db import get_setting
-import json
+from db import get_portfolio_photos
 
 categories = ['family', 'love_story', 'wedding', 'personal', 'children', 'lingerie']
 
 print("Portfolio status:")
 for cat in categories:
-    photos = json.loads(get_setting(f'portfolio_{cat}', '[]'))
+    photos = get_portfolio_photos(cat)
     print(f'{cat}: {len(photos)} photos')
     if photos:
         print(f'  First photo ID: {photos[0][:20]}...')
\ No newline at end of file
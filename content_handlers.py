@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import json
 import logging
 from typing import Any
 
@@ -12,14 +11,16 @@ from admin_state import ADMIN_PENDING_ACTIONS
 from admin_utils import is_admin_view_enabled
 from bot_constants import MENU_MESSAGES
 from config import bot
-from db import get_setting, save_pending_actions, set_setting
+import db_async
 from keyboards import (
     build_reviews_admin_keyboard,
     build_reviews_delete_keyboard,
     build_reviews_nav_keyboard,
     build_social_admin_keyboard,
 )
-from portfolio_state import LAST_CATEGORY_PHOTO, reset_last_category_position
+from media_validator import media_validator
+from portfolio_catalog import REVIEWS_SLUG, portfolio_catalog
+from portfolio_state import reset_last_category_position, viewer_positions
 
 content_router = Router(name="content")
 REVIEW_PENDING_USERS: set[int] = set()
@@ -31,47 +32,29 @@ def _admin_key_from_username(username: str | None) -> str:
     return (username or '').lstrip('@').lower()
 
 
-def _load_reviews() -> list[str]:
-    raw = get_setting('reviews_photos', '[]')
-    try:
-        data = json.loads(raw)
-        if isinstance(data, list):
-            return data
-    except Exception:
-        pass
-    return []
+async def _load_reviews() -> list[str]:
+    """file_id отзывов по порядку. Общий список каталога: не изменять."""
+    return await portfolio_catalog.photos(REVIEWS_SLUG)
 
 
 async def _show_reviews(message: Message, username: str, user_id: int) -> None:
-    photos = _load_reviews()
-    chat_key = (message.chat.id, 'reviews')
-    displayed = False
+    photos = await _load_reviews()
     if photos:
-        removed_invalid = False
-        while photos:
-            idx = len(photos) - 1
-            fid = photos[idx]
-            caption = f'⭐ Отзыв {idx + 1} из {len(photos)}'
-            try:
-                await bot.send_photo(
-                    chat_id=message.chat.id,
-                    photo=fid,
-                    caption=caption,
-                    reply_markup=build_reviews_nav_keyboard(idx),
-                )
-                LAST_CATEGORY_PHOTO[chat_key] = idx
-                displayed = True
-                break
-            except Exception as exc:
-                logging.warning('Failed to send review photo idx=%s fid=%s: %s', idx, fid, exc)
-                photos.pop(idx)
-                removed_invalid = True
-                set_setting('reviews_photos', json.dumps(photos, ensure_ascii=False))
-                reset_last_category_position('reviews')
-        if removed_invalid and not photos:
-            await message.answer('⭐ Отзывы пока не добавлены.')
-        elif not displayed:
-            await message.answer('⭐ Отзывы пока не добавлены.')
+        idx = len(photos) - 1
+        fid = photos[idx]
+        try:
+            await bot.send_photo(
+                chat_id=message.chat.id,
+                photo=fid,
+                caption=f'⭐ Отзыв {idx + 1} из {len(photos)}',
+                reply_markup=build_reviews_nav_keyboard(idx),
+            )
+            viewer_positions.set((message.chat.id, 'reviews'), idx)
+        except Exception as exc:
+            # нерабочий file_id проверит и снимет с показа фоновая проверка, не этот обработчик
+            logging.warning('Failed to send review photo idx=%s fid=%s: %s', idx, fid, exc)
+            media_validator.suspect(fid)
+            await message.answer('⭐ Не удалось показать отзыв, попробуйте позже.')
     else:
         await message.answer('⭐ Отзывы пока не добавлены.')
 
@@ -79,8 +62,8 @@ async def _show_reviews(message: Message, username: str, user_id: int) -> None:
         await message.answer('Управление отзывами:', reply_markup=build_reviews_admin_keyboard())
 
 
-def _get_social_text() -> str:
-    return get_setting('social_media_text', _DEFAULT_SOCIAL_TEXT) or _DEFAULT_SOCIAL_TEXT
+async def _get_social_text() -> str:
+    return await db_async.get_setting('social_media_text', _DEFAULT_SOCIAL_TEXT) or _DEFAULT_SOCIAL_TEXT
 
 
 @content_router.message(Command(commands=['reviews']))
@@ -92,7 +75,7 @@ async def cmd_reviews(message: Message) -> None:
 @content_router.message(Command(commands=['social']))
 async def cmd_social(message: Message) -> None:
     username = _admin_key_from_username(message.from_user.username)
-    await message.answer(_get_social_text())
+    await message.answer(await _get_social_text())
     if await is_admin_view_enabled(username, message.from_user.id):
         await message.answer('Управление соцсетями:', reply_markup=build_social_admin_keyboard())
 
@@ -105,13 +88,13 @@ async def cb_reviews(query: CallbackQuery) -> None:
 
 @content_router.callback_query(F.data.startswith('reviews_pic:'))
 async def cb_reviews_nav(query: CallbackQuery) -> None:
-    photos = _load_reviews()
+    photos = await _load_reviews()
     if not photos:
         await query.message.answer('⭐ Отзывы пока не добавлены.')
         return
 
     chat_key = (query.message.chat.id, 'reviews')
-    last_idx = LAST_CATEGORY_PHOTO.get(chat_key)
+    last_idx = viewer_positions.get(chat_key)
     if last_idx is None:
         idx = len(photos) - 1
     else:
@@ -125,13 +108,14 @@ async def cb_reviews_nav(query: CallbackQuery) -> None:
         await query.message.edit_media(InputMediaPhoto(media=fid, caption=caption))
         await query.message.edit_reply_markup(reply_markup=build_reviews_nav_keyboard(idx))
     except Exception:
+        media_validator.suspect(fid)
         await bot.send_photo(
             chat_id=query.message.chat.id,
             photo=fid,
             caption=caption,
             reply_markup=build_reviews_nav_keyboard(idx),
         )
-    LAST_CATEGORY_PHOTO[chat_key] = idx
+    viewer_positions.set(chat_key, idx)
 
 
 @content_router.callback_query(F.data == 'reviews_add')
@@ -142,7 +126,7 @@ async def cb_reviews_add(query: CallbackQuery) -> None:
     admin_key = _admin_key_from_username(query.from_user.username)
     ADMIN_PENDING_ACTIONS.pop(admin_key, None)
     ADMIN_PENDING_ACTIONS[admin_key] = {'action': 'add_review', 'payload': {}}
-    save_pending_actions(ADMIN_PENDING_ACTIONS)
+    await db_async.save_pending_actions(ADMIN_PENDING_ACTIONS)
     logging.info('Set pending action add_review for %s', admin_key)
     REVIEW_PENDING_USERS.add(query.from_user.id)
     await query.message.answer('📝 Отправьте фотографию отзыва:')
@@ -153,7 +137,7 @@ async def cb_reviews_delete(query: CallbackQuery) -> None:
     if not await is_admin_view_enabled(_admin_key_from_username(query.from_user.username), query.from_user.id):
         await query.message.answer('🚫 Нет доступа.')
         return
-    photos = _load_reviews()
+    photos = await _load_reviews()
     if not photos:
         await query.message.answer('Нет отзывов для удаления.')
         return
@@ -177,20 +161,21 @@ async def cb_reviews_delete_idx(query: CallbackQuery) -> None:
     except ValueError:
         await query.message.answer('Неверный индекс отзыва.')
         return
-    photos = _load_reviews()
+    photos = await _load_reviews()
     if not (0 <= idx < len(photos)):
         await query.message.answer('Неверный индекс отзыва.')
         return
-    photos.pop(idx)
-    set_setting('reviews_photos', json.dumps(photos, ensure_ascii=False))
+    if await portfolio_catalog.delete_photo(REVIEWS_SLUG, idx) is None:
+        await query.message.answer('Неверный индекс отзыва.')
+        return
     reset_last_category_position('reviews')
-    await query.message.answer(f'✅ Отзыв #{idx + 1} удалён. Осталось: {len(photos)}')
+    await query.message.answer(f'✅ Отзыв #{idx + 1} удалён. Осталось: {await portfolio_catalog.count(REVIEWS_SLUG)}')
 
 
 @content_router.callback_query(F.data == 'social')
 async def cb_social(query: CallbackQuery) -> None:
     username = _admin_key_from_username(query.from_user.username)
-    await query.message.answer(_get_social_text())
+    await query.message.answer(await _get_social_text())
     if await is_admin_view_enabled(username, query.from_user.id):
         await query.message.answer('Управление соцсетями:', reply_markup=build_social_admin_keyboard())
 
@@ -202,7 +187,7 @@ async def cb_social_edit(query: CallbackQuery) -> None:
         return
     admin_key = _admin_key_from_username(query.from_user.username)
     ADMIN_PENDING_ACTIONS[admin_key] = {'action': 'edit_social_text', 'payload': {}}
-    save_pending_actions(ADMIN_PENDING_ACTIONS)
+    await db_async.save_pending_actions(ADMIN_PENDING_ACTIONS)
     await query.message.answer('📝 Отправьте новый текст для соцсетей:')
 
 
@@ -221,36 +206,36 @@ async def handle_content_pending_action(
         if not new_text:
             await message.answer('Текст не может быть пустым.')
             ADMIN_PENDING_ACTIONS.pop(username, None)
-            save_pending_actions(ADMIN_PENDING_ACTIONS)
+            await db_async.save_pending_actions(ADMIN_PENDING_ACTIONS)
             return True
-        set_setting('social_media_text', new_text)
+        await db_async.set_setting('social_media_text', new_text)
         ADMIN_PENDING_ACTIONS.pop(username, None)
-        save_pending_actions(ADMIN_PENDING_ACTIONS)
+        await db_async.save_pending_actions(ADMIN_PENDING_ACTIONS)
         await message.answer('✅ Текст соцсетей обновлён.')
         return True
 
     if action == 'add_review':
         logging.info('Content pending: add_review by %s, has photo=%s', username, bool(message.photo))
         if message.photo:
-            photos = _load_reviews()
-            file_id = message.photo[-1].file_id
-            if file_id not in photos:
-                photos.append(file_id)
-                set_setting('reviews_photos', json.dumps(photos, ensure_ascii=False))
+            photo = message.photo[-1]
+            file_id = photo.file_id
+            # повтор того же изображения узнаётся по file_unique_id, даже с другим file_id
+            if await portfolio_catalog.add_photo(REVIEWS_SLUG, file_id, photo.file_unique_id):
+                total = await portfolio_catalog.count(REVIEWS_SLUG)
                 reset_last_category_position('reviews')
-                logging.info('Review photo stored user=%s total=%s', message.from_user.id, len(photos))
+                logging.info('Review photo stored user=%s total=%s', message.from_user.id, total)
                 try:
                     await message.answer_photo(
                         file_id,
-                        caption=f'⭐ Новый отзыв #{len(photos)} добавлен. Спасибо!',
+                        caption=f'⭐ Новый отзыв #{total} добавлен. Спасибо!',
                     )
                 except Exception:
                     pass
-                await message.answer(f'✅ Отзыв добавлен! Всего отзывов: {len(photos)}')
+                await message.answer(f'✅ Отзыв добавлен! Всего отзывов: {total}')
             else:
                 await message.answer('Этот отзыв уже добавлен.')
             ADMIN_PENDING_ACTIONS.pop(username, None)
-            save_pending_actions(ADMIN_PENDING_ACTIONS)
+            await db_async.save_pending_actions(ADMIN_PENDING_ACTIONS)
             REVIEW_PENDING_USERS.discard(message.from_user.id)
             return True
         await message.answer('Пожалуйста, отправьте фотографию отзыва.')
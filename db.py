@@ -1,30 +1,243 @@
 import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
 import json
 import os
-from typing import Optional, Dict
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
 
 # Allow overriding DB location via environment variable (e.g. for Docker volume)
 _default_db = Path(__file__).parent / 'data.db'
 DB_PATH = Path(os.getenv('DB_PATH', _default_db))
 
+# One persistent connection per thread (event loop thread, db_async workers, schedulers).
+# PRAGMAs are applied once when the connection is opened; connections of exited threads are
+# closed when the next one is opened, and close_connections() closes the rest on shutdown.
+_local = threading.local()
+_connections: dict[sqlite3.Connection, threading.Thread] = {}
+_connections_lock = threading.Lock()
+_generation = 0
 
-def _connect():
-    con = sqlite3.connect(DB_PATH, timeout=15)
+
+def _open_connection() -> sqlite3.Connection:
+    # check_same_thread=False only so that close_connections() can close it from the
+    # shutdown thread; every connection is otherwise used by the thread that opened it.
+    con = sqlite3.connect(DB_PATH, timeout=15, check_same_thread=False)
     try:
         con.execute('PRAGMA journal_mode=WAL')
         con.execute('PRAGMA synchronous=NORMAL')
         con.execute('PRAGMA busy_timeout=15000')
     except Exception:
         pass
+    if getattr(_local, 'read_only', False):
+        con.execute('PRAGMA query_only=ON')
     return con
 
 
-def init_db() -> None:
+def mark_thread_read_only() -> None:
+    """Open this thread's connection with PRAGMA query_only (db_async reader threads)."""
+    _local.read_only = True
+
+
+def _connect() -> sqlite3.Connection:
+    """Return the calling thread's connection, opening it on first use."""
+    con = getattr(_local, 'con', None)
+    if con is not None and _local.key == (DB_PATH, _generation):
+        return con
+    if con is not None:
+        # closed by close_connections() or DB_PATH changed at runtime (scripts, benchmarks)
+        _close_connection(con)
+    _close_dead_connections()
+    con = _open_connection()
+    _local.con = con
+    _local.key = (DB_PATH, _generation)
+    with _connections_lock:
+        _connections[con] = threading.current_thread()
+    return con
+
+
+def _close_connection(con: sqlite3.Connection) -> None:
+    with _connections_lock:
+        _connections.pop(con, None)
+    try:
+        con.close()
+    except Exception:
+        pass
+
+
+def _close_dead_connections() -> None:
+    """Close connections left behind by threads that have exited (thread pools, scripts)."""
+    with _connections_lock:
+        dead = [con for con, thread in _connections.items() if not thread.is_alive()]
+        for con in dead:
+            del _connections[con]
+    for con in dead:
+        try:
+            con.close()
+        except Exception:
+            pass
+
+
+@contextmanager
+def _transaction() -> Iterator[sqlite3.Connection]:
+    """Run writes on the thread connection: commit on success, rollback on error.
+
+    Inside write_batch() the block becomes a savepoint of the batch transaction, so a
+    failing write is rolled back alone and the batch is committed once.
+    """
     con = _connect()
-    cur = con.cursor()
+    if getattr(_local, 'batch', None) is None:
+        with con:
+            yield con
+        return
+    con.execute('SAVEPOINT write')
+    try:
+        yield con
+    except BaseException:
+        con.execute('ROLLBACK TO write')
+        con.execute('RELEASE write')
+        raise
+    con.execute('RELEASE write')
+
+
+@contextmanager
+def write_batch() -> Iterator[None]:
+    """Group all writes of this thread inside the block into one transaction (group commit)."""
+    con = _connect()
+    _local.batch = []
+    try:
+        con.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+            con.commit()
+        except BaseException:
+            con.rollback()
+            raise
+        # cache updates are published only once the data is committed
+        for callback in _local.batch:
+            callback()
+    finally:
+        _local.batch = None
+
+
+def _after_commit(callback) -> None:
+    batch = getattr(_local, 'batch', None)
+    if batch is None:
+        callback()
+    else:
+        batch.append(callback)
+
+
+def close_connections() -> None:
+    """Close all pooled connections (shutdown hook). Threads reconnect lazily if used again."""
+    global _generation
+    with _connections_lock:
+        cons = list(_connections)
+        _connections.clear()
+        _generation += 1
+    for con in cons:
+        try:
+            con.close()
+        except Exception:
+            pass
+
+
+def _migrate_portfolio_settings(cur: sqlite3.Cursor) -> int:
+    """Move legacy settings blobs portfolio_<slug> = JSON list into portfolio_photos."""
+    cur.execute("SELECT key, value FROM settings WHERE key >= 'portfolio_' AND key < 'portfolio`' AND key != 'portfolio_categories'")
+    blobs = cur.fetchall()
+    for key, raw in blobs:
+        slug = key[len('portfolio_'):]
+        try:
+            photos = json.loads(raw) if raw else []
+        except Exception:
+            photos = []
+        if not isinstance(photos, list):
+            photos = []
+        cur.execute('SELECT COALESCE(MAX(position) + 1, 0) FROM portfolio_photos WHERE category_slug=?', (slug,))
+        position = cur.fetchone()[0]
+        for file_id in photos:
+            if not isinstance(file_id, str) or not file_id:
+                continue
+            cur.execute('INSERT OR IGNORE INTO portfolio_photos(category_slug, position, file_id) VALUES(?,?,?)',
+                        (slug, position, file_id))
+            position += cur.rowcount
+        cur.execute('DELETE FROM settings WHERE key=?', (key,))
+    return len(blobs)
+
+
+def _migrate_reviews_setting(cur: sqlite3.Cursor) -> int:
+    """Move the legacy reviews_photos settings list into portfolio_photos under REVIEWS_SLUG."""
+    cur.execute("SELECT value FROM settings WHERE key='reviews_photos'")
+    row = cur.fetchone()
+    if row is None:
+        return 0
+    try:
+        photos = json.loads(row[0]) if row[0] else []
+    except Exception:
+        photos = []
+    if not isinstance(photos, list):
+        photos = []
+    cur.execute('SELECT COALESCE(MAX(position) + 1, 0) FROM portfolio_photos WHERE category_slug=?', (REVIEWS_SLUG,))
+    position = cur.fetchone()[0]
+    for file_id in photos:
+        if not isinstance(file_id, str) or not file_id:
+            continue
+        cur.execute('INSERT OR IGNORE INTO portfolio_photos(category_slug, position, file_id) VALUES(?,?,?)',
+                    (REVIEWS_SLUG, position, file_id))
+        position += cur.rowcount
+    cur.execute("DELETE FROM settings WHERE key='reviews_photos'")
+    return len(photos)
+
+
+def _compact_portfolio_positions(cur: sqlite3.Cursor, slugs: Optional[Iterable[str]] = None) -> None:
+    """Renumber positions 0..n-1 in the categories (all by default), keeping the order (after rows were deleted).
+
+    Likes are keyed by (category_slug, photo_index), so photo_likes and photo_like_counts
+    move along with their photos. Callers drop the likes of the deleted rows first.
+    """
+    if slugs is None:
+        cur.execute('SELECT DISTINCT category_slug FROM portfolio_photos')
+        slugs = [r[0] for r in cur.fetchall()]
+    for slug in slugs:
+        cur.execute('SELECT id, position FROM portfolio_photos WHERE category_slug=? ORDER BY position', (slug,))
+        rows = cur.fetchall()
+        moves = [(new, old) for new, (_, old) in enumerate(rows) if new != old]
+        if not moves:
+            continue
+        # move the rows out of the way first so the unique (category_slug, position) index never collides
+        cur.execute('UPDATE portfolio_photos SET position = -position - 1 WHERE category_slug=?', (slug,))
+        cur.executemany('UPDATE portfolio_photos SET position=? WHERE id=?', [(new, row[0]) for new, row in enumerate(rows)])
+        # likes left in the gaps belong to no photo and would collide with the moved ones
+        kept = {old for _, old in rows}
+        gaps = [(slug, p) for p in range(rows[-1][1]) if p not in kept]
+        cur.executemany('DELETE FROM photo_likes WHERE category_slug=? AND photo_index=?', gaps)
+        cur.executemany('DELETE FROM photo_like_counts WHERE category_slug=? AND photo_index=?', gaps)
+        for table in ('photo_likes', 'photo_like_counts'):
+            cur.executemany(f'UPDATE {table} SET photo_index = -? - 1 WHERE category_slug=? AND photo_index=?',
+                            [(new, slug, old) for new, old in moves])
+            cur.execute(f'UPDATE {table} SET photo_index = -photo_index - 1 WHERE category_slug=? AND photo_index<0',
+                        (slug,))
+
+
+# ----- Schema migrations -----
+# Ordered, idempotent steps; PRAGMA user_version stores how many have been applied.
+# Each step runs in its own transaction together with the user_version bump, so a
+# failed step leaves the schema at the previous version and is retried next start.
+# Steps must also succeed on databases created before versioning (user_version 0
+# with some tables already present), hence IF NOT EXISTS and _add_missing_columns.
+# Append new steps at the end; never reorder or edit shipped ones.
+def _add_missing_columns(cur: sqlite3.Cursor, table: str, columns: list[tuple[str, str]]) -> None:
+    cur.execute(f'PRAGMA table_info({table})')
+    existing = {r[1] for r in cur.fetchall()}
+    for name, decl in columns:
+        if name not in existing:
+            cur.execute(f'ALTER TABLE {table} ADD COLUMN {name} {decl}')
+
+
+def _migration_bookings(cur: sqlite3.Cursor) -> None:
     cur.execute('CREATE TABLE IF NOT EXISTS settings(key TEXT PRIMARY KEY, value TEXT)')
-    # Add category column for bookings (migration-safe)
     cur.execute('''CREATE TABLE IF NOT EXISTS bookings(
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER,
@@ -40,26 +253,20 @@ def init_db() -> None:
         loc_source TEXT,
         loc_addr TEXT
     )''')
-    # Migration: if old table (no category column), try to add
-    try:
-        cur.execute("PRAGMA table_info(bookings)")
-        cols = {r[1] for r in cur.fetchall()}
-        if 'category' not in cols:
-            cur.execute('ALTER TABLE bookings ADD COLUMN category TEXT')
-        if 'loc_lat' not in cols:
-            cur.execute('ALTER TABLE bookings ADD COLUMN loc_lat REAL')
-        if 'loc_lon' not in cols:
-            cur.execute('ALTER TABLE bookings ADD COLUMN loc_lon REAL')
-        if 'loc_text' not in cols:
-            cur.execute('ALTER TABLE bookings ADD COLUMN loc_text TEXT')
-        if 'loc_source' not in cols:
-            cur.execute('ALTER TABLE bookings ADD COLUMN loc_source TEXT')
-        if 'loc_addr' not in cols:
-            cur.execute('ALTER TABLE bookings ADD COLUMN loc_addr TEXT')
-    except Exception:
-        pass
+    # old databases predate the category and location columns
+    _add_missing_columns(cur, 'bookings', [
+        ('category', 'TEXT'),
+        ('loc_lat', 'REAL'),
+        ('loc_lon', 'REAL'),
+        ('loc_text', 'TEXT'),
+        ('loc_source', 'TEXT'),
+        ('loc_addr', 'TEXT'),
+    ])
     cur.execute('CREATE INDEX IF NOT EXISTS idx_bookings_start ON bookings(start_ts)')
-    # Create users table for broadcast functionality
+
+
+def _migration_users(cur: sqlite3.Cursor) -> None:
+    # users table for broadcast functionality
     cur.execute('''CREATE TABLE IF NOT EXISTS users(
         user_id INTEGER PRIMARY KEY,
         username TEXT,
@@ -67,7 +274,9 @@ def init_db() -> None:
         last_name TEXT,
         last_seen TEXT
     )''')
-    # Create promotions table for special offers
+
+
+def _migration_promotions(cur: sqlite3.Cursor) -> None:
     cur.execute('''CREATE TABLE IF NOT EXISTS promotions(
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         title TEXT NOT NULL,
@@ -79,8 +288,9 @@ def init_db() -> None:
         created_at TEXT DEFAULT (datetime('now'))
     )''')
     cur.execute('CREATE INDEX IF NOT EXISTS idx_promotions_dates ON promotions(start_date, end_date)')
-    
-    # Create photo_likes table for portfolio photo likes
+
+
+def _migration_photo_likes(cur: sqlite3.Cursor) -> None:
     cur.execute('''CREATE TABLE IF NOT EXISTS photo_likes(
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         category_slug TEXT NOT NULL,
@@ -91,28 +301,288 @@ def init_db() -> None:
     )''')
     cur.execute('CREATE INDEX IF NOT EXISTS idx_photo_likes ON photo_likes(category_slug, photo_index)')
     cur.execute('CREATE INDEX IF NOT EXISTS idx_photo_likes_user ON photo_likes(user_id)')
-    
-    con.commit()
-    con.close()
+
+
+def _migration_portfolio_photos(cur: sqlite3.Cursor) -> None:
+    # one row per photo, dense 0-based positions per category
+    cur.execute('''CREATE TABLE IF NOT EXISTS portfolio_photos(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        category_slug TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        file_id TEXT NOT NULL,
+        file_unique_id TEXT,
+        added_at TEXT DEFAULT (datetime('now'))
+    )''')
+    cur.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_portfolio_photos_pos ON portfolio_photos(category_slug, position)')
+    cur.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_portfolio_photos_file ON portfolio_photos(category_slug, file_id)')
+    _migrate_portfolio_settings(cur)
+
+
+def _migration_photo_like_counts(cur: sqlite3.Cursor) -> None:
+    # denormalized like counters, kept in sync with photo_likes by triggers
+    cur.execute('''CREATE TABLE IF NOT EXISTS photo_like_counts(
+        category_slug TEXT NOT NULL,
+        photo_index INTEGER NOT NULL,
+        likes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(category_slug, photo_index)
+    ) WITHOUT ROWID''')
+    cur.execute('''CREATE TRIGGER IF NOT EXISTS trg_photo_likes_insert AFTER INSERT ON photo_likes
+        BEGIN
+            INSERT INTO photo_like_counts(category_slug, photo_index, likes)
+            VALUES (NEW.category_slug, NEW.photo_index, 1)
+            ON CONFLICT(category_slug, photo_index) DO UPDATE SET likes = likes + 1;
+        END''')
+    cur.execute('''CREATE TRIGGER IF NOT EXISTS trg_photo_likes_delete AFTER DELETE ON photo_likes
+        BEGIN
+            UPDATE photo_like_counts SET likes = likes - 1
+            WHERE category_slug = OLD.category_slug AND photo_index = OLD.photo_index;
+        END''')
+    # rebuild from photo_likes: triggers and counters appear in the same transaction
+    cur.execute('DELETE FROM photo_like_counts')
+    cur.execute('''INSERT INTO photo_like_counts(category_slug, photo_index, likes)
+                   SELECT category_slug, photo_index, COUNT(*) FROM photo_likes
+                   GROUP BY category_slug, photo_index''')
+
+
+def _migration_subscribers(cur: sqlite3.Cursor) -> None:
+    # channel subscribers (simple_tracker, birthday_scheduler)
+    cur.execute('''CREATE TABLE IF NOT EXISTS subscribers(
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        first_name TEXT,
+        join_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    _add_missing_columns(cur, 'subscribers', [
+        ('last_name', 'TEXT'),
+        ('birthdate', 'TEXT'),
+    ])
+
+
+def _migration_booking_indexes(cur: sqlite3.Cursor) -> None:
+    # get_active_booking_for_user runs on every main-menu render
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_bookings_user_status ON bookings(user_id, status, start_ts)')
+    # get_due_reminders: only unsent reminders of live bookings, which stays a small set
+    cur.execute('''CREATE INDEX IF NOT EXISTS idx_bookings_reminders_due ON bookings(start_ts)
+                   WHERE reminder_sent=0 AND status IN ('active','confirmed')''')
+    # cleanup_expired_promotions deletes by end_date alone
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_promotions_end ON promotions(end_date)')
+
+
+def _migration_broadcast_jobs(cur: sqlite3.Cursor) -> None:
+    cur.execute('''CREATE TABLE IF NOT EXISTS broadcast_jobs(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        text TEXT,
+        image_file_id TEXT,
+        status TEXT NOT NULL,
+        created_by TEXT,
+        chat_id INTEGER,
+        total INTEGER NOT NULL DEFAULT 0,
+        sent INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT DEFAULT (datetime('now')),
+        finished_at TEXT
+    )''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs(status)')
+    cur.execute('''CREATE TABLE IF NOT EXISTS broadcast_deliveries(
+        job_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        reason TEXT,
+        attempted_at TEXT,
+        PRIMARY KEY(job_id, user_id)
+    ) WITHOUT ROWID''')
+    # claiming the next pending recipients must not rescan already delivered ones
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_broadcast_deliveries_status ON broadcast_deliveries(job_id, status)')
+
+
+def _migration_broadcast_cursor(cur: sqlite3.Cursor) -> None:
+    # recipients are streamed from users by keyset instead of being snapshotted up front
+    _add_missing_columns(cur, 'broadcast_jobs', [
+        ('last_user_id', 'INTEGER NOT NULL DEFAULT 0'),
+        ('seen_since', 'TEXT'),
+    ])
+
+
+def _migration_user_deliverability(cur: sqlite3.Cursor) -> None:
+    _add_missing_columns(cur, 'users', [
+        ('blocked_at', 'TEXT'),
+        ('fail_count', 'INTEGER NOT NULL DEFAULT 0'),
+        ('last_error', 'TEXT'),
+    ])
+    _add_missing_columns(cur, 'broadcast_jobs', [('suppressed', 'INTEGER NOT NULL DEFAULT 0')])
+    # broadcast pages walk only reachable users; suppressed ones are counted for the summary
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_users_reachable ON users(user_id) WHERE blocked_at IS NULL')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_users_blocked ON users(blocked_at) WHERE blocked_at IS NOT NULL')
+
+
+def _migration_broadcast_progress(cur: sqlite3.Cursor) -> None:
+    # the admin's progress message is kept across restarts and pauses
+    _add_missing_columns(cur, 'broadcast_jobs', [('progress_message_id', 'INTEGER')])
+
+
+def _migration_broadcast_media(cur: sqlite3.Cursor) -> None:
+    _add_missing_columns(cur, 'broadcast_jobs', [
+        # kind of image_file_id / media_path: photo, video, document or animation
+        ('media_type', 'TEXT'),
+        # local file uploaded on the first send; image_file_id then holds its file_id
+        ('media_path', 'TEXT'),
+        # copy mode: the admin's message (JSON list of ids for an album) is relayed as is
+        ('source_chat_id', 'INTEGER'),
+        ('source_message_ids', 'TEXT'),
+    ])
+
+
+def _migration_broadcast_segments(cur: sqlite3.Cursor) -> None:
+    # JSON segment description (see _segment_query); supersedes seen_since
+    _add_missing_columns(cur, 'broadcast_jobs', [('segment', 'TEXT')])
+    cur.execute("UPDATE broadcast_jobs SET segment=json_object('type', 'active', 'since', seen_since) "
+                "WHERE seen_since IS NOT NULL AND segment IS NULL")
+    # every segment is read by user_id so that it can be paged by keyset
+    cur.execute('DROP INDEX IF EXISTS idx_users_reachable')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_users_reachable_seen ON users(user_id, last_seen) WHERE blocked_at IS NULL')
+    cur.execute('''CREATE INDEX IF NOT EXISTS idx_bookings_active_user ON bookings(user_id)
+                   WHERE status IN ('active','confirmed')''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_photo_likes_category_user ON photo_likes(category_slug, user_id)')
+    # birthdate is 'YYYY-MM-DD' or 'MM-DD': the month is always at the same offset from the end
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_subscribers_birth_month ON subscribers(substr(birthdate, -5, 2))')
+
+
+def _migration_photo_unique_ids(cur: sqlite3.Cursor) -> None:
+    # reviews become one more (hidden) photo list with the same storage and duplicate checks
+    _migrate_reviews_setting(cur)
+    # Telegram issues a new file_id for every upload of the same image; file_unique_id is
+    # stable, so it is the duplicate key. Keep the first copy, then enforce it by index
+    # (rows migrated from settings have no file_unique_id and fall back to the file_id index).
+    cur.execute('''SELECT d.category_slug, d.position, MIN(k.position) FROM portfolio_photos d
+                   JOIN portfolio_photos k ON k.category_slug = d.category_slug
+                                          AND k.file_unique_id = d.file_unique_id
+                                          AND k.position < d.position
+                   GROUP BY d.id''')
+    duplicates = cur.fetchall()
+    if duplicates:
+        for slug, position, kept in duplicates:
+            # likes of a copy go to the first copy (the triggers keep photo_like_counts in step)
+            cur.execute('''INSERT OR IGNORE INTO photo_likes(category_slug, photo_index, user_id, liked_at)
+                           SELECT category_slug, ?, user_id, liked_at FROM photo_likes
+                           WHERE category_slug=? AND photo_index=?''', (kept, slug, position))
+            cur.execute('DELETE FROM photo_likes WHERE category_slug=? AND photo_index=?', (slug, position))
+            cur.execute('DELETE FROM photo_like_counts WHERE category_slug=? AND photo_index=?', (slug, position))
+            cur.execute('DELETE FROM portfolio_photos WHERE category_slug=? AND position=?', (slug, position))
+        _compact_portfolio_positions(cur, sorted({slug for slug, _, _ in duplicates}))
+    cur.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_portfolio_photos_unique
+                   ON portfolio_photos(category_slug, file_unique_id) WHERE file_unique_id IS NOT NULL''')
+
+
+def _migration_viewer_positions(cur: sqlite3.Cursor) -> None:
+    # where each chat stopped browsing a photo list (portfolio_state.ViewerPositions snapshot)
+    cur.execute('''CREATE TABLE IF NOT EXISTS viewer_positions(
+        chat_id INTEGER NOT NULL,
+        slug TEXT NOT NULL,
+        state TEXT NOT NULL,
+        touched_at REAL NOT NULL,
+        PRIMARY KEY(chat_id, slug)
+    ) WITHOUT ROWID''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_viewer_positions_touched ON viewer_positions(touched_at)')
+
+
+def _migration_media_quarantine(cur: sqlite3.Cursor) -> None:
+    # file_ids that Telegram no longer accepts, removed from where they were used (see quarantine_media)
+    cur.execute('''CREATE TABLE IF NOT EXISTS media_quarantine(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        ref TEXT NOT NULL,
+        file_id TEXT NOT NULL,
+        reason TEXT,
+        quarantined_at TEXT DEFAULT (datetime('now'))
+    )''')
+
+
+def _migration_segment_count_indexes(cur: sqlite3.Cursor) -> None:
+    # counting the 'active' segment is a last_seen range; its pages keep idx_users_reachable_seen
+    cur.execute('''CREATE INDEX IF NOT EXISTS idx_users_reachable_last_seen ON users(last_seen)
+                   WHERE blocked_at IS NULL''')
+
+
+MIGRATIONS = [
+    _migration_bookings,
+    _migration_users,
+    _migration_promotions,
+    _migration_photo_likes,
+    _migration_portfolio_photos,
+    _migration_photo_like_counts,
+    _migration_subscribers,
+    _migration_booking_indexes,
+    _migration_broadcast_jobs,
+    _migration_broadcast_cursor,
+    _migration_user_deliverability,
+    _migration_broadcast_progress,
+    _migration_broadcast_media,
+    _migration_broadcast_segments,
+    _migration_photo_unique_ids,
+    _migration_viewer_positions,
+    _migration_media_quarantine,
+    _migration_segment_count_indexes,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version() -> int:
+    con = _connect()
+    return con.execute('PRAGMA user_version').fetchone()[0]
+
+
+def init_db() -> None:
+    """Bring the schema up to SCHEMA_VERSION; returns at once when it is current."""
+    if schema_version() >= SCHEMA_VERSION:
+        return
+    con = _connect()
+    cur = con.cursor()
+    try:
+        # BEGIN IMMEDIATE serialises concurrent starters; re-read the version under the lock
+        for step in range(SCHEMA_VERSION):
+            cur.execute('BEGIN IMMEDIATE')
+            try:
+                current = cur.execute('PRAGMA user_version').fetchone()[0]
+                if current > step:
+                    con.rollback()
+                    continue
+                MIGRATIONS[step](cur)
+                cur.execute(f'PRAGMA user_version = {step + 1}')
+                con.commit()
+            except BaseException:
+                con.rollback()
+                raise
+    finally:
+        cur.close()
+    # migrations may rewrite settings rows behind the cache
+    clear_settings_cache()
+    _like_counts.clear()
 
 
 def get_menu(default: Optional[list] = None) -> list:
     """Return menu as a list of button dicts: [{'text':..., 'callback':...}, ...]"""
-    raw = get_setting('menu', None)
-    if not raw:
-        # if nothing saved, return default (or empty)
-        return default or []
-    try:
-        saved = json.loads(raw)
-    except Exception:
-        return default or []
+    menu, added = merge_menu_defaults(default)
+    if added:
+        # persist merged menu so caller sees same menu next time
+        save_menu(menu)
+    return menu
+
+
+def merge_menu_defaults(default: Optional[list] = None) -> tuple[list, bool]:
+    """Return (menu, added): saved menu with missing default buttons appended. Read-only."""
+    saved = get_setting_json('menu', None)
+    if not isinstance(saved, list):
+        # if nothing (valid) saved, return default (or empty)
+        return default or [], False
+    # the decoded value is shared through the settings cache: merge into a copy
+    saved = list(saved)
+    added = False
 
     # If caller provided a default list, ensure default buttons exist in saved menu
     # without removing user-created entries. Matching is done by 'callback' field.
     if default:
         try:
             existing_callbacks = {m.get('callback') for m in saved if isinstance(m, dict)}
-            added = False
             for d in default:
                 if not isinstance(d, dict):
                     continue
@@ -121,13 +591,10 @@ def get_menu(default: Optional[list] = None) -> list:
                     saved.append(d)
                     existing_callbacks.add(c)
                     added = True
-            if added:
-                # persist merged menu so caller sees same menu next time
-                set_setting('menu', json.dumps(saved, ensure_ascii=False))
         except Exception:
             # if merging fails, just return parsed saved menu
             pass
-    return saved
+    return saved, added
 
 
 def save_menu(menu: list) -> None:
@@ -149,21 +616,149 @@ def save_pending_actions(pending: dict) -> None:
     set_setting('pending_actions', json.dumps(pending, ensure_ascii=False))
 
 
-def get_setting(key: str, default: Optional[str] = None) -> Optional[str]:
+# ----- Settings cache -----
+# Read-through LRU cache in front of the settings table. set_setting writes through, so
+# the cache stays coherent inside this process; scripts that edit data.db directly
+# while the bot runs need clear_settings_cache() (or a restart) to be picked up.
+SETTINGS_CACHE_SIZE = int(os.getenv('SETTINGS_CACHE_SIZE', '1024'))
+SETTING_NOT_CACHED = object()
+_NOT_DECODED = object()
+_INVALID_JSON = object()
+
+
+class _LRUCache:
+    """Bounded LRU map key -> [raw value or None, decoded value]."""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = max(1, maxsize)
+        self._entries: OrderedDict[Any, list] = OrderedDict()
+        self._lock = threading.Lock()
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key: Any, count_miss: bool = True) -> Optional[list]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if count_miss:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def store(self, key: Any, raw: Any, version: Optional[int] = None) -> list:
+        """Cache a value; a read (version given) is dropped if a write raced with it."""
+        entry = [raw, _NOT_DECODED]
+        with self._lock:
+            if version is None:
+                self.version += 1
+            elif version != self.version:
+                return entry
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.version += 1
+
+    def discard(self, match: Callable[[Any], bool]) -> None:
+        """Drop the entries whose key matches (e.g. all like counts of one category)."""
+        with self._lock:
+            for key in [key for key in self._entries if match(key)]:
+                del self._entries[key]
+            self.version += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+_settings_cache = _LRUCache(SETTINGS_CACHE_SIZE)
+
+
+def _decode_entry(entry: list) -> Any:
+    decoded = entry[1]
+    if decoded is _NOT_DECODED:
+        try:
+            decoded = json.loads(entry[0]) if entry[0] else _INVALID_JSON
+        except Exception:
+            decoded = _INVALID_JSON
+        entry[1] = decoded
+    return decoded
+
+
+def _load_setting_entry(key: str) -> list:
+    entry = _settings_cache.lookup(key)
+    if entry is not None:
+        return entry
+    version = _settings_cache.version
     con = _connect()
     cur = con.cursor()
     cur.execute('SELECT value FROM settings WHERE key=?', (key,))
     row = cur.fetchone()
-    con.close()
-    return row[0] if row else default
+    cur.close()
+    return _settings_cache.store(key, row[0] if row else None, version)
+
+
+def get_setting(key: str, default: Optional[str] = None) -> Optional[str]:
+    raw = _load_setting_entry(key)[0]
+    return raw if raw is not None else default
+
+
+def get_setting_json(key: str, default: Any = None) -> Any:
+    """Return the JSON-decoded setting (default if missing or invalid).
+
+    The decoded object is cached and shared between callers: treat it as read-only
+    and copy it before modifying.
+    """
+    decoded = _decode_entry(_load_setting_entry(key))
+    return default if decoded is _INVALID_JSON else decoded
+
+
+def get_setting_cached(key: str, default: Optional[str] = None) -> Any:
+    """Like get_setting, but never touches the DB: SETTING_NOT_CACHED on a cache miss."""
+    entry = _settings_cache.lookup(key, count_miss=False)
+    if entry is None:
+        return SETTING_NOT_CACHED
+    return entry[0] if entry[0] is not None else default
+
+
+def get_setting_json_cached(key: str, default: Any = None) -> Any:
+    """Like get_setting_json, but never touches the DB: SETTING_NOT_CACHED on a cache miss."""
+    entry = _settings_cache.lookup(key, count_miss=False)
+    if entry is None:
+        return SETTING_NOT_CACHED
+    decoded = _decode_entry(entry)
+    return default if decoded is _INVALID_JSON else decoded
 
 
 def set_setting(key: str, value: str) -> None:
-    con = _connect()
-    cur = con.cursor()
-    cur.execute('INSERT INTO settings(key,value) VALUES(?,?) ON CONFLICT(key) DO UPDATE SET value=excluded.value', (key, value))
-    con.commit()
-    con.close()
+    with _transaction() as con:
+        con.execute('INSERT INTO settings(key,value) VALUES(?,?) ON CONFLICT(key) DO UPDATE SET value=excluded.value', (key, value))
+    _after_commit(lambda: _settings_cache.store(key, value))
+
+
+def settings_cache_stats() -> dict:
+    """Return settings cache counters: size, maxsize, hits, misses, evictions."""
+    return _settings_cache.stats()
+
+
+def clear_settings_cache() -> None:
+    _settings_cache.clear()
 
 
 # ----- Booking helpers -----
@@ -171,25 +766,21 @@ def add_booking(user_id: int, username: str, chat_id: int, start_ts: str, catego
                 loc_lat: float | None = None, loc_lon: float | None = None,
                 loc_text: str | None = None, loc_source: str | None = None,
                 loc_addr: str | None = None) -> int:
-    con = _connect()
-    cur = con.cursor()
-    cur.execute('''INSERT INTO bookings(user_id, username, chat_id, start_ts, status, category, reminder_sent,
-                                        loc_lat, loc_lon, loc_text, loc_source, loc_addr)
-                   VALUES(?,?,?,?,?,?,0, ?,?,?,?,?)''',
-                (user_id, username, chat_id, start_ts, 'active', category,
-                 loc_lat, loc_lon, loc_text, loc_source, loc_addr))
-    bid = cur.lastrowid
-    con.commit()
-    con.close()
-    return bid
+    with _transaction() as con:
+        cur = con.execute('''INSERT INTO bookings(user_id, username, chat_id, start_ts, status, category, reminder_sent,
+                                                  loc_lat, loc_lon, loc_text, loc_source, loc_addr)
+                             VALUES(?,?,?,?,?,?,0, ?,?,?,?,?)''',
+                          (user_id, username, chat_id, start_ts, 'active', category,
+                           loc_lat, loc_lon, loc_text, loc_source, loc_addr))
+        return cur.lastrowid
 
 
 def get_bookings_between(start_iso: str, end_iso: str) -> list[dict]:
     con = _connect()
     cur = con.cursor()
-    cur.execute('SELECT id,user_id,username,chat_id,start_ts,status,category,reminder_sent,loc_lat,loc_lon,loc_text,loc_source,loc_addr FROM bookings WHERE start_ts>=? AND start_ts<? AND status IN ("active","confirmed") ORDER BY start_ts', (start_iso, end_iso))
+    cur.execute("SELECT id,user_id,username,chat_id,start_ts,status,category,reminder_sent,loc_lat,loc_lon,loc_text,loc_source,loc_addr FROM bookings WHERE start_ts>=? AND start_ts<? AND status IN ('active','confirmed') ORDER BY start_ts", (start_iso, end_iso))
     rows = cur.fetchall()
-    con.close()
+    cur.close()
     return [
         {'id': r[0], 'user_id': r[1], 'username': r[2], 'chat_id': r[3], 'start_ts': r[4], 'status': r[5], 'category': r[6], 'reminder_sent': r[7], 'loc_lat': r[8], 'loc_lon': r[9], 'loc_text': r[10], 'loc_source': r[11], 'loc_addr': r[12]} for r in rows
     ]
@@ -198,9 +789,9 @@ def get_bookings_between(start_iso: str, end_iso: str) -> list[dict]:
 def is_slot_taken(start_ts: str) -> bool:
     con = _connect()
     cur = con.cursor()
-    cur.execute('SELECT 1 FROM bookings WHERE start_ts=? AND status IN ("active","confirmed") LIMIT 1', (start_ts,))
+    cur.execute("SELECT 1 FROM bookings WHERE start_ts=? AND status IN ('active','confirmed') LIMIT 1", (start_ts,))
     taken = cur.fetchone() is not None
-    con.close()
+    cur.close()
     return taken
 
 
@@ -209,7 +800,7 @@ def get_booking(bid: int) -> Optional[Dict]:
     cur = con.cursor()
     cur.execute('SELECT id,user_id,username,chat_id,start_ts,status,category,reminder_sent,loc_lat,loc_lon,loc_text,loc_source,loc_addr FROM bookings WHERE id=?', (bid,))
     r = cur.fetchone()
-    con.close()
+    cur.close()
     if not r:
         return None
     return {'id': r[0], 'user_id': r[1], 'username': r[2], 'chat_id': r[3], 'start_ts': r[4], 'status': r[5], 'category': r[6], 'reminder_sent': r[7], 'loc_lat': r[8], 'loc_lon': r[9], 'loc_text': r[10], 'loc_source': r[11], 'loc_addr': r[12]}
@@ -220,59 +811,47 @@ def get_active_booking_for_user(user_id: int) -> Optional[Dict]:
     con = _connect()
     cur = con.cursor()
     cur.execute('''SELECT id,user_id,username,chat_id,start_ts,status,category,reminder_sent,loc_lat,loc_lon,loc_text,loc_source,loc_addr FROM bookings
-                   WHERE user_id=? AND status IN ("active","confirmed") ORDER BY start_ts DESC LIMIT 1''', (user_id,))
+                   WHERE user_id=? AND status IN ('active','confirmed') ORDER BY start_ts DESC LIMIT 1''', (user_id,))
     r = cur.fetchone()
-    con.close()
+    cur.close()
     if not r:
         return None
     return {'id': r[0], 'user_id': r[1], 'username': r[2], 'chat_id': r[3], 'start_ts': r[4], 'status': r[5], 'category': r[6], 'reminder_sent': r[7], 'loc_lat': r[8], 'loc_lon': r[9], 'loc_text': r[10], 'loc_source': r[11], 'loc_addr': r[12]}
 
 
 def update_booking_time_and_category(bid: int, new_start_ts: str, new_category: str):
-    con = _connect()
-    cur = con.cursor()
-    cur.execute('UPDATE bookings SET start_ts=?, category=?, reminder_sent=0 WHERE id=?', (new_start_ts, new_category, bid))
-    con.commit()
-    con.close()
+    with _transaction() as con:
+        con.execute('UPDATE bookings SET start_ts=?, category=?, reminder_sent=0 WHERE id=?', (new_start_ts, new_category, bid))
 
 def update_booking_time_category_location(bid: int, new_start_ts: str, new_category: str,
                                           loc_lat: float | None, loc_lon: float | None,
                                           loc_text: str | None, loc_source: str | None,
                                           loc_addr: str | None):
-    con = _connect()
-    cur = con.cursor()
-    cur.execute('''UPDATE bookings SET start_ts=?, category=?, reminder_sent=0,
-                                      loc_lat=?, loc_lon=?, loc_text=?, loc_source=?, loc_addr=?
-                   WHERE id=?''',
-                (new_start_ts, new_category, loc_lat, loc_lon, loc_text, loc_source, loc_addr, bid))
-    con.commit()
-    con.close()
+    with _transaction() as con:
+        con.execute('''UPDATE bookings SET start_ts=?, category=?, reminder_sent=0,
+                                          loc_lat=?, loc_lon=?, loc_text=?, loc_source=?, loc_addr=?
+                       WHERE id=?''',
+                    (new_start_ts, new_category, loc_lat, loc_lon, loc_text, loc_source, loc_addr, bid))
 
 
 def update_booking_status(bid: int, status: str):
-    con = _connect()
-    cur = con.cursor()
-    cur.execute('UPDATE bookings SET status=? WHERE id=?', (status, bid))
-    con.commit()
-    con.close()
+    with _transaction() as con:
+        con.execute('UPDATE bookings SET status=? WHERE id=?', (status, bid))
 
 
 def mark_booking_reminder_sent(bid: int):
-    con = _connect()
-    cur = con.cursor()
-    cur.execute('UPDATE bookings SET reminder_sent=1 WHERE id=?', (bid,))
-    con.commit()
-    con.close()
+    with _transaction() as con:
+        con.execute('UPDATE bookings SET reminder_sent=1 WHERE id=?', (bid,))
 
 
 def get_due_reminders(from_iso: str, to_iso: str) -> list[dict]:
     """Return bookings whose reminder should be sent in [from_iso, to_iso)."""
-    con = sqlite3.connect(DB_PATH)
+    con = _connect()
     cur = con.cursor()
     cur.execute('''SELECT id,user_id,username,chat_id,start_ts,status,category,reminder_sent FROM bookings
-                   WHERE status IN ("active","confirmed") AND reminder_sent=0 AND start_ts>=? AND start_ts<?''', (from_iso, to_iso))
+                   WHERE status IN ('active','confirmed') AND reminder_sent=0 AND start_ts>=? AND start_ts<?''', (from_iso, to_iso))
     rows = cur.fetchall()
-    con.close()
+    cur.close()
     return [
         {'id': r[0], 'user_id': r[1], 'username': r[2], 'chat_id': r[3], 'start_ts': r[4], 'status': r[5], 'category': r[6], 'reminder_sent': r[7]} for r in rows
     ]
@@ -280,137 +859,279 @@ def get_due_reminders(from_iso: str, to_iso: str) -> list[dict]:
 
 def clear_all_bookings():
     """Dangerous: wipe all booking data."""
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.execute('DELETE FROM bookings')
-    con.commit()
-    con.close()
+    with _transaction() as con:
+        con.execute('DELETE FROM bookings')
 
 
 def add_user(user_id: int, username: str = None, first_name: str = None, last_name: str = None):
-    """Add or update user in the database."""
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.execute('''INSERT OR REPLACE INTO users 
-                   (user_id, username, first_name, last_name, last_seen) 
-                   VALUES (?, ?, ?, ?, datetime('now'))''',
-                (user_id, username, first_name, last_name))
-    con.commit()
-    con.close()
+    """Add or update user in the database.
+
+    A user who writes to the bot can be reached again, so broadcast suppression is lifted.
+    """
+    with _transaction() as con:
+        # upsert in place: INSERT OR REPLACE would delete and re-insert the row
+        con.execute('''INSERT INTO users
+                       (user_id, username, first_name, last_name, last_seen)
+                       VALUES (?, ?, ?, ?, datetime('now'))
+                       ON CONFLICT(user_id) DO UPDATE SET
+                           username=excluded.username,
+                           first_name=excluded.first_name,
+                           last_name=excluded.last_name,
+                           last_seen=excluded.last_seen,
+                           blocked_at=NULL,
+                           fail_count=0''',
+                    (user_id, username, first_name, last_name))
+
+
+def touch_users(seen: list[tuple[int, str]]) -> int:
+    """Bulk-update last_seen from (user_id, 'YYYY-MM-DD HH:MM:SS' UTC) pairs; unknown ids are inserted.
+
+    Lifts broadcast suppression set before the visit (not one recorded after it).
+    """
+    with _transaction() as con:
+        cur = con.executemany('''INSERT INTO users (user_id, last_seen) VALUES (?, ?)
+                                 ON CONFLICT(user_id) DO UPDATE SET
+                                     last_seen=excluded.last_seen,
+                                     blocked_at=CASE WHEN users.blocked_at > excluded.last_seen
+                                                     THEN users.blocked_at END,
+                                     fail_count=CASE WHEN users.blocked_at > excluded.last_seen
+                                                     THEN users.fail_count ELSE 0 END
+                                 WHERE excluded.last_seen > COALESCE(users.last_seen, '')''',
+                              seen)
+        return cur.rowcount
 
 
 def get_all_users():
     """Get all users from the database."""
-    con = sqlite3.connect(DB_PATH)
+    con = _connect()
     cur = con.cursor()
     cur.execute('SELECT user_id, username, first_name, last_name FROM users')
     users = cur.fetchall()
-    con.close()
+    cur.close()
     return users
 
 
-def add_promotion(title: str, description: str, start_date: str, end_date: str, 
+def _segment_query(segment: Dict | None, suppressed: bool = False) -> tuple[str, str, list[str], list]:
+    """Compile a broadcast segment into (FROM clause, user id column, WHERE terms, params).
+
+    Segments (None means all users):
+      {'type': 'active', 'since': 'YYYY-MM-DD HH:MM:SS'}  last_seen at or after since
+      {'type': 'active_booking'}                           has an active or confirmed booking
+      {'type': 'liked_category', 'category': slug}         liked a photo in the category
+      {'type': 'subscriber'}                               channel subscriber
+      {'type': 'birthday_month', 'month': 1..12}           subscriber born in that month
+    The FROM side is chosen so that its index is ordered by user id: pages are range
+    lookups whose cost follows the segment size, not the users table.
+    """
+    reach = 'u.blocked_at IS NOT NULL' if suppressed else 'u.blocked_at IS NULL'
+    kind = (segment or {}).get('type', 'all')
+    if kind == 'all':
+        return 'users u', 'u.user_id', [reach], []
+    if kind == 'active':
+        return 'users u', 'u.user_id', [reach, 'u.last_seen >= ?'], [segment['since']]
+    if kind == 'active_booking':
+        return ('bookings b JOIN users u ON u.user_id = b.user_id', 'b.user_id',
+                [reach, "b.status IN ('active','confirmed')"], [])
+    if kind == 'liked_category':
+        return ('photo_likes l JOIN users u ON u.user_id = l.user_id', 'l.user_id',
+                [reach, 'l.category_slug = ?'], [segment['category']])
+    # CROSS JOIN keeps subscribers as the outer loop, otherwise SQLite walks all users
+    if kind == 'subscriber':
+        return 'subscribers s CROSS JOIN users u ON u.user_id = s.user_id', 's.user_id', [reach], []
+    if kind == 'birthday_month':
+        return ('subscribers s CROSS JOIN users u ON u.user_id = s.user_id', 's.user_id',
+                [reach, 'substr(s.birthdate, -5, 2) = ?'], [f"{int(segment['month']):02d}"])
+    raise ValueError(f'Unknown broadcast segment: {segment!r}')
+
+
+def count_users(segment: Dict | None = None, suppressed: bool = False) -> int:
+    """Count users of a segment a broadcast can reach (or, with suppressed=True, the ones it skips)."""
+    source, key, where, params = _segment_query(segment, suppressed)
+    con = _connect()
+    cur = con.cursor()
+    cur.execute(f'SELECT COUNT(DISTINCT {key}) FROM {source} WHERE ' + ' AND '.join(where), params)
+    count = cur.fetchone()[0]
+    cur.close()
+    return count
+
+
+def get_user_ids_page(after_user_id: int, limit: int, segment: Dict | None = None) -> list[int]:
+    """Return up to limit reachable user ids of a segment greater than after_user_id, ascending.
+
+    Keyset pagination: every page is a range lookup in an index ordered by user id, so
+    walking the segment costs the same per page however deep the cursor is (unlike
+    OFFSET) and suppressed users are never sent to.
+    """
+    source, key, where, params = _segment_query(segment)
+    con = _connect()
+    cur = con.cursor()
+    cur.execute(f'SELECT DISTINCT {key} FROM {source} WHERE ' + ' AND '.join(where)
+                + f' AND {key} > ? ORDER BY {key} LIMIT ?',
+                (*params, after_user_id, limit))
+    user_ids = [r[0] for r in cur.fetchall()]
+    cur.close()
+    return user_ids
+
+
+def add_promotion(title: str, description: str, start_date: str, end_date: str,
                   created_by: str, image_file_id: str = None):
     """Add a new promotion to the database."""
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.execute('''INSERT INTO promotions 
-                   (title, description, image_file_id, start_date, end_date, created_by) 
-                   VALUES (?, ?, ?, ?, ?, ?)''',
-                (title, description, image_file_id, start_date, end_date, created_by))
-    promotion_id = cur.lastrowid
-    con.commit()
-    con.close()
-    return promotion_id
+    with _transaction() as con:
+        cur = con.execute('''INSERT INTO promotions
+                             (title, description, image_file_id, start_date, end_date, created_by)
+                             VALUES (?, ?, ?, ?, ?, ?)''',
+                          (title, description, image_file_id, start_date, end_date, created_by))
+        return cur.lastrowid
 
 
 def get_active_promotions():
     """Get all active promotions (current date between start_date and end_date)."""
     from datetime import datetime
     today = datetime.now().strftime('%Y-%m-%d')
-    
-    con = sqlite3.connect(DB_PATH)
+
+    con = _connect()
     cur = con.cursor()
     cur.execute('''SELECT id, title, description, image_file_id, start_date, end_date, created_by
-                   FROM promotions 
+                   FROM promotions
                    WHERE start_date <= ? AND end_date >= ?
                    ORDER BY created_at DESC''', (today, today))
     promotions = cur.fetchall()
-    con.close()
+    cur.close()
     return promotions
 
 
 def get_all_promotions():
     """Get all promotions regardless of date."""
-    con = sqlite3.connect(DB_PATH)
+    con = _connect()
     cur = con.cursor()
     cur.execute('''SELECT id, title, description, image_file_id, start_date, end_date, created_by
                    FROM promotions ORDER BY created_at DESC''')
     promotions = cur.fetchall()
-    con.close()
+    cur.close()
     return promotions
 
 
 def delete_promotion(promotion_id: int):
     """Delete a promotion by ID."""
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.execute('DELETE FROM promotions WHERE id = ?', (promotion_id,))
-    con.commit()
-    con.close()
+    with _transaction() as con:
+        con.execute('DELETE FROM promotions WHERE id = ?', (promotion_id,))
 
 
 # Photo likes functions
+# LRU of (slug, index) -> like count, written through by toggles in this process
+LIKE_COUNTS_CACHE_SIZE = int(os.getenv('LIKE_COUNTS_CACHE_SIZE', '4096'))
+_like_counts = _LRUCache(LIKE_COUNTS_CACHE_SIZE)
+
+
+def _forget_photo_likes(con: sqlite3.Connection, category_slug: str, position: Optional[int] = None) -> None:
+    """Drop the likes of one removed photo (or of the whole category) and their cached counts."""
+    where, params = 'category_slug=?', (category_slug,)
+    if position is not None:
+        where, params = 'category_slug=? AND photo_index=?', (category_slug, position)
+    con.execute(f'DELETE FROM photo_likes WHERE {where}', params)
+    con.execute(f'DELETE FROM photo_like_counts WHERE {where}', params)
+    # counts of the category's other photos move on compaction, so the whole slug is dropped
+    _after_commit(lambda: _like_counts.discard(lambda key: key[0] == category_slug))
+
+
 def toggle_photo_like(category_slug: str, photo_index: int, user_id: int) -> bool:
     """Toggle like for a photo by user. Returns True if like was added, False if removed."""
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    
-    # Check if user already liked this photo
-    cur.execute('''SELECT id FROM photo_likes 
-                   WHERE category_slug = ? AND photo_index = ? AND user_id = ?''',
-                (category_slug, photo_index, user_id))
-    existing = cur.fetchone()
-    
-    if existing:
-        # Remove like
-        cur.execute('''DELETE FROM photo_likes 
-                       WHERE category_slug = ? AND photo_index = ? AND user_id = ?''',
-                    (category_slug, photo_index, user_id))
-        con.commit()
-        con.close()
-        return False
-    else:
-        # Add like
-        cur.execute('''INSERT INTO photo_likes (category_slug, photo_index, user_id) 
-                       VALUES (?, ?, ?)''',
-                    (category_slug, photo_index, user_id))
-        con.commit()
-        con.close()
-        return True
+    return toggle_photo_like_count(category_slug, photo_index, user_id)[0]
+
+
+def toggle_photo_like_count(category_slug: str, photo_index: int, user_id: int) -> tuple[bool, int]:
+    """Toggle like and return (liked, new like count) from the same transaction."""
+    with _transaction() as con:
+        # Remove the like if it exists, otherwise add it
+        cur = con.execute('''DELETE FROM photo_likes
+                             WHERE category_slug = ? AND photo_index = ? AND user_id = ?''',
+                          (category_slug, photo_index, user_id))
+        liked = not cur.rowcount
+        if liked:
+            con.execute('''INSERT INTO photo_likes (category_slug, photo_index, user_id)
+                           VALUES (?, ?, ?)''',
+                        (category_slug, photo_index, user_id))
+        row = con.execute('SELECT likes FROM photo_like_counts WHERE category_slug = ? AND photo_index = ?',
+                          (category_slug, photo_index)).fetchone()
+        likes = row[0] if row else 0
+    _after_commit(lambda: _like_counts.store((category_slug, photo_index), likes))
+    return liked, likes
+
+
+def set_photo_like(category_slug: str, photo_index: int, user_id: int, liked: bool) -> tuple[bool, int]:
+    """Make the user's like state equal liked; return (changed, new like count)."""
+    with _transaction() as con:
+        if liked:
+            cur = con.execute('''INSERT OR IGNORE INTO photo_likes (category_slug, photo_index, user_id)
+                                 VALUES (?, ?, ?)''',
+                              (category_slug, photo_index, user_id))
+        else:
+            cur = con.execute('''DELETE FROM photo_likes
+                                 WHERE category_slug = ? AND photo_index = ? AND user_id = ?''',
+                              (category_slug, photo_index, user_id))
+        changed = cur.rowcount > 0
+        row = con.execute('SELECT likes FROM photo_like_counts WHERE category_slug = ? AND photo_index = ?',
+                          (category_slug, photo_index)).fetchone()
+        likes = row[0] if row else 0
+    _after_commit(lambda: _like_counts.store((category_slug, photo_index), likes))
+    return changed, likes
 
 
 def get_photo_likes_count(category_slug: str, photo_index: int) -> int:
-    """Get total number of likes for a photo."""
-    con = sqlite3.connect(DB_PATH)
+    """Get total number of likes for a photo (from the photo_like_counts counter)."""
+    return get_photo_like_states([(category_slug, photo_index)])[(category_slug, photo_index)][0]
+
+
+def get_photo_like_states(photos: Iterable[tuple[str, int]],
+                          user_id: Optional[int] = None) -> Dict[tuple[str, int], tuple[int, bool]]:
+    """Return {(slug, index): (like count, liked by user_id)} for all photos in one call.
+
+    Counts come from the like counts cache when present; misses and the user's likes are
+    read with one IN query per category.
+    """
+    keys = list(dict.fromkeys((slug, int(idx)) for slug, idx in photos))
+    counts: Dict[tuple[str, int], int] = {}
+    missing: Dict[str, list[int]] = {}
+    for key in keys:
+        entry = _like_counts.lookup(key)
+        if entry is None:
+            missing.setdefault(key[0], []).append(key[1])
+        else:
+            counts[key] = entry[0]
+    version = _like_counts.version
+    liked: set[tuple[str, int]] = set()
+    con = _connect()
     cur = con.cursor()
-    cur.execute('''SELECT COUNT(*) FROM photo_likes 
-                   WHERE category_slug = ? AND photo_index = ?''',
-                (category_slug, photo_index))
-    count = cur.fetchone()[0]
-    con.close()
-    return count
+    for slug, indexes in missing.items():
+        marks = ','.join('?' * len(indexes))
+        cur.execute(f'SELECT photo_index, likes FROM photo_like_counts WHERE category_slug = ? AND photo_index IN ({marks})',
+                    (slug, *indexes))
+        found = dict(cur.fetchall())
+        for idx in indexes:
+            counts[(slug, idx)] = _like_counts.store((slug, idx), found.get(idx, 0), version)[0]
+    if user_id is not None:
+        by_slug: Dict[str, list[int]] = {}
+        for slug, idx in keys:
+            by_slug.setdefault(slug, []).append(idx)
+        for slug, indexes in by_slug.items():
+            marks = ','.join('?' * len(indexes))
+            cur.execute(f'''SELECT photo_index FROM photo_likes
+                            WHERE category_slug = ? AND photo_index IN ({marks}) AND user_id = ?''',
+                        (slug, *indexes, user_id))
+            liked.update((slug, r[0]) for r in cur.fetchall())
+    cur.close()
+    return {key: (counts[key], key in liked) for key in keys}
 
 
 def user_has_liked_photo(category_slug: str, photo_index: int, user_id: int) -> bool:
     """Check if user has liked a specific photo."""
-    con = sqlite3.connect(DB_PATH)
+    con = _connect()
     cur = con.cursor()
-    cur.execute('''SELECT id FROM photo_likes 
+    cur.execute('''SELECT id FROM photo_likes
                    WHERE category_slug = ? AND photo_index = ? AND user_id = ?''',
                 (category_slug, photo_index, user_id))
     result = cur.fetchone()
-    con.close()
+    cur.close()
     return result is not None
 
 
@@ -418,11 +1139,393 @@ def cleanup_expired_promotions():
     """Remove expired promotions from database."""
     from datetime import datetime
     today = datetime.now().strftime('%Y-%m-%d')
-    
-    con = sqlite3.connect(DB_PATH)
+
+    with _transaction() as con:
+        cur = con.execute('DELETE FROM promotions WHERE end_date < ?', (today,))
+        return cur.rowcount
+
+
+# ----- Portfolio photos -----
+# Reviews are stored as one more photo list; normalize_callback never yields a leading '_',
+# so no portfolio category can take this slug
+REVIEWS_SLUG = '_reviews'
+
+
+def count_portfolio_photos(category_slug: str) -> int:
+    con = _connect()
+    cur = con.cursor()
+    cur.execute('SELECT COUNT(*) FROM portfolio_photos WHERE category_slug=?', (category_slug,))
+    count = cur.fetchone()[0]
+    cur.close()
+    return count
+
+
+def get_portfolio_photo(category_slug: str, position: int) -> Optional[str]:
+    """Return file_id of the photo at 0-based position in the category, or None."""
+    con = _connect()
+    cur = con.cursor()
+    cur.execute('SELECT file_id FROM portfolio_photos WHERE category_slug=? AND position=?', (category_slug, position))
+    row = cur.fetchone()
+    cur.close()
+    return row[0] if row else None
+
+
+def get_portfolio_photos(category_slug: str) -> list[str]:
+    """Return all file_ids of the category ordered by position."""
+    con = _connect()
     cur = con.cursor()
-    cur.execute('DELETE FROM promotions WHERE end_date < ?', (today,))
-    deleted_count = cur.rowcount
-    con.commit()
-    con.close()
-    return deleted_count
+    cur.execute('SELECT file_id FROM portfolio_photos WHERE category_slug=? ORDER BY position', (category_slug,))
+    photos = [r[0] for r in cur.fetchall()]
+    cur.close()
+    return photos
+
+
+def add_portfolio_photo(category_slug: str, file_id: str, file_unique_id: str | None = None) -> bool:
+    """Append a photo to the category. Returns False if it is already there (same file_id or file_unique_id)."""
+    with _transaction() as con:
+        cur = con.execute('''INSERT OR IGNORE INTO portfolio_photos(category_slug, position, file_id, file_unique_id)
+                             SELECT ?, COALESCE(MAX(position) + 1, 0), ?, ? FROM portfolio_photos WHERE category_slug=?''',
+                          (category_slug, file_id, file_unique_id, category_slug))
+        return cur.rowcount > 0
+
+
+def add_portfolio_photos(category_slug: str, photos: Iterable[tuple[str, Optional[str]]]) -> list[str]:
+    """Append (file_id, file_unique_id) pairs in one transaction, skipping ones already there.
+
+    Returns the file_ids that were added, in order.
+    """
+    added = []
+    with _transaction() as con:
+        position = con.execute('SELECT COALESCE(MAX(position) + 1, 0) FROM portfolio_photos WHERE category_slug=?',
+                               (category_slug,)).fetchone()[0]
+        for file_id, file_unique_id in photos:
+            cur = con.execute('''INSERT OR IGNORE INTO portfolio_photos(category_slug, position, file_id, file_unique_id)
+                                 VALUES(?,?,?,?)''', (category_slug, position, file_id, file_unique_id))
+            if cur.rowcount:
+                added.append(file_id)
+                position += 1
+    return added
+
+
+def delete_portfolio_photo(category_slug: str, position: int) -> Optional[tuple[str, Optional[str]]]:
+    """Remove the photo (and its likes) at position and close the gap.
+
+    Returns the removed (file_id, file_unique_id), so that an undo keeps the duplicate check.
+    """
+    with _transaction() as con:
+        cur = con.execute('SELECT file_id, file_unique_id FROM portfolio_photos WHERE category_slug=? AND position=?',
+                          (category_slug, position))
+        row = cur.fetchone()
+        if not row:
+            return None
+        _forget_photo_likes(con, category_slug, position)
+        con.execute('DELETE FROM portfolio_photos WHERE category_slug=? AND position=?', (category_slug, position))
+        # the photos after it and their likes move up by one
+        _compact_portfolio_positions(con.cursor(), [category_slug])
+        return row[0], row[1]
+
+
+def clear_portfolio_photos(category_slug: str) -> list[tuple[str, Optional[str]]]:
+    """Remove all photos of the category with their likes.
+
+    Returns the removed (file_id, file_unique_id) pairs in order (for undo via set_portfolio_photos).
+    """
+    with _transaction() as con:
+        cur = con.execute('SELECT file_id, file_unique_id FROM portfolio_photos WHERE category_slug=? ORDER BY position',
+                          (category_slug,))
+        photos = [(r[0], r[1]) for r in cur.fetchall()]
+        con.execute('DELETE FROM portfolio_photos WHERE category_slug=?', (category_slug,))
+        _forget_photo_likes(con, category_slug)
+        return photos
+
+
+def set_portfolio_photos(category_slug: str, photos: Iterable[tuple[str, Optional[str]]]) -> None:
+    """Replace the whole category with (file_id, file_unique_id) pairs (in order), dropping duplicates.
+
+    Likes are keyed by position, so the category's old likes are dropped with the old list.
+    """
+    with _transaction() as con:
+        con.execute('DELETE FROM portfolio_photos WHERE category_slug=?', (category_slug,))
+        _forget_photo_likes(con, category_slug)
+        position = 0
+        for file_id, file_unique_id in photos:
+            cur = con.execute('''INSERT OR IGNORE INTO portfolio_photos(category_slug, position, file_id, file_unique_id)
+                                 VALUES(?,?,?,?)''', (category_slug, position, file_id, file_unique_id))
+            position += cur.rowcount
+
+
+# ----- Viewer positions -----
+def get_viewer_positions(since: float, limit: int) -> list[tuple[int, str, str, float]]:
+    """Return up to limit (chat_id, slug, state JSON, touched_at) rows touched after since, newest first."""
+    con = _connect()
+    cur = con.cursor()
+    cur.execute('''SELECT chat_id, slug, state, touched_at FROM viewer_positions
+                   WHERE touched_at > ? ORDER BY touched_at DESC LIMIT ?''', (since, limit))
+    rows = cur.fetchall()
+    cur.close()
+    return rows
+
+
+def save_viewer_positions(
+    rows: Iterable[tuple[int, str, str, float]],
+    removed: Iterable[tuple[int, str]] = (),
+    older_than: Optional[float] = None,
+) -> None:
+    """Upsert (chat_id, slug, state JSON, touched_at) rows and delete removed (chat_id, slug) keys.
+
+    With older_than, rows not touched since then are dropped as well, which keeps the table
+    bounded by the store's TTL.
+    """
+    with _transaction() as con:
+        con.executemany('DELETE FROM viewer_positions WHERE chat_id=? AND slug=?', removed)
+        con.executemany('''INSERT INTO viewer_positions(chat_id, slug, state, touched_at) VALUES(?,?,?,?)
+                           ON CONFLICT(chat_id, slug) DO UPDATE SET
+                               state=excluded.state, touched_at=excluded.touched_at''', rows)
+        if older_than is not None:
+            con.execute('DELETE FROM viewer_positions WHERE touched_at < ?', (older_than,))
+
+
+# ----- Stored media -----
+# Every place a Telegram file_id is kept, as (kind, ref):
+#   ('portfolio', category_slug) - portfolio_photos rows, reviews included (REVIEWS_SLUG)
+#   ('promotion', str(promotion id)) - promotions.image_file_id
+#   ('setting', key) - single-image settings listed in MEDIA_SETTING_KEYS
+MEDIA_SETTING_KEYS = ('welcome_image_file_id',)
+
+
+def get_media_file_ids() -> list[tuple[str, str, str]]:
+    """Return (kind, ref, file_id) for every stored file_id (see MEDIA_SETTING_KEYS above)."""
+    con = _connect()
+    cur = con.cursor()
+    placeholders = ','.join('?' * len(MEDIA_SETTING_KEYS))
+    cur.execute(f'''SELECT 'portfolio', category_slug, file_id FROM portfolio_photos
+                    UNION ALL
+                    SELECT 'promotion', CAST(id AS TEXT), image_file_id FROM promotions
+                    WHERE image_file_id IS NOT NULL AND image_file_id != ''
+                    UNION ALL
+                    SELECT 'setting', key, value FROM settings
+                    WHERE key IN ({placeholders}) AND value IS NOT NULL AND value != '' ''',
+                MEDIA_SETTING_KEYS)
+    rows = cur.fetchall()
+    cur.close()
+    return rows
+
+
+def quarantine_media(broken: Iterable[tuple[str, str, str, Optional[str]]]) -> int:
+    """Take broken (kind, ref, file_id, reason) entries out of use in one transaction.
+
+    Portfolio photos are deleted with their likes (positions re-compacted, the other
+    photos' likes move with them), promotions keep their text
+    without the image, media settings are cleared. Each entry still in use is recorded in
+    media_quarantine; returns how many were.
+    """
+    quarantined = 0
+    slugs = set()
+    with _transaction() as con:
+        for kind, ref, file_id, reason in broken:
+            if kind == 'portfolio':
+                row = con.execute('SELECT position FROM portfolio_photos WHERE category_slug=? AND file_id=?',
+                                  (ref, file_id)).fetchone()
+                if row:
+                    # the photo's likes go with it; the rest move with their photos on compaction
+                    _forget_photo_likes(con, ref, row[0])
+                cur = con.execute('DELETE FROM portfolio_photos WHERE category_slug=? AND file_id=?', (ref, file_id))
+                if cur.rowcount:
+                    slugs.add(ref)
+            elif kind == 'promotion':
+                cur = con.execute('UPDATE promotions SET image_file_id=NULL WHERE id=? AND image_file_id=?',
+                                  (int(ref), file_id))
+            elif kind == 'setting' and ref in MEDIA_SETTING_KEYS:
+                cur = con.execute('DELETE FROM settings WHERE key=? AND value=?', (ref, file_id))
+                if cur.rowcount:
+                    _after_commit(lambda key=ref: _settings_cache.store(key, None))
+            else:
+                continue
+            if cur.rowcount:
+                con.execute('INSERT INTO media_quarantine(kind, ref, file_id, reason) VALUES(?,?,?,?)',
+                            (kind, ref, file_id, reason))
+                quarantined += 1
+        _compact_portfolio_positions(con.cursor(), sorted(slugs))
+    return quarantined
+
+
+# ----- Broadcast jobs -----
+# Failure reasons (see broadcast._broadcast_send_with_retry) that say the chat is gone
+UNREACHABLE_REASONS = frozenset({'unreachable'})
+# ... and chat-specific errors that may pass (see broadcast.CHAT_BAD_REQUESTS). Only these
+# count towards suppression: any other bad_request usually means the job itself is broken
+# (caption too long, bad entities, deleted copy source) and fails for every recipient, and
+# our rate limit, restarts, network errors and Telegram 5xx say nothing about the user.
+CHAT_FAILURES = frozenset({'chat_unavailable'})
+USER_FAILURES = UNREACHABLE_REASONS | CHAT_FAILURES
+SUPPRESS_AFTER_FAILURES = int(os.getenv('BROADCAST_SUPPRESS_AFTER_FAILURES', '3'))
+
+# Recipients are read from users page by page (get_user_ids_page) while the job runs.
+# Each page is claimed before sending: its rows go into broadcast_deliveries as
+# 'sending' and the job's last_user_id cursor moves past it in the same transaction,
+# so a user is never sent the same job twice. Claimed recipients that were not tried
+# before a shutdown are released back to 'pending' and go first on resume; rows left
+# in 'sending' by a crash are closed as 'interrupted' instead of being retried.
+_JOB_COLUMNS = ('id, text, image_file_id, status, created_by, chat_id, total, sent, failed, created_at, '
+                'finished_at, last_user_id, segment, suppressed, progress_message_id, media_type, media_path, '
+                'source_chat_id, source_message_ids')
+
+
+def _job_from_row(r) -> Dict:
+    return {'id': r[0], 'text': r[1], 'image_file_id': r[2], 'status': r[3], 'created_by': r[4], 'chat_id': r[5],
+            'total': r[6], 'sent': r[7], 'failed': r[8], 'created_at': r[9], 'finished_at': r[10],
+            'last_user_id': r[11], 'segment': json.loads(r[12]) if r[12] else None, 'suppressed': r[13],
+            'progress_message_id': r[14],
+            'media_type': r[15], 'media_path': r[16], 'source_chat_id': r[17],
+            'source_message_ids': json.loads(r[18]) if r[18] else None}
+
+
+def create_broadcast_job(text: str | None, image_file_id: str | None, created_by: str | None, chat_id: int | None,
+                         segment: Dict | None = None, *, media_type: str | None = None,
+                         media_path: str | None = None, source_chat_id: int | None = None,
+                         source_message_ids: list[int] | None = None, total: int | None = None,
+                         suppressed: int | None = None) -> int:
+    """Create a running job for a segment of users (all users when None).
+
+    total is the reachable audience at creation; users who join while the job runs are
+    picked up if the cursor has not passed them yet, and total is corrected on finish.
+    suppressed records how many users were skipped as unreachable. Both are counted here
+    unless the caller passes them (db_async counts in the read pool, not in the writer).
+    """
+    if total is None:
+        total = count_users(segment)
+    if suppressed is None:
+        suppressed = count_users(segment, suppressed=True)
+    with _transaction() as con:
+        cur = con.execute('''INSERT INTO broadcast_jobs(text, image_file_id, status, created_by, chat_id, total,
+                                                       segment, suppressed, media_type, media_path,
+                                                       source_chat_id, source_message_ids)
+                             VALUES(?, ?, 'running', ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                          (text, image_file_id, created_by, chat_id, total,
+                           json.dumps(segment, ensure_ascii=False) if segment else None,
+                           suppressed, media_type, media_path, source_chat_id,
+                           json.dumps(source_message_ids) if source_message_ids else None))
+        return cur.lastrowid
+
+
+def get_broadcast_job(job_id: int) -> Optional[Dict]:
+    con = _connect()
+    cur = con.cursor()
+    cur.execute(f'SELECT {_JOB_COLUMNS} FROM broadcast_jobs WHERE id=?', (job_id,))
+    r = cur.fetchone()
+    cur.close()
+    return _job_from_row(r) if r else None
+
+
+def get_running_broadcast_jobs() -> list[Dict]:
+    con = _connect()
+    cur = con.cursor()
+    cur.execute(f"SELECT {_JOB_COLUMNS} FROM broadcast_jobs WHERE status='running' ORDER BY id")
+    rows = cur.fetchall()
+    cur.close()
+    return [_job_from_row(r) for r in rows]
+
+
+def claim_broadcast_recipients(job_id: int, user_ids: list[int]) -> None:
+    """Mark a page of recipients as 'sending' and move the job cursor past it."""
+    if not user_ids:
+        return
+    with _transaction() as con:
+        con.executemany('''INSERT INTO broadcast_deliveries(job_id, user_id, status, attempted_at)
+                           VALUES(?, ?, 'sending', datetime('now'))
+                           ON CONFLICT(job_id, user_id) DO UPDATE
+                           SET status='sending', attempted_at=excluded.attempted_at
+                           WHERE status='pending' ''',
+                        [(job_id, user_id) for user_id in user_ids])
+        con.execute('UPDATE broadcast_jobs SET last_user_id=MAX(last_user_id, ?) WHERE id=?',
+                    (max(user_ids), job_id))
+
+
+def release_broadcast_recipients(job_id: int, user_ids: list[int]) -> None:
+    """Return claimed recipients that were never tried to 'pending'."""
+    with _transaction() as con:
+        con.executemany('''UPDATE broadcast_deliveries SET status='pending', attempted_at=NULL
+                           WHERE status='sending' AND job_id=? AND user_id=?''',
+                        [(job_id, user_id) for user_id in user_ids])
+
+
+def get_pending_broadcast_recipients(job_id: int) -> list[int]:
+    con = _connect()
+    cur = con.cursor()
+    cur.execute('''SELECT user_id FROM broadcast_deliveries
+                   WHERE job_id=? AND status='pending' ORDER BY user_id''', (job_id,))
+    user_ids = [r[0] for r in cur.fetchall()]
+    cur.close()
+    return user_ids
+
+
+def record_broadcast_results(job_id: int, results: list[tuple[int, bool, Optional[str]]]) -> None:
+    """Store (user_id, success, reason) outcomes of claimed recipients and bump job counters.
+
+    Also updates each user's deliverability: a blocked/deleted chat suppresses the user
+    at once, CHAT_FAILURES after SUPPRESS_AFTER_FAILURES in a row, a success resets it.
+    Other failures are kept on the delivery row only and leave the user untouched.
+    """
+    if not results:
+        return
+    sent = sum(1 for _, ok, _ in results if ok)
+    with _transaction() as con:
+        con.executemany('''UPDATE broadcast_deliveries SET status=?, reason=?
+                           WHERE status='sending' AND job_id=? AND user_id=?''',
+                        [('sent' if ok else 'failed', reason, job_id, user_id) for user_id, ok, reason in results])
+        con.execute('UPDATE broadcast_jobs SET sent=sent+?, failed=failed+? WHERE id=?',
+                    (sent, len(results) - sent, job_id))
+        con.executemany('UPDATE users SET fail_count=0 WHERE user_id=? AND fail_count<>0',
+                        [(user_id,) for user_id, ok, _ in results if ok])
+        con.executemany('''UPDATE users SET
+                               fail_count=fail_count+1,
+                               last_error=?,
+                               blocked_at=CASE WHEN ? OR fail_count+1 >= ? THEN datetime('now') END
+                           WHERE user_id=? AND blocked_at IS NULL''',
+                        [(reason, reason in UNREACHABLE_REASONS, SUPPRESS_AFTER_FAILURES, user_id)
+                         for user_id, ok, reason in results
+                         if not ok and reason in USER_FAILURES])
+
+
+def close_interrupted_broadcast_deliveries(job_id: int) -> int:
+    """Fail recipients left in 'sending' by a crash; they may already have the message."""
+    with _transaction() as con:
+        cur = con.execute('''UPDATE broadcast_deliveries SET status='failed', reason='interrupted'
+                             WHERE status='sending' AND job_id=?''', (job_id,))
+        con.execute('UPDATE broadcast_jobs SET failed=failed+? WHERE id=?', (cur.rowcount, job_id))
+        return cur.rowcount
+
+
+def set_broadcast_job_status(job_id: int, status: str) -> None:
+    """Switch a job between 'running' and 'paused' (only running jobs resume on start)."""
+    with _transaction() as con:
+        con.execute('UPDATE broadcast_jobs SET status=? WHERE id=?', (status, job_id))
+
+
+def set_broadcast_media_file_id(job_id: int, file_id: str) -> None:
+    """Remember the file_id Telegram gave an uploaded media_path, for all later sends."""
+    with _transaction() as con:
+        con.execute('UPDATE broadcast_jobs SET image_file_id=? WHERE id=?', (file_id, job_id))
+
+
+def set_broadcast_progress_message(job_id: int, message_id: int) -> None:
+    with _transaction() as con:
+        con.execute('UPDATE broadcast_jobs SET progress_message_id=? WHERE id=?', (message_id, job_id))
+
+
+def finish_broadcast_job(job_id: int, status: str = 'done') -> None:
+    with _transaction() as con:
+        con.execute("UPDATE broadcast_jobs SET status=?, finished_at=datetime('now') WHERE id=?", (status, job_id))
+        if status == 'done':
+            # the audience was read while sending, so the real total is what was attempted
+            con.execute('UPDATE broadcast_jobs SET total=sent+failed WHERE id=?', (job_id,))
+
+
+def get_broadcast_failure_reasons(job_id: int) -> Dict[str, int]:
+    con = _connect()
+    cur = con.cursor()
+    cur.execute('''SELECT COALESCE(reason, 'unknown'), COUNT(*) FROM broadcast_deliveries
+                   WHERE job_id=? AND status='failed' GROUP BY 1 ORDER BY 2 DESC''', (job_id,))
+    rows = cur.fetchall()
+    cur.close()
+    return dict(rows)
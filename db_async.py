@@ -1,16 +1,29 @@
-"""Асинхронные обёртки над синхронными функциями модуля db."""
+"""Асинхронный движок поверх синхронного модуля db.
+
+Чтения выполняются параллельно в пуле потоков с read-only соединениями (WAL позволяет
+читать во время записи). Все записи идут через один поток-писатель: он забирает из
+очереди накопившиеся операции, выполняет их в одной транзакции (group commit) и
+разрешает future каждого вызывающего только после COMMIT. Так всплески записей
+(рассылка, массовые /start, лайки) не конкурируют за блокировку SQLite.
+"""
 from __future__ import annotations
 
 import asyncio
 import functools
-from concurrent.futures import ThreadPoolExecutor
-from typing import Any, Callable, Iterable
+import json
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterable, Optional
 
 import db as _sync_db
 
 __all__ = [
     "init_db",
     "get_setting",
+    "get_setting_json",
     "set_setting",
     "get_menu",
     "save_menu",
@@ -26,21 +39,211 @@ __all__ = [
     "update_booking_time_and_category",
     "update_booking_time_category_location",
     "add_user",
+    "touch_users",
     "get_all_users",
+    "count_users",
+    "get_user_ids_page",
     "add_promotion",
     "get_active_promotions",
     "get_all_promotions",
     "delete_promotion",
     "cleanup_expired_promotions",
     "toggle_photo_like",
+    "toggle_photo_like_count",
+    "set_photo_like",
     "get_photo_likes_count",
+    "get_photo_like_states",
     "user_has_liked_photo",
     "mark_booking_reminder_sent",
     "get_due_reminders",
+    "count_portfolio_photos",
+    "get_portfolio_photo",
+    "get_portfolio_photos",
+    "add_portfolio_photo",
+    "add_portfolio_photos",
+    "delete_portfolio_photo",
+    "clear_portfolio_photos",
+    "set_portfolio_photos",
+    "get_viewer_positions",
+    "save_viewer_positions",
+    "get_media_file_ids",
+    "quarantine_media",
+    "create_broadcast_job",
+    "get_broadcast_job",
+    "get_running_broadcast_jobs",
+    "claim_broadcast_recipients",
+    "release_broadcast_recipients",
+    "get_pending_broadcast_recipients",
+    "record_broadcast_results",
+    "close_interrupted_broadcast_deliveries",
+    "set_broadcast_job_status",
+    "set_broadcast_media_file_id",
+    "set_broadcast_progress_message",
+    "finish_broadcast_job",
+    "get_broadcast_failure_reasons",
 ]
 
 
-_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="db-worker")
+# Функции, которые пишут в БД: их вызовы уходят в поток-писатель
+_WRITE_FUNCTIONS = {
+    "set_setting",
+    "save_menu",
+    "save_pending_actions",
+    "add_booking",
+    "update_booking_status",
+    "clear_all_bookings",
+    "update_booking_time_and_category",
+    "update_booking_time_category_location",
+    "add_user",
+    "touch_users",
+    "add_promotion",
+    "delete_promotion",
+    "cleanup_expired_promotions",
+    "toggle_photo_like",
+    "toggle_photo_like_count",
+    "set_photo_like",
+    "mark_booking_reminder_sent",
+    "add_portfolio_photo",
+    "add_portfolio_photos",
+    "delete_portfolio_photo",
+    "clear_portfolio_photos",
+    "set_portfolio_photos",
+    "save_viewer_positions",
+    "quarantine_media",
+    "create_broadcast_job",
+    "claim_broadcast_recipients",
+    "release_broadcast_recipients",
+    "record_broadcast_results",
+    "close_interrupted_broadcast_deliveries",
+    "set_broadcast_job_status",
+    "set_broadcast_media_file_id",
+    "set_broadcast_progress_message",
+    "finish_broadcast_job",
+}
+
+READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "4"))
+# Сколько операций из очереди писатель объединяет в одну транзакцию
+WRITE_BATCH_MAX = int(os.getenv("DB_WRITE_BATCH_MAX", "64"))
+# Размер страницы при потоковом чтении пользователей (рассылки)
+USER_PAGE_SIZE = int(os.getenv("DB_USER_PAGE_SIZE", "500"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=READ_POOL_SIZE,
+    thread_name_prefix="db-reader",
+    initializer=_sync_db.mark_thread_read_only,
+)
+
+
+class _WriteJob:
+    __slots__ = ("fn", "args", "kwargs", "future", "exclusive")
+
+    def __init__(self, fn: Callable[..., Any], args: tuple, kwargs: dict, exclusive: bool) -> None:
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        # эксклюзивная операция сама управляет транзакциями (init_db) и не попадает в пакет
+        self.exclusive = exclusive
+
+
+class _Writer:
+    """Единственный поток, который пишет в БД; операции группируются в транзакции."""
+
+    _STOP = object()
+
+    def __init__(self) -> None:
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._pending: Optional[_WriteJob] = None
+
+    def submit(self, fn: Callable[..., Any], args: tuple, kwargs: dict, exclusive: bool = False) -> Future:
+        job = _WriteJob(fn, args, kwargs, exclusive)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+            self._queue.put(job)
+        return job.future
+
+    def stop(self) -> None:
+        """Дописать уже поставленные в очередь операции и остановить поток."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._queue.put(self._STOP)
+        thread.join()
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is self._STOP:
+                break
+            if job.exclusive:
+                self._run_exclusive(job)
+                continue
+            batch = [job]
+            stop = self._collect(batch)
+            self._run_batch(batch)
+            if self._pending is not None:
+                pending, self._pending = self._pending, None
+                self._run_exclusive(pending)
+            if stop:
+                break
+
+    def _collect(self, batch: list) -> bool:
+        """Добрать в пакет то, что уже лежит в очереди. Возвращает True, если пришёл STOP."""
+        while len(batch) < WRITE_BATCH_MAX:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                return False
+            if job is self._STOP:
+                return True
+            if job.exclusive:
+                # порядок сохраняется: эксклюзивная операция выполнится сразу после пакета
+                self._pending = job
+                return False
+            batch.append(job)
+        return False
+
+    @staticmethod
+    def _run_exclusive(job: _WriteJob) -> None:
+        if not job.future.set_running_or_notify_cancel():
+            return
+        try:
+            job.future.set_result(job.fn(*job.args, **job.kwargs))
+        except BaseException as exc:
+            job.future.set_exception(exc)
+
+    @staticmethod
+    def _run_batch(batch: list) -> None:
+        batch = [job for job in batch if job.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        outcomes = []
+        try:
+            with _sync_db.write_batch():
+                for job in batch:
+                    try:
+                        outcomes.append((True, job.fn(*job.args, **job.kwargs)))
+                    except Exception as exc:
+                        # ошибка одной операции откатывает только её savepoint
+                        outcomes.append((False, exc))
+        except Exception as exc:
+            logging.exception("Group commit of %s writes failed", len(batch))
+            for job in batch:
+                job.future.set_exception(exc)
+            return
+        for job, (ok, value) in zip(batch, outcomes):
+            if ok:
+                job.future.set_result(value)
+            else:
+                job.future.set_exception(value)
+
+
+_writer = _Writer()
 
 
 def _asyncify(fn: Callable[..., Any]) -> Callable[..., Any]:
@@ -52,12 +255,94 @@ def _asyncify(fn: Callable[..., Any]) -> Callable[..., Any]:
     return wrapper
 
 
+def _asyncify_write(fn: Callable[..., Any]) -> Callable[..., Any]:
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        return await asyncio.wrap_future(_writer.submit(fn, args, kwargs))
+
+    return wrapper
+
+
 # Автоматически создаём асинхронные версии для перечисленных функций
 for _name in __all__:
-    globals()[_name] = _asyncify(getattr(_sync_db, _name))  # type: ignore[misc]
+    _fn = getattr(_sync_db, _name)
+    globals()[_name] = (_asyncify_write if _name in _WRITE_FUNCTIONS else _asyncify)(_fn)  # type: ignore[misc]
 
 
-def shutdown_executor() -> None:
-    """Завершить executor при выключении приложения."""
-    _executor.shutdown(wait=False, cancel_futures=True)
+async def init_db() -> None:
+    # init_db сам коммитит схему и миграции, поэтому выполняется вне пакета
+    await asyncio.wrap_future(_writer.submit(_sync_db.init_db, (), {}, exclusive=True))
+
+
+# Настройки: попадание в кэш обслуживаем прямо в event loop, без перехода в поток
+async def get_setting(key: str, default: Any = None) -> Any:
+    value = _sync_db.get_setting_cached(key, default)
+    if value is _sync_db.SETTING_NOT_CACHED:
+        loop = asyncio.get_running_loop()
+        value = await loop.run_in_executor(_executor, _sync_db.get_setting, key, default)
+    return value
+
+
+async def get_setting_json(key: str, default: Any = None) -> Any:
+    value = _sync_db.get_setting_json_cached(key, default)
+    if value is _sync_db.SETTING_NOT_CACHED:
+        loop = asyncio.get_running_loop()
+        value = await loop.run_in_executor(_executor, _sync_db.get_setting_json, key, default)
+    return value
+
 
+async def get_menu(default: Optional[list] = None) -> list:
+    # слияние с кнопками по умолчанию читает, а дописывает меню только писатель
+    loop = asyncio.get_running_loop()
+    menu, added = await loop.run_in_executor(_executor, _sync_db.merge_menu_defaults, default)
+    if added:
+        await save_menu(menu)
+    return menu
+
+
+# JSON сериализуем сразу в вызывающем потоке: в очередь уходит снимок словаря,
+# который обработчики продолжают менять после вызова
+async def save_menu(menu: list) -> None:
+    await set_setting("menu", json.dumps(menu, ensure_ascii=False))
+
+
+async def save_pending_actions(pending: dict) -> None:
+    await set_setting("pending_actions", json.dumps(pending, ensure_ascii=False))
+
+
+async def create_broadcast_job(text: Optional[str], image_file_id: Optional[str], created_by: Optional[str],
+                               chat_id: Optional[int], segment: Optional[dict] = None, **kwargs: Any) -> int:
+    # размер аудитории считается в пуле чтения: запросы по сегменту не должны
+    # задерживать транзакцию писателя и все записи, ждущие в его очереди
+    if kwargs.get("total") is None:
+        kwargs["total"] = await count_users(segment)
+    if kwargs.get("suppressed") is None:
+        kwargs["suppressed"] = await count_users(segment, True)
+    args = (text, image_file_id, created_by, chat_id, segment)
+    return await asyncio.wrap_future(_writer.submit(_sync_db.create_broadcast_job, args, kwargs))
+
+
+async def iter_user_id_pages(after_user_id: int = 0, page_size: int = USER_PAGE_SIZE,
+                             segment: Optional[dict] = None) -> AsyncIterator[list[int]]:
+    """Страницы id пользователей сегмента по возрастанию, начиная после after_user_id.
+
+    Каждая страница — отдельный запрос по диапазону индекса в пуле чтения,
+    поэтому в памяти держится одна страница, а первая приходит сразу.
+    """
+    while True:
+        page = await get_user_ids_page(after_user_id, page_size, segment)
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        after_user_id = page[-1]
+
+
+settings_cache_stats = _sync_db.settings_cache_stats
+
+
+def shutdown_executor() -> None:
+    """Дописать очередь записи, завершить пул чтения и закрыть соединения с БД."""
+    _writer.stop()
+    _executor.shutdown(wait=True, cancel_futures=True)
+    _sync_db.close_connections()
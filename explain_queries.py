@@ -0,0 +1,222 @@
+"""
+Проверка планов запросов db.py: каждая публичная функция вызывается на временной БД,
+все выполненные ею SQL-запросы перехватываются trace callback'ом и прогоняются через
+EXPLAIN QUERY PLAN. Если какой-то запрос читает таблицу целиком (SCAN), скрипт
+завершается с кодом 1.
+
+    python explain_queries.py [--verbose]
+
+Новая функция в db.py должна появиться в SAMPLE_CALLS (или в NOT_QUERIES), иначе
+проверка тоже упадёт. Намеренные полные проходы перечислены в FULL_SCAN_ALLOWED
+(по функции) и FULL_SCAN_ALLOWED_SQL (по точному тексту запроса).
+"""
+import argparse
+import inspect
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+_tmpdir = tempfile.TemporaryDirectory(prefix='versavija-explain-')
+os.environ['DB_PATH'] = str(Path(_tmpdir.name) / 'explain.db')
+
+import db  # noqa: E402  (DB_PATH должен быть выставлен до импорта)
+
+# Аргументы, с которыми вызывается каждая функция
+SAMPLE_CALLS = {
+    'get_setting': ('bench_key',),
+    'get_setting_json': ('bench_key',),
+    'set_setting': ('bench_key', '1'),
+    'get_menu': ([{'text': 'x', 'callback': 'x'}],),
+    'merge_menu_defaults': ([{'text': 'y', 'callback': 'y'}],),
+    'save_menu': ([],),
+    'get_pending_actions': (),
+    'save_pending_actions': ({},),
+    'add_booking': (1, 'user', 1, '2030-01-01T10:00:00', 'Семейная'),
+    'get_bookings_between': ('2030-01-01', '2030-02-01'),
+    'is_slot_taken': ('2030-01-01T10:00:00',),
+    'get_booking': (1,),
+    'get_active_booking_for_user': (1,),
+    'update_booking_time_and_category': (1, '2030-01-02T10:00:00', 'Семейная'),
+    'update_booking_time_category_location': (1, '2030-01-02T10:00:00', 'Семейная', None, None, None, None, None),
+    'update_booking_status': (1, 'confirmed'),
+    'mark_booking_reminder_sent': (1,),
+    'get_due_reminders': ('2030-01-01', '2030-02-01'),
+    'clear_all_bookings': (),
+    'add_user': (1, 'user', 'Имя', 'Фамилия'),
+    'touch_users': ([(1, '2030-01-01 10:00:00'), (2, '2030-01-01 10:00:00')],),
+    'get_all_users': (),
+    'count_users': (),
+    'get_user_ids_page': (0, 100),
+    'add_promotion': ('title', 'text', '2030-01-01', '2030-02-01', 'admin'),
+    'get_active_promotions': (),
+    'get_all_promotions': (),
+    'delete_promotion': (1,),
+    'cleanup_expired_promotions': (),
+    'toggle_photo_like': ('family', 0, 1),
+    'toggle_photo_like_count': ('family', 0, 1),
+    'set_photo_like': ('family', 0, 1, True),
+    'get_photo_likes_count': ('family', 0),
+    'get_photo_like_states': ([('family', 0), ('family', 1), ('wedding', 0)], 1),
+    'user_has_liked_photo': ('family', 0, 1),
+    'count_portfolio_photos': ('family',),
+    'get_portfolio_photo': ('family', 0),
+    'get_portfolio_photos': ('family',),
+    'add_portfolio_photo': ('family', 'file-1', 'unique-1'),
+    'add_portfolio_photos': ('family', [('file-1', 'unique-1'), ('file-9', 'unique-9')]),
+    'delete_portfolio_photo': ('family', 0),
+    'clear_portfolio_photos': ('family',),
+    'set_portfolio_photos': ('family', [('file-1', 'unique-1'), ('file-2', 'unique-2')]),
+    'get_viewer_positions': (0.0, 100),
+    'save_viewer_positions': ([(1, 'family', '2', 1e9)], [(2, 'family')], 1e8),
+    'get_media_file_ids': (),
+    'quarantine_media': ([
+        ('portfolio', 'family', 'file-1', 'wrong file identifier'),
+        ('promotion', '1', 'file-1', 'wrong file identifier'),
+        ('setting', 'welcome_image_file_id', 'file-1', 'wrong file identifier'),
+    ],),
+    'create_broadcast_job': ('text', None, 'admin', 1),
+    'get_broadcast_job': (1,),
+    'get_running_broadcast_jobs': (),
+    'claim_broadcast_recipients': (1, [1, 2]),
+    'release_broadcast_recipients': (1, [1, 2]),
+    'get_pending_broadcast_recipients': (1,),
+    'record_broadcast_results': (1, [(1, True, None), (2, False, 'unreachable')]),
+    'close_interrupted_broadcast_deliveries': (1,),
+    'set_broadcast_job_status': (1, 'paused'),
+    'set_broadcast_progress_message': (1, 100),
+    'set_broadcast_media_file_id': (1, 'file-1'),
+    'finish_broadcast_job': (1,),
+    'get_broadcast_failure_reasons': (1,),
+}
+
+# Сегменты рассылки: у каждого свой запрос, проверяются все
+_SEGMENTS = [
+    {'type': 'active', 'since': '2030-01-01 00:00:00'},
+    {'type': 'active_booking'},
+    {'type': 'liked_category', 'category': 'family'},
+    {'type': 'subscriber'},
+    {'type': 'birthday_month', 'month': 5},
+]
+EXTRA_CALLS = {
+    'get_user_ids_page': [(0, 100, segment) for segment in _SEGMENTS],
+    'count_users': [(segment,) for segment in _SEGMENTS] + [(None, True)],
+}
+
+# Служебные функции без собственных запросов к данным
+NOT_QUERIES = {
+    'init_db',
+    'schema_version',
+    'close_connections',
+    'mark_thread_read_only',
+    'write_batch',
+    'get_setting_cached',
+    'get_setting_json_cached',
+    'settings_cache_stats',
+    'clear_settings_cache',
+}
+
+# Функции, которым полный проход нужен по смыслу
+FULL_SCAN_ALLOWED = {
+    'get_all_users': 'выгрузка всех пользователей для рассылки',
+    'get_all_promotions': 'список всех акций для админа',
+    'clear_all_bookings': 'удаление всех записей',
+    'get_media_file_ids': 'все сохранённые file_id для фоновой проверки',
+}
+
+# Запросы, которым полный проход нужен по смыслу, там, где у функции есть и другие запросы
+# (сегменты рассылки обязаны идти по индексу)
+FULL_SCAN_ALLOWED_SQL = {
+    'SELECT COUNT(DISTINCT u.user_id) FROM users u WHERE u.blocked_at IS NULL':
+        'размер аудитории рассылки без сегмента (все достижимые пользователи)',
+}
+
+# Проходы по таблице или частичному индексу, которые сами и есть сегмент:
+# их стоимость равна размеру сегмента, а не таблицы users
+SEGMENT_SCANS = {
+    'SCAN b USING INDEX idx_bookings_active_user': 'только активные и подтверждённые записи',
+    'SCAN s USING COVERING INDEX idx_subscribers_birth_month': 'все подписчики канала',
+}
+
+_SKIP_PREFIXES = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'PRAGMA', '--')
+
+
+def _public_functions() -> list[str]:
+    return sorted(
+        name for name, fn in inspect.getmembers(db, inspect.isfunction)
+        if fn.__module__ == db.__name__ and not name.startswith('_')
+    )
+
+
+def _seed() -> None:
+    """Данные, на которых у каждой функции выполняются все её ветки."""
+    db.set_portfolio_photos('family', [('file-0', 'unique-0'), ('file-1', 'unique-1'), ('file-2', 'unique-2')])
+    db.add_booking(1, 'user', 1, '2030-01-01T10:00:00', 'Семейная')
+    db.add_promotion('title', 'text', '2020-01-01', '2020-02-01', 'admin')
+
+
+def _capture(name: str) -> list[str]:
+    _seed()
+    con = db._connect()
+    statements: list[str] = []
+    con.set_trace_callback(statements.append)
+    db.clear_settings_cache()
+    # иначе счётчики лайков берутся из кэша и запрос не выполняется
+    db._like_counts.clear()
+    try:
+        for args in [SAMPLE_CALLS[name], *EXTRA_CALLS.get(name, [])]:
+            getattr(db, name)(*args)
+    finally:
+        con.set_trace_callback(None)
+    unique = []
+    for sql in statements:
+        if not sql.lstrip().upper().startswith(_SKIP_PREFIXES) and sql not in unique:
+            unique.append(sql)
+    return unique
+
+
+def _plan(sql: str) -> list[str]:
+    con = db._connect()
+    return [row[3] for row in con.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--verbose', action='store_true', help='печатать планы всех запросов')
+    args = parser.parse_args()
+
+    db.init_db()
+    failures = []
+    for name in _public_functions():
+        if name in NOT_QUERIES:
+            continue
+        if name not in SAMPLE_CALLS:
+            failures.append(f'{name}: нет примера вызова в SAMPLE_CALLS')
+            continue
+        for sql in _capture(name):
+            plan = _plan(sql)
+            scans = [step for step in plan
+                     if step.startswith('SCAN') and step != 'SCAN CONSTANT ROW' and step not in SEGMENT_SCANS]
+            status = 'ok'
+            if scans:
+                allowed = name in FULL_SCAN_ALLOWED or ' '.join(sql.split()) in FULL_SCAN_ALLOWED_SQL
+                status = 'allowed' if allowed else 'SCAN'
+                if status == 'SCAN':
+                    failures.append(f'{name}: {" ".join(sql.split())}\n    ' + '\n    '.join(plan))
+            if args.verbose or status == 'SCAN':
+                print(f'[{status}] {name}: {" ".join(sql.split())}')
+                for step in plan:
+                    print(f'    {step}')
+    db.close_connections()
+
+    if failures:
+        print(f'\n{len(failures)} problem(s):', file=sys.stderr)
+        for failure in failures:
+            print(' - ' + failure, file=sys.stderr)
+        return 1
+    print('All queries use indexes.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
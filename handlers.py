@@ -3,15 +3,8 @@ import logging
 import pathlib
 import json
 import os
-from collections import Counter
-from typing import Awaitable, Callable, Optional
-
-from aiogram.exceptions import (
-    TelegramBadRequest,
-    TelegramForbiddenError,
-    TelegramNotFound,
-    TelegramRetryAfter,
-)
+from typing import Optional
+
 from aiogram.dispatcher.event.bases import SkipHandler
 from aiogram.types import Message, CallbackQuery, FSInputFile, InlineKeyboardButton, InlineKeyboardMarkup, BotCommand
 from aiogram.filters import Command
@@ -19,6 +12,8 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 
 import db_async
+from broadcast_handlers import BroadcastStates
+from user_activity import activity_tracker
 from bot_constants import DEFAULT_MENU, MENU_MESSAGES
 
 from config import bot, dp
@@ -27,22 +22,10 @@ from utils import yandex_link_for_city, parse_yandex_coords, resolve_yandex_url,
 from admin_state import ADMIN_PENDING_ACTIONS
 from admin_utils import is_admin_view_enabled, user_is_admin
 from booking_handlers import inject_booking_status_button, catch_yandex_link
-from db import (
-    get_setting,
-    set_setting,
-    save_menu,
-    get_pending_actions,
-    save_pending_actions,
-    add_user,
-    get_all_users,
-    add_promotion,
-    get_active_promotions,
-    get_all_promotions,
-    delete_promotion,
-    cleanup_expired_promotions,
-)
+from db import get_pending_actions
 from portfolio_handlers import handle_portfolio_pending_action
 from content_handlers import handle_content_pending_action, REVIEW_PENDING_USERS
+from media_validator import media_validator
 from keyboards import (
     build_main_keyboard_from_menu,
     admin_panel_keyboard,
@@ -72,16 +55,6 @@ WELCOME_TEXT = (
 )
 
 # Единые сообщения для меню с эмодзи 👇
-BROADCAST_BATCH_SIZE = 20
-BROADCAST_BATCH_DELAY = 1.0
-BROADCAST_PER_MESSAGE_DELAY = 0.05
-BROADCAST_MAX_RETRIES = 2
-
-
-class BroadcastStates(StatesGroup):
-    awaiting_text = State()
-    awaiting_image = State()
-    confirming = State()
 
 
 async def _set_static_commands() -> None:
@@ -274,22 +247,28 @@ CHILDREN_SERVICE = {
 # persisted to DB so flow survives restarts
 try:
     ADMIN_PENDING_ACTIONS: dict = get_pending_actions()
-    if ADMIN_PENDING_ACTIONS:
-        legacy = [
-            key
-            for key, value in list(ADMIN_PENDING_ACTIONS.items())
-            if (
-                (isinstance(value, dict) and value.get('action') in {'broadcast_text', 'broadcast_image'})
-                or (isinstance(value, str) and value.startswith('broadcast'))
-            )
-        ]
-        if legacy:
-            for key in legacy:
-                ADMIN_PENDING_ACTIONS.pop(key, None)
-            save_pending_actions(ADMIN_PENDING_ACTIONS)
 except Exception:
     # If DB not initialized yet, use empty dict
     ADMIN_PENDING_ACTIONS: dict = {}
+
+
+async def drop_legacy_pending_actions() -> None:
+    """Forget pending broadcast steps of the old inline flow (called once at startup)."""
+    legacy = [
+        key
+        for key, value in list(ADMIN_PENDING_ACTIONS.items())
+        if (
+            (isinstance(value, dict) and value.get('action') in {'broadcast_text', 'broadcast_image'})
+            or (isinstance(value, str) and value.startswith('broadcast'))
+        )
+    ]
+    if not legacy:
+        return
+    for key in legacy:
+        ADMIN_PENDING_ACTIONS.pop(key, None)
+    await db_async.save_pending_actions(ADMIN_PENDING_ACTIONS)
+
+
 ## Admin commands removed by request: /adminmode and refresh/sync commands
 
 
@@ -298,13 +277,8 @@ async def send_welcome(message: Message):
     username = (message.from_user.username or "").lstrip("@").lower()
     user_id = message.from_user.id
     
-    # Save user to database for broadcast functionality
-    await db_async.add_user(
-        user_id=user_id,
-        username=message.from_user.username,
-        first_name=message.from_user.first_name,
-        last_name=message.from_user.last_name,
-    )
+    # Save user to database for broadcast functionality (last_seen is flushed in batches)
+    await activity_tracker.seen(message.from_user)
     
     is_admin = await is_admin_view_enabled(username, user_id)
     # load menu from DB (default menu if none)
@@ -327,6 +301,7 @@ async def send_welcome(message: Message):
             return  # Успешно отправили, выходим
         except Exception:
             logging.exception('Failed to send photo by file_id, will try local file')
+            media_validator.suspect(image_file_id)
     
     # Fallback to local file
     media_path = pathlib.Path(__file__).parent / 'media' / 'greetings.png'
@@ -455,7 +430,7 @@ async def update_promotion_message(query, promotion_idx: int, promotions: list,
 async def show_promotion(message, promotion_idx: int, promotions: list = None, is_admin: bool = False):
     """Show a specific promotion with navigation."""
     if promotions is None:
-        promotions = get_active_promotions()
+        promotions = await db_async.get_active_promotions()
     
     if not promotions:
         if is_admin:
@@ -499,6 +474,7 @@ async def show_promotion(message, promotion_idx: int, promotions: list = None, i
             await message.answer(text, reply_markup=kb)
     except Exception as e:
         logging.warning(f"Failed to send promotion: {e}")
+        media_validator.suspect(image_file_id)
         await message.answer(text, reply_markup=kb)
 
 
@@ -514,10 +490,10 @@ async def cmd_promotions(message: Message):
     username = (message.from_user.username or "").lstrip("@").lower()
     
     # Cleanup expired promotions first
-    cleanup_expired_promotions()
+    await db_async.cleanup_expired_promotions()
     
     # Get active promotions
-    promotions = get_active_promotions()
+    promotions = await db_async.get_active_promotions()
     is_admin = await is_admin_view_enabled(username, message.from_user.id)
     
     if not promotions:
@@ -558,6 +534,9 @@ async def handle_callback(query: CallbackQuery, state: FSMContext):
     ):
         raise SkipHandler()
 
+    if data_raw and (data_raw == 'admin_broadcast' or data.startswith('broadcast_')):
+        raise SkipHandler()
+
     if data_raw and (
         data_raw == 'reviews'
         or data_raw == 'social'
@@ -590,10 +569,10 @@ async def handle_callback(query: CallbackQuery, state: FSMContext):
 
     if data == "promotions":
         # Cleanup expired promotions first
-        cleanup_expired_promotions()
+        await db_async.cleanup_expired_promotions()
         
         # Get active promotions
-        promotions = get_active_promotions()
+        promotions = await db_async.get_active_promotions()
         is_admin = await is_admin_view_enabled(username, query.from_user.id)
         
         if not promotions:
@@ -615,10 +594,10 @@ async def handle_callback(query: CallbackQuery, state: FSMContext):
     # Handle promotion navigation
     if data.startswith("promo_prev:") or data.startswith("promo_next:"):
         # Cleanup expired promotions first
-        cleanup_expired_promotions()
+        await db_async.cleanup_expired_promotions()
         
         # Get active promotions
-        promotions = get_active_promotions()
+        promotions = await db_async.get_active_promotions()
         is_admin = await is_admin_view_enabled(username, query.from_user.id)
         
         if not promotions:
@@ -740,100 +719,6 @@ async def handle_callback(query: CallbackQuery, state: FSMContext):
         return
     
     # booking flow handled later (remove early stub)
-async def perform_broadcast(text: str, image_file_id: str = None, message: Message = None):
-    """Send broadcast message to all users."""
-    async def _send_to_user(user_id: int) -> tuple[bool, Optional[str]]:
-        """Helper that dispatches message/photo to конкретного пользователя."""
-
-        async def _dispatch() -> None:
-            if image_file_id:
-                await bot.send_photo(user_id, image_file_id, caption=text)
-            else:
-                await bot.send_message(user_id, text)
-
-        return await _broadcast_send_with_retry(user_id, _dispatch, max_retries=BROADCAST_MAX_RETRIES)
-
-    users = await asyncio.to_thread(get_all_users)
-    total = len(users)
-    sent = 0
-    failures = Counter()
-
-    broadcast_type = "с изображением" if image_file_id else "только текст"
-    if message:
-        await message.answer(f"📤 Начинаю рассылку ({broadcast_type}) для {total} пользователей...")
-
-    if total == 0:
-        if message:
-            await message.answer("ℹ️ В базе нет получателей для рассылки.")
-        return
-
-    for idx, (user_id, username, first_name, last_name) in enumerate(users, start=1):
-        success, reason = await _send_to_user(user_id)
-        if success:
-            sent += 1
-        else:
-            failures[reason or 'unknown'] += 1
-
-        # Плавное ограничение скорости: небольшая пауза между сообщениями
-        if idx < total:
-            if idx % BROADCAST_BATCH_SIZE == 0:
-                await asyncio.sleep(BROADCAST_BATCH_DELAY)
-            else:
-                await asyncio.sleep(BROADCAST_PER_MESSAGE_DELAY)
-
-    failed = total - sent
-
-    summary_lines = [
-        "✅ Рассылка завершена!",
-        f"📨 Отправлено: {sent}",
-        f"❌ Не доставлено: {failed}",
-        f"📊 Всего пользователей: {total}",
-    ]
-    if failures:
-        breakdown = ', '.join(f"{reason}: {count}" for reason, count in failures.most_common())
-        summary_lines.append(f"ℹ️ Причины недоставки: {breakdown}")
-
-    result_text = "\n".join(summary_lines)
-    if message:
-        await message.answer(result_text)
-
-
-async def _broadcast_send_with_retry(
-    user_id: int,
-    dispatcher: Callable[[], Awaitable[None]],
-    max_retries: int = 2,
-) -> tuple[bool, Optional[str]]:
-    """Отправить сообщение пользователю с учётом FloodWait/retry.
-
-    Возвращает (success: bool, reason: str | None).
-    """
-    attempt = 0
-    while True:
-        try:
-            await dispatcher()
-            return True, None
-        except TelegramRetryAfter as exc:
-            attempt += 1
-            if attempt > max_retries:
-                logging.warning('FloodWait limit для %s: %s', user_id, exc)
-                return False, 'flood_wait'
-            delay = exc.retry_after + 0.5
-            logging.info('FloodWait %ss при рассылке пользователю %s, повтор #%s', delay, user_id, attempt)
-            await asyncio.sleep(delay)
-        except (TelegramForbiddenError, TelegramNotFound) as exc:
-            logging.info('Пользователь %s недоступен для рассылки: %s', user_id, exc)
-            return False, 'unreachable'
-        except TelegramBadRequest as exc:
-            logging.warning('Неверный запрос при рассылке пользователю %s: %s', user_id, exc)
-            return False, 'bad_request'
-        except Exception as exc:
-            attempt += 1
-            logging.warning('Ошибка рассылки пользователю %s (попытка %s/%s): %s', user_id, attempt, max_retries + 1, exc)
-            if attempt > max_retries:
-                return False, exc.__class__.__name__.lower()
-            await asyncio.sleep(1.0)
-
-
 @dp.message()
 async def handle_admin_pending(message: Message, state: FSMContext):
     username = (message.from_user.username or "").lstrip("@").lower()
@@ -843,17 +728,10 @@ async def handle_admin_pending(message: Message, state: FSMContext):
 
     current_state = await state.get_state()
     if current_state in BroadcastStates.__all_states__:
-        # Обработка рассылки выполняется отдельными хендлерами
-        return
+        # Обработка рассылки выполняется отдельными хендлерами (broadcast_router)
+        raise SkipHandler()
 
-    try:
-        pend_raw = await db_async.get_setting(f'pending_booking_{message.from_user.id}', None)
-        if pend_raw:
-            pend = json.loads(pend_raw)
-        else:
-            pend = None
-    except Exception:
-        pend = None
+    pend = await db_async.get_setting_json(f'pending_booking_{message.from_user.id}', None)
     if isinstance(pend, dict) and pend.get('await_loc'):
         await catch_yandex_link(message)
         return
@@ -881,7 +759,7 @@ async def handle_admin_pending(message: Message, state: FSMContext):
     logging.info('Admin pending action for %s: %s', username, a)
     if a == 'add_photo_cat' and message.from_user.id in REVIEW_PENDING_USERS:
         ADMIN_PENDING_ACTIONS[username] = {'action': 'add_review', 'payload': {}}
-        save_pending_actions(ADMIN_PENDING_ACTIONS)
+        await db_async.save_pending_actions(ADMIN_PENDING_ACTIONS)
         a = 'add_review'
 
     if await handle_portfolio_pending_action(message, username, a, payload):
@@ -900,7 +778,7 @@ async def handle_admin_pending(message: Message, state: FSMContext):
             return
         
         ADMIN_PENDING_ACTIONS[username] = {'action': 'add_promotion_description', 'payload': {'title': title}}
-        save_pending_actions(ADMIN_PENDING_ACTIONS)
+        await db_async.save_pending_actions(ADMIN_PENDING_ACTIONS)
         await message.answer(f'✅ Заголовок сохранён: "{title}"\n\n📝 Теперь пришлите описание акции:')
         return
     
@@ -918,7 +796,7 @@ async def handle_admin_pending(message: Message, state: FSMContext):
             'action': 'add_promotion_image', 
             'payload': {'title': title, 'description': description}
         }
-        save_pending_actions(ADMIN_PENDING_ACTIONS)
+        await db_async.save_pending_actions(ADMIN_PENDING_ACTIONS)
         await message.answer(f'✅ Описание сохранено\n\n🖼️ Теперь пришлите изображение для акции:', reply_markup=build_promotion_image_keyboard())
         return
     
@@ -945,7 +823,7 @@ async def handle_admin_pending(message: Message, state: FSMContext):
             'action': 'add_promotion_start_date', 
             'payload': {'title': title, 'description': description, 'image_file_id': image_file_id}
         }
-        save_pending_actions(ADMIN_PENDING_ACTIONS)
+        await db_async.save_pending_actions(ADMIN_PENDING_ACTIONS)
         from datetime import datetime
         await message.answer('✅ Изображение сохранено\n\n📅 Выберите дату начала акции:', reply_markup=build_promotion_date_keyboard(datetime.now().year, datetime.now().month, 'promo_start_date'))
         return
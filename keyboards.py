@@ -151,7 +151,7 @@ def build_add_photos_in_progress_kb(slug: str, count: int) -> InlineKeyboardMark
 
 
 def build_category_photo_nav_keyboard(slug: str, idx: int, user_id: int = None, likes_count: int = 0, user_has_liked: bool = False) -> InlineKeyboardMarkup:
-    """Keyboard for navigating photos inside a category (random shuffle on each click). idx is current photo index."""
+    """Keyboard for navigating photos inside a category (next photo of the viewer's shuffled walk on each click, see photo_walk). idx is current photo index."""
     buttons = []
     
     # Navigation row with like button in the middle
@@ -327,11 +327,50 @@ def build_broadcast_image_keyboard() -> InlineKeyboardMarkup:
     ])
 
 
-def build_broadcast_confirm_keyboard() -> InlineKeyboardMarkup:
-    """Keyboard for broadcast confirmation."""
+def build_broadcast_confirm_keyboard(audience: Optional[str] = None) -> InlineKeyboardMarkup:
+    """Keyboard for broadcast confirmation; with audience, a row to change the segment."""
+    rows = [[InlineKeyboardButton(text="✅ Отправить", callback_data="broadcast_confirm")]]
+    if audience:
+        rows.append([InlineKeyboardButton(text=f"🎯 Аудитория: {audience}", callback_data="broadcast_segment")])
+    rows.append([InlineKeyboardButton(text="❌ Отмена", callback_data="broadcast_cancel")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def build_broadcast_segment_keyboard() -> InlineKeyboardMarkup:
+    """Audience segments for a broadcast."""
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✅ Отправить", callback_data="broadcast_confirm")],
-        [InlineKeyboardButton(text="❌ Отмена", callback_data="broadcast_cancel")]
+        [InlineKeyboardButton(text="👥 Все пользователи", callback_data="broadcast_segment:all")],
+        [
+            InlineKeyboardButton(text="🕒 Активные за 7 дней", callback_data="broadcast_segment:active_7"),
+            InlineKeyboardButton(text="🕒 За 30 дней", callback_data="broadcast_segment:active_30"),
+        ],
+        [InlineKeyboardButton(text="📅 С активной записью", callback_data="broadcast_segment:booking")],
+        [InlineKeyboardButton(text="❤️ Лайкали категорию…", callback_data="broadcast_segment:liked")],
+        [InlineKeyboardButton(text="📢 Подписчики канала", callback_data="broadcast_segment:subscriber")],
+        [InlineKeyboardButton(text="🎂 Именинники месяца", callback_data="broadcast_segment:birthday")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="broadcast_segment:back")],
+    ])
+
+
+def build_broadcast_category_keyboard(categories: list) -> InlineKeyboardMarkup:
+    """Portfolio categories for the 'liked a category' segment."""
+    rows = [
+        [InlineKeyboardButton(text=c.get('text', c.get('slug')), callback_data=f"broadcast_segment:liked:{c['slug']}")]
+        for c in categories if isinstance(c, dict) and c.get('slug')
+    ]
+    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="broadcast_segment")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def build_broadcast_progress_keyboard(job_id: int, paused: bool = False) -> InlineKeyboardMarkup:
+    """Pause/resume and stop buttons under a broadcast progress message."""
+    toggle = (
+        InlineKeyboardButton(text="▶️ Продолжить", callback_data=f"broadcast_job_resume:{job_id}")
+        if paused else
+        InlineKeyboardButton(text="⏸ Пауза", callback_data=f"broadcast_job_pause:{job_id}")
+    )
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [toggle, InlineKeyboardButton(text="⏹ Остановить", callback_data=f"broadcast_job_cancel:{job_id}")]
     ])
 
 
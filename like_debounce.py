@@ -0,0 +1,138 @@
+"""Склейка быстрых нажатий ❤️ под фото портфолио.
+
+Нажатия одного пользователя на одно сообщение, пришедшие в пределах
+LIKE_DEBOUNCE_SECONDS друг от друга, считаются одной серией. Каждое нажатие сразу
+получает ответ (query.answer) с текущим состоянием лайка, а в БД пишется только итог
+серии — одной записью db_async.set_photo_like — и клавиатура правится один раз. Если
+итог совпал с исходным состоянием (двойной тап), нет ни записи, ни правки.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+
+import db_async
+from keyboards import build_category_photo_nav_keyboard
+
+LIKE_DEBOUNCE_SECONDS = float(os.getenv('LIKE_DEBOUNCE_SECONDS', '0.8'))
+
+# (user_id, chat_id, message_id)
+_BurstKey = tuple[int, int, int]
+
+
+class _LikeBurst:
+    __slots__ = ('slug', 'idx', 'message', 'taps', 'deadline', 'base', 'task')
+
+    def __init__(self, slug: str, idx: int, message: Message, base: asyncio.Task) -> None:
+        self.slug = slug
+        self.idx = idx
+        self.message = message
+        self.taps = 0
+        self.deadline = 0.0
+        # состояние лайка до серии
+        self.base = base
+        self.task: Optional[asyncio.Task] = None
+
+
+class LikeDebouncer:
+    def __init__(self, window: float = LIKE_DEBOUNCE_SECONDS) -> None:
+        self.window = window
+        self._bursts: dict[_BurstKey, _LikeBurst] = {}
+        # записи итогов, которые ещё идут: следующая серия читает состояние после них
+        self._writes: dict[_BurstKey, asyncio.Future] = {}
+
+    async def tap(self, user_id: int, message: Message, slug: str, idx: int) -> bool:
+        """Учесть нажатие и вернуть, стоит ли лайк после него."""
+        key = (user_id, message.chat.id, message.message_id)
+        burst = self._bursts.get(key)
+        if burst is not None and (burst.slug, burst.idx) != (slug, idx):
+            # сообщение уже показывает другое фото: прежнюю серию записать без правки
+            await self._flush(key, burst, edit=False)
+            burst = None
+        loop = asyncio.get_running_loop()
+        if burst is None:
+            base = asyncio.ensure_future(self._read_state(key, slug, idx))
+            burst = _LikeBurst(slug, idx, message, base)
+            self._bursts[key] = burst
+            burst.task = asyncio.create_task(self._run(key, burst))
+        burst.taps += 1
+        taps = burst.taps
+        burst.deadline = loop.time() + self.window
+        liked = (await asyncio.shield(burst.base))[(slug, idx)][1]
+        return liked if taps % 2 == 0 else not liked
+
+    async def settle(self, user_id: int, message: Message) -> None:
+        """Записать серию на этом сообщении без правки клавиатуры (перед сменой фото)."""
+        key = (user_id, message.chat.id, message.message_id)
+        burst = self._bursts.get(key)
+        if burst is not None:
+            await self._flush(key, burst, edit=False)
+
+    async def flush(self) -> None:
+        """Записать все незавершённые серии (при остановке бота)."""
+        for key, burst in list(self._bursts.items()):
+            await self._flush(key, burst, edit=False)
+
+    async def _read_state(self, key: _BurstKey, slug: str, idx: int) -> dict:
+        write = self._writes.get(key)
+        if write is not None:
+            await asyncio.wait([write])
+        return await db_async.get_photo_like_states([(slug, idx)], key[0])
+
+    async def _run(self, key: _BurstKey, burst: _LikeBurst) -> None:
+        loop = asyncio.get_running_loop()
+        # каждое новое нажатие отодвигает deadline
+        while (delay := burst.deadline - loop.time()) > 0:
+            await asyncio.sleep(delay)
+        await self._flush(key, burst, edit=True)
+
+    async def _flush(self, key: _BurstKey, burst: _LikeBurst, edit: bool) -> None:
+        if self._bursts.get(key) is not burst:
+            return
+        del self._bursts[key]
+        if burst.task is not None and burst.task is not asyncio.current_task():
+            burst.task.cancel()
+        write = asyncio.ensure_future(self._save(key[0], burst))
+        self._writes[key] = write
+        try:
+            saved = await write
+        except Exception:
+            logging.exception('Failed to save like for %s/%s by %s', burst.slug, burst.idx, key[0])
+            return
+        finally:
+            if self._writes.get(key) is write:
+                del self._writes[key]
+        if saved is None or not edit:
+            return
+        liked, likes_count = saved
+        keyboard = build_category_photo_nav_keyboard(burst.slug, burst.idx, key[0], likes_count, liked)
+        try:
+            await burst.message.edit_reply_markup(reply_markup=keyboard)
+        except TelegramBadRequest as exc:
+            if 'not modified' not in str(exc):
+                logging.warning('Failed to update like button: %s', exc)
+        except Exception as exc:
+            logging.warning('Failed to update like button: %s', exc)
+
+    @staticmethod
+    async def _save(user_id: int, burst: _LikeBurst) -> Optional[tuple[bool, int]]:
+        """Записать итог серии; None, если он совпал с исходным состоянием."""
+        liked = (await burst.base)[(burst.slug, burst.idx)][1]
+        if burst.taps % 2 == 0:
+            return None
+        _, likes_count = await db_async.set_photo_like(burst.slug, burst.idx, user_id, not liked)
+        return not liked, likes_count
+
+
+like_debouncer = LikeDebouncer()
+
+
+__all__ = [
+    "LikeDebouncer",
+    "like_debouncer",
+]
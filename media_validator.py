@@ -0,0 +1,203 @@
+"""Фоновая проверка сохранённых file_id (портфолио, отзывы, акции, фото приветствия).
+
+Раз в MEDIA_CHECK_INTERVAL секунд все file_id из БД проверяются через bot.get_file
+пачками по MEDIA_CHECK_BATCH с паузой MEDIA_CHECK_BATCH_DELAY между ними. Ошибка
+Telegram засчитывается, только если её текст из BROKEN_FILE_ERRORS; file_id, который
+так не прошёл MEDIA_QUARANTINE_AFTER проверок подряд (с промежутком не меньше
+MEDIA_FAILURE_SPACING секунд), снимается с показа одной записью
+(db_async.quarantine_media) и попадает в отчёт админам. Так временный сбой Telegram
+не удаляет фотографии. Обработчики не чистят данные сами: при неудачной отправке они
+только сообщают file_id через suspect(), и такие file_id проверяются вне очереди.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+import db_async
+from admin_utils import get_all_admin_ids
+from config import bot
+from portfolio_catalog import REVIEWS_SLUG, portfolio_catalog
+from portfolio_state import reset_last_category_position
+
+MEDIA_CHECK_INTERVAL = float(os.getenv('MEDIA_CHECK_INTERVAL', str(6 * 3600)))
+MEDIA_CHECK_BATCH = int(os.getenv('MEDIA_CHECK_BATCH', '20'))
+MEDIA_CHECK_BATCH_DELAY = float(os.getenv('MEDIA_CHECK_BATCH_DELAY', '2'))
+# первая полная проверка — вскоре после запуска, а не через целый интервал
+MEDIA_CHECK_START_DELAY = float(os.getenv('MEDIA_CHECK_START_DELAY', '60'))
+# жалобы из обработчиков копятся столько секунд и проверяются одной пачкой
+MEDIA_SUSPECT_DELAY = float(os.getenv('MEDIA_SUSPECT_DELAY', '10'))
+# сколько раздельных неудачных проверок нужно, чтобы снять file_id с показа
+MEDIA_QUARANTINE_AFTER = int(os.getenv('MEDIA_QUARANTINE_AFTER', '3'))
+# неудачи чаще этого интервала считаются одной (серия жалоб во время сбоя Telegram)
+MEDIA_FAILURE_SPACING = float(os.getenv('MEDIA_FAILURE_SPACING', '3600'))
+
+# Тексты ошибок get_file, которые говорят о самом file_id. Остальные (включая новые
+# формулировки Telegram) не засчитываются: лучше показать битое фото, чем удалить целое.
+BROKEN_FILE_ERRORS = (
+    'wrong file_id',
+    'wrong file identifier',
+    'wrong remote file identifier',
+    'invalid file_id',
+    'file_id_invalid',
+)
+
+# (kind, ref, file_id, reason) — см. db.get_media_file_ids
+_Broken = tuple[str, str, str, str]
+
+
+def _describe(kind: str, ref: str) -> str:
+    if kind == 'portfolio':
+        return 'отзывы' if ref == REVIEWS_SLUG else f'портфолио «{ref}»'
+    if kind == 'promotion':
+        return f'акция #{ref}'
+    if ref == 'welcome_image_file_id':
+        return 'фото приветствия'
+    return f'{kind} {ref}'
+
+
+class MediaValidator:
+    def __init__(self, interval: float = MEDIA_CHECK_INTERVAL, batch_size: int = MEDIA_CHECK_BATCH,
+                 batch_delay: float = MEDIA_CHECK_BATCH_DELAY) -> None:
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self.batch_delay = batch_delay
+        self._suspects: set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._check_lock = asyncio.Lock()
+        # file_id -> (неудачных проверок подряд, loop.time() последней засчитанной)
+        self._failures: dict[str, tuple[int, float]] = {}
+
+    def suspect(self, file_id: Optional[str]) -> None:
+        """Отметить file_id, который не удалось отправить: он будет проверен вне очереди."""
+        if file_id and self._task is not None:
+            self._suspects.add(file_id)
+            self._wakeup.set()
+
+    async def check(self, only: Optional[set[str]] = None) -> list[_Broken]:
+        """Проверить сохранённые file_id (все или только only) и снять с показа нерабочие."""
+        async with self._check_lock:
+            by_file: dict[str, list[tuple[str, str]]] = {}
+            for kind, ref, file_id in await db_async.get_media_file_ids():
+                if only is None or file_id in only:
+                    by_file.setdefault(file_id, []).append((kind, ref))
+            file_ids = list(by_file)
+            broken: list[_Broken] = []
+            for start in range(0, len(file_ids), self.batch_size):
+                if start:
+                    await asyncio.sleep(self.batch_delay)
+                batch = file_ids[start:start + self.batch_size]
+                reasons = await asyncio.gather(*(self._check_file(file_id) for file_id in batch))
+                for file_id, reason in zip(batch, reasons):
+                    if reason is None:
+                        self._failures.pop(file_id, None)
+                    elif self._strike(file_id):
+                        broken.extend((kind, ref, file_id, reason) for kind, ref in by_file[file_id])
+            logging.info('Checked %s stored file_id(s), %s broken', len(file_ids), len(broken))
+            if broken:
+                await self._quarantine(broken)
+                for file_id in {file_id for _, _, file_id, _ in broken}:
+                    self._failures.pop(file_id, None)
+            return broken
+
+    def _strike(self, file_id: str) -> bool:
+        """Засчитать неудачную проверку; True, когда file_id пора снять с показа."""
+        now = asyncio.get_running_loop().time()
+        count, last = self._failures.get(file_id, (0, 0.0))
+        if not count or now - last >= MEDIA_FAILURE_SPACING:
+            count, last = count + 1, now
+            self._failures[file_id] = (count, last)
+        return count >= MEDIA_QUARANTINE_AFTER
+
+    @staticmethod
+    async def _check_file(file_id: str) -> Optional[str]:
+        """Причина, по которой file_id похож на нерабочий, или None (рабочий или неизвестно)."""
+        for _ in range(3):
+            try:
+                await bot.get_file(file_id)
+                return None
+            except TelegramRetryAfter as exc:
+                await asyncio.sleep(exc.retry_after)
+            except TelegramBadRequest as exc:
+                message = exc.message.lower()
+                if any(text in message for text in BROKEN_FILE_ERRORS):
+                    return exc.message
+                # файлы больше 20 МБ бот не может скачать, но отправлять их можно
+                if 'too big' in message:
+                    return None
+                logging.warning('Unrecognised get_file error for %s, not counted: %s', file_id, exc.message)
+                return None
+            except Exception as exc:
+                # сеть и т.п. ничего не говорят о самом файле: проверим в следующий раз
+                logging.warning('Failed to check file_id %s: %s', file_id, exc)
+                return None
+        return None
+
+    async def _quarantine(self, broken: list[_Broken]) -> None:
+        await db_async.quarantine_media(broken)
+        # позиции в категориях сдвинулись: перечитать их и начать обходы заново
+        for slug in {ref for kind, ref, _, _ in broken if kind == 'portfolio'}:
+            portfolio_catalog.invalidate(slug)
+            reset_last_category_position('reviews' if slug == REVIEWS_SLUG else slug)
+        await self._report(broken)
+
+    @staticmethod
+    async def _report(broken: list[_Broken]) -> None:
+        counts: dict[str, int] = {}
+        for kind, ref, _, _ in broken:
+            place = _describe(kind, ref)
+            counts[place] = counts.get(place, 0) + 1
+        lines = [f'🩹 Найдены недоступные в Telegram файлы ({len(broken)}), они сняты с показа:']
+        lines += [f'• {place}: {count}' for place, count in sorted(counts.items())]
+        lines.append('Загрузите их заново, если они нужны.')
+        text = '\n'.join(lines)
+        for admin_id in await get_all_admin_ids():
+            try:
+                await bot.send_message(admin_id, text)
+            except Exception:
+                pass
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_full = loop.time() + MEDIA_CHECK_START_DELAY
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, next_full - loop.time()))
+            except asyncio.TimeoutError:
+                only = None
+                next_full = loop.time() + self.interval
+            else:
+                await asyncio.sleep(MEDIA_SUSPECT_DELAY)
+                self._wakeup.clear()
+                only, self._suspects = self._suspects, set()
+            try:
+                await self.check(only)
+            except Exception:
+                logging.exception('Failed to check stored media')
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+media_validator = MediaValidator()
+
+
+__all__ = [
+    "MediaValidator",
+    "media_validator",
+]
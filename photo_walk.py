@@ -0,0 +1,74 @@
+"""Перемешанный обход фото категории без повторов.
+
+Каждый зритель идёт по своей псевдослучайной перестановке позиций 0..n-1 и видит
+каждое фото ровно один раз, прежде чем круг начнётся заново (с новой перестановкой).
+Перестановка не хранится: её задаёт seed, а позиция в круге — step, так что состояние
+зрителя — пара (seed, step) независимо от числа фото.
+
+Перестановка — сеть Фейстеля с ключом seed над областью 4**half >= n (format-preserving:
+любое число области переходит в число той же области). Числа >= текущего n
+пропускаются, поэтому добавленные в конец фото не ломают круг: их позиции просто
+перестают пропускаться, а уже показанные фото не повторяются. Размер области
+фиксируется в начале круга (младшие биты seed); фото сверх неё войдут в следующий круг.
+"""
+from __future__ import annotations
+
+import hashlib
+import random
+from typing import Any, Optional
+
+_ROUNDS = 4
+# младшие биты seed — half (размер половины блока в битах)
+_HALF_BITS = 5
+_HALF_MASK = (1 << _HALF_BITS) - 1
+
+WalkState = tuple[int, int]
+
+
+def _round(seed: int, rnd: int, value: int, mask: int) -> int:
+    digest = hashlib.blake2b(f'{seed}:{rnd}:{value}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') & mask
+
+
+def _permute(seed: int, x: int) -> int:
+    half = seed & _HALF_MASK
+    mask = (1 << half) - 1
+    left, right = x >> half, x & mask
+    for rnd in range(_ROUNDS):
+        left, right = right, left ^ _round(seed, rnd, right, mask)
+    return (left << half) | right
+
+
+def _new_seed(total: int) -> int:
+    half = max(1, ((total - 1).bit_length() + 1) // 2)
+    return (random.getrandbits(32) << _HALF_BITS) | half
+
+
+def _parse(state: Any) -> Optional[WalkState]:
+    # из БД состояние возвращается JSON-списком; прежний формат (номер фото) не подходит
+    if isinstance(state, (list, tuple)) and len(state) == 2 and all(isinstance(v, int) for v in state):
+        return state[0], state[1]
+    return None
+
+
+def next_photo(state: Any, total: int) -> tuple[int, WalkState]:
+    """Следующая позиция обхода для total фото (total > 0) и новое состояние зрителя.
+
+    state — прежнее состояние (или None для нового зрителя).
+    """
+    parsed = _parse(state)
+    seed, step = parsed if parsed is not None else (_new_seed(total), 0)
+    while True:
+        if step >= 1 << (2 * (seed & _HALF_MASK)):
+            # круг пройден: новая перестановка под текущее число фото
+            seed, step = _new_seed(total), 0
+        idx = _permute(seed, step)
+        step += 1
+        if idx < total:
+            return idx, (seed, step)
+
+
+__all__ = [
+    "WalkState",
+    "next_photo",
+]
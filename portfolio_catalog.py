@@ -0,0 +1,223 @@
+"""Каталог портфолио в памяти: категории по slug и списки фото по категориям.
+
+Категории читаются из настройки portfolio_categories один раз, фото категории — при
+первом обращении к ней; дальше просмотр портфолио не обращается к БД. Изменения из
+админки идут через методы каталога: они пишут в БД и сразу обновляют память, а
+version растёт на каждое изменение (для кэшей, построенных поверх каталога).
+Скрипты, меняющие data.db в обход бота, подхватываются после invalidate() или
+перезапуска.
+
+Отзывы хранятся так же — как скрытая категория REVIEWS_SLUG (её нет в categories()).
+Повторы отсекает БД по file_unique_id: Telegram выдаёт одному изображению разные
+file_id, а file_unique_id у него один.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Optional
+
+import db_async
+from db import REVIEWS_SLUG
+
+DEFAULT_PORTFOLIO_CATEGORIES = [
+    {"text": "👨‍👩‍👧‍👦 Семейная", "slug": "family"},
+    {"text": "💕 Love Story", "slug": "love_story"},
+    {"text": "👤 Индивидуальная", "slug": "personal"},
+    {"text": "🎉 Репортажная (банкеты, мероприятия)", "slug": "reportage"},
+    {"text": "💍 Свадебная", "slug": "wedding"},
+    {"text": "💋 Lingerie (будуарная)", "slug": "lingerie"},
+    {"text": "👶 Детская (школы/садики)", "slug": "children"},
+    {"text": "👩‍👶 Мама с ребёнком", "slug": "mom_child"},
+    {"text": "✝️ Крещение", "slug": "baptism"},
+    {"text": "⛪ Венчание", "slug": "wedding_church"},
+]
+
+
+class PortfolioCatalog:
+    def __init__(self) -> None:
+        self._categories: Optional[list[dict]] = None
+        self._by_slug: dict[str, dict] = {}
+        self._photos: dict[str, list[str]] = {}
+        self.version = 0
+        # загрузка и изменения по очереди: правка не должна потеряться при параллельной загрузке
+        self._lock = asyncio.Lock()
+
+    # --- чтение ---------------------------------------------------------------
+
+    async def categories(self) -> list[dict]:
+        """Категории в порядке показа. Общий список: не изменять, правки — через методы каталога."""
+        if self._categories is None:
+            async with self._lock:
+                await self._load_categories()
+        return self._categories
+
+    async def category(self, slug: str) -> Optional[dict]:
+        await self.categories()
+        return self._by_slug.get(slug)
+
+    async def title(self, slug: str) -> str:
+        cat = await self.category(slug)
+        return cat.get('text', slug) if cat else slug
+
+    async def photos(self, slug: str) -> list[str]:
+        """file_id фото категории по порядку. Общий список: не изменять."""
+        photos = self._photos.get(slug)
+        if photos is None:
+            async with self._lock:
+                photos = await self._load_photos(slug)
+        return photos
+
+    async def count(self, slug: str) -> int:
+        return len(await self.photos(slug))
+
+    async def photo(self, slug: str, idx: int) -> Optional[str]:
+        photos = await self.photos(slug)
+        return photos[idx] if 0 <= idx < len(photos) else None
+
+    # --- изменения из админки --------------------------------------------------
+
+    async def add_category(self, title: str, slug: str) -> bool:
+        """Добавить категорию; False, если slug уже занят."""
+        async with self._lock:
+            cats = await self._load_categories()
+            if slug in self._by_slug or slug == REVIEWS_SLUG:
+                return False
+            await self._save_categories([*cats, {'text': title, 'slug': slug}])
+        return True
+
+    async def rename_category(self, slug: str, title: str) -> Optional[str]:
+        """Переименовать категорию; возвращает прежнее название или None, если её нет."""
+        async with self._lock:
+            cats = await self._load_categories()
+            cat = self._by_slug.get(slug)
+            if cat is None:
+                return None
+            await self._save_categories([{**c, 'text': title} if c is cat else c for c in cats])
+        return cat.get('text')
+
+    async def remove_category(self, slug: str) -> Optional[tuple[dict, list[tuple[str, Optional[str]]]]]:
+        """Удалить категорию вместе с фото; возвращает (категория, фото) для отмены или None.
+
+        Фото — пары (file_id, file_unique_id): после отмены повторы по-прежнему отсекаются.
+        """
+        async with self._lock:
+            cats = await self._load_categories()
+            cat = self._by_slug.get(slug)
+            if cat is None:
+                return None
+            photos = await db_async.clear_portfolio_photos(slug)
+            self._photos[slug] = []
+            await self._save_categories([c for c in cats if c is not cat])
+        return cat, photos
+
+    async def restore_category(self, cat: dict, photos: Optional[list[tuple[str, Optional[str]]]] = None) -> None:
+        """Вернуть удалённую категорию в конец списка (и её фото, если переданы)."""
+        async with self._lock:
+            cats = await self._load_categories()
+            if photos is not None:
+                await db_async.set_portfolio_photos(cat['slug'], photos)
+                self._photos.pop(cat['slug'], None)
+            if cat['slug'] not in self._by_slug:
+                await self._save_categories([*cats, cat])
+            else:
+                self.version += 1
+
+    async def add_photo(self, slug: str, file_id: str, file_unique_id: Optional[str] = None) -> bool:
+        """Добавить фото в конец категории; False, если оно там уже есть (тот же file_unique_id)."""
+        async with self._lock:
+            added = await db_async.add_portfolio_photo(slug, file_id, file_unique_id)
+            if added:
+                self._changed(slug, lambda photos: photos.append(file_id))
+        return added
+
+    async def add_photos(self, slug: str, photos: list[tuple[str, Optional[str]]]) -> int:
+        """Добавить пачку (file_id, file_unique_id) одной транзакцией; возвращает число новых."""
+        async with self._lock:
+            added = await db_async.add_portfolio_photos(slug, photos)
+            if added:
+                self._changed(slug, lambda current: current.extend(added))
+        return len(added)
+
+    async def delete_photo(self, slug: str, idx: int) -> Optional[tuple[str, Optional[str]]]:
+        """Удалить фото по позиции; возвращает его (file_id, file_unique_id) или None."""
+        async with self._lock:
+            removed = await db_async.delete_portfolio_photo(slug, idx)
+            if removed is not None:
+                self._changed(slug, lambda photos: photos.pop(idx))
+        return removed
+
+    async def clear_photos(self, slug: str) -> list[tuple[str, Optional[str]]]:
+        """Удалить все фото категории; возвращает пары (file_id, file_unique_id) для отмены."""
+        async with self._lock:
+            removed = await db_async.clear_portfolio_photos(slug)
+            self._photos[slug] = []
+            self.version += 1
+        return removed
+
+    async def set_photos(self, slug: str, photos: list[tuple[str, Optional[str]]]) -> None:
+        """Заменить фото категории парами (file_id, file_unique_id), например при отмене удаления."""
+        async with self._lock:
+            await db_async.set_portfolio_photos(slug, photos)
+            # дубликаты отбрасывает БД; список перечитается при следующем показе
+            self._photos.pop(slug, None)
+            self.version += 1
+
+    def invalidate(self, slug: Optional[str] = None) -> None:
+        """Забыть загруженное (всё или одну категорию), например после правки data.db скриптом."""
+        if slug is None:
+            self._categories = None
+            self._by_slug = {}
+            self._photos.clear()
+        else:
+            self._photos.pop(slug, None)
+        self.version += 1
+
+    # --- внутреннее -------------------------------------------------------------
+
+    def _changed(self, slug: str, apply) -> None:
+        photos = self._photos.get(slug)
+        if photos is not None:
+            # копия: уже выданный вызывающим список не меняется у них на глазах
+            photos = list(photos)
+            apply(photos)
+            self._photos[slug] = photos
+        self.version += 1
+
+    async def _load_categories(self) -> list[dict]:
+        if self._categories is not None:
+            return self._categories
+        cats = await db_async.get_setting_json('portfolio_categories', None)
+        if isinstance(cats, list) and cats:
+            # значение из кэша настроек общее: храним свои копии
+            self._set_categories([dict(c) for c in cats if isinstance(c, dict)])
+        else:
+            await self._save_categories([dict(c) for c in DEFAULT_PORTFOLIO_CATEGORIES])
+        return self._categories
+
+    async def _save_categories(self, cats: list[dict]) -> None:
+        await db_async.set_setting('portfolio_categories', json.dumps(cats, ensure_ascii=False))
+        self._set_categories(cats)
+        self.version += 1
+
+    def _set_categories(self, cats: list[dict]) -> None:
+        self._categories = cats
+        self._by_slug = {c['slug']: c for c in cats if c.get('slug')}
+
+    async def _load_photos(self, slug: str) -> list[str]:
+        photos = self._photos.get(slug)
+        if photos is None:
+            photos = await db_async.get_portfolio_photos(slug)
+            self._photos[slug] = photos
+        return photos
+
+
+portfolio_catalog = PortfolioCatalog()
+
+
+__all__ = [
+    "DEFAULT_PORTFOLIO_CATEGORIES",
+    "PortfolioCatalog",
+    "REVIEWS_SLUG",
+    "portfolio_catalog",
+]
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
-import json
+import asyncio
 import logging
+import os
 from pathlib import Path
 from typing import Any, Dict
 
@@ -9,19 +10,11 @@ from aiogram import F, Router
 from aiogram.filters import Command
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InputMediaPhoto, Message
 
+import db_async
 from admin_state import ADMIN_PENDING_ACTIONS
 from admin_utils import is_admin_view_enabled
 from bot_constants import MENU_MESSAGES
-from booking_handlers import get_portfolio_categories
 from config import bot
-from db import (
-    get_setting,
-    save_pending_actions,
-    set_setting,
-    toggle_photo_like,
-    get_photo_likes_count,
-    user_has_liked_photo,
-)
 from keyboards import (
     build_category_admin_keyboard,
     build_category_delete_keyboard,
@@ -33,28 +26,48 @@ from keyboards import (
     build_undo_category_delete_kb,
     build_undo_photo_delete_kb,
 )
+from like_debounce import like_debouncer
+from media_validator import media_validator
+from photo_walk import next_photo
+from portfolio_catalog import portfolio_catalog
 from portfolio_state import (
-    LAST_CATEGORY_PHOTO,
     UNDO_DELETED_CATEGORY,
     UNDO_DELETED_CATEGORY_PHOTOS,
     UNDO_DELETED_PHOTO,
     reset_last_category_position,
+    viewer_positions,
 )
 
 portfolio_router = Router(name="portfolio")
 
+# Фото, присланные подряд (части альбома приходят отдельными апдейтами), добавляются
+# одной пачкой, когда новых нет PHOTO_UPLOAD_COLLECT_DELAY секунд
+PHOTO_UPLOAD_COLLECT_DELAY = float(os.getenv('PHOTO_UPLOAD_COLLECT_DELAY', '1.5'))
+
+
+class _PhotoUpload:
+    __slots__ = ('photos', 'deadline')
+
+    def __init__(self) -> None:
+        self.photos: list[tuple[str, str | None]] = []
+        self.deadline = 0.0
+
+
+# (chat_id, slug) -> собираемая пачка
+_photo_uploads: dict[tuple[int, str], _PhotoUpload] = {}
 
-def get_portfolio_keyboard_with_likes(slug: str, idx: int, user_id: int) -> InlineKeyboardMarkup:
-    """Собрать клавиатуру для просмотра фото с учётом лайков."""
-    likes_count = get_photo_likes_count(slug, idx)
-    user_has_liked = user_has_liked_photo(slug, idx, user_id)
+
+async def get_portfolio_keyboard_with_likes(slug: str, idx: int, user_id: int) -> InlineKeyboardMarkup:
+    """Собрать клавиатуру для просмотра фото с учётом лайков (один запрос к БД)."""
+    states = await db_async.get_photo_like_states([(slug, idx)], user_id)
+    likes_count, user_has_liked = states[(slug, idx)]
     return build_category_photo_nav_keyboard(slug, idx, user_id, likes_count, user_has_liked)
 
 
 @portfolio_router.message(Command(commands=['portfolio']))
 async def cmd_portfolio(message: Message) -> None:
     username = (message.from_user.username or "").lstrip("@").lower()
-    cats = await get_portfolio_categories()
+    cats = await portfolio_catalog.categories()
     is_admin = await is_admin_view_enabled(username, message.from_user.id)
     kb = build_portfolio_keyboard(cats, is_admin=is_admin)
     await message.answer(MENU_MESSAGES["portfolio"], reply_markup=kb)
@@ -63,7 +76,7 @@ async def cmd_portfolio(message: Message) -> None:
 @portfolio_router.callback_query(F.data == 'portfolio')
 async def cb_show_portfolio_menu(query: CallbackQuery) -> None:
     username = (query.from_user.username or "").lstrip("@").lower()
-    cats = await get_portfolio_categories()
+    cats = await portfolio_catalog.categories()
     is_admin = await is_admin_view_enabled(username, query.from_user.id)
     kb = build_portfolio_keyboard(cats, is_admin=is_admin)
     await query.message.answer(MENU_MESSAGES["portfolio"], reply_markup=kb)
@@ -72,41 +85,30 @@ async def cb_show_portfolio_menu(query: CallbackQuery) -> None:
 @portfolio_router.callback_query(F.data.startswith('pf:'))
 async def cb_show_category(query: CallbackQuery) -> None:
     slug = query.data.split(':', 1)[1]
-    cats = await get_portfolio_categories()
-    cat = next((c for c in cats if c.get('slug') == slug), None)
+    cat = await portfolio_catalog.category(slug)
     if not cat:
         await query.message.answer('Категория не найдена.')
         return
 
-    key = f'portfolio_{slug}'
-    raw = get_setting(key, '[]')
-    try:
-        photos = json.loads(raw)
-        if not isinstance(photos, list):
-            photos = []
-    except Exception:
-        photos = []
+    total = await portfolio_catalog.count(slug)
 
     photo_sent = False
-    if photos:
+    if total:
         cycle_key = (query.message.chat.id, slug)
-        last_shown = LAST_CATEGORY_PHOTO.get(cycle_key, len(photos))
-        if last_shown >= len(photos):
-            idx = len(photos) - 1
-        else:
-            idx = last_shown - 1
-            if idx < 0:
-                idx = len(photos) - 1
-
-        fid = photos[idx]
+        # продолжить перемешанный обход зрителя с того места, где он остановился
+        idx, walk = next_photo(viewer_positions.get(cycle_key), total)
+
+        fid = await portfolio_catalog.photo(slug, idx)
         caption = f'📸 {cat.get("text")}'
         try:
-            keyboard = get_portfolio_keyboard_with_likes(slug, idx, query.from_user.id)
+            keyboard = await get_portfolio_keyboard_with_likes(slug, idx, query.from_user.id)
             await bot.send_photo(chat_id=query.message.chat.id, photo=fid, caption=caption, reply_markup=keyboard)
-            LAST_CATEGORY_PHOTO[cycle_key] = idx
+            viewer_positions.set(cycle_key, walk)
             photo_sent = True
         except Exception:
-            keyboard = get_portfolio_keyboard_with_likes(slug, 0, query.from_user.id)
+            # нерабочий file_id снимет с показа фоновая проверка
+            media_validator.suspect(fid)
+            keyboard = await get_portfolio_keyboard_with_likes(slug, 0, query.from_user.id)
             await query.message.answer(f'📸 {cat.get("text")} (ошибка отправки фото)', reply_markup=keyboard)
             photo_sent = True
     else:
@@ -115,10 +117,10 @@ async def cb_show_category(query: CallbackQuery) -> None:
     username = (query.from_user.username or "").lstrip("@").lower()
     is_admin = await is_admin_view_enabled(username, query.from_user.id)
     if is_admin:
-        kb = build_category_admin_keyboard(slug, has_photos=bool(photos))
+        kb = build_category_admin_keyboard(slug, has_photos=bool(total))
         await query.message.answer('Управление категорией:', reply_markup=kb)
     elif not photo_sent:
-        kb = build_portfolio_keyboard(await get_portfolio_categories(), page=0, is_admin=False)
+        kb = build_portfolio_keyboard(await portfolio_catalog.categories(), page=0, is_admin=False)
         await query.message.answer('Категории:', reply_markup=kb)
 
 
@@ -128,40 +130,30 @@ async def cb_nav_photo(query: CallbackQuery) -> None:
     if len(parts) < 3:
         return
     slug = parts[1]
-    key = f'portfolio_{slug}'
-    raw = get_setting(key, '[]')
-    try:
-        photos = json.loads(raw)
-        if not isinstance(photos, list):
-            photos = []
-    except Exception:
-        photos = []
+    total = await portfolio_catalog.count(slug)
 
-    if not photos:
+    if not total:
         await query.message.answer('Нет фото в категории.')
         return
 
+    # лайки прежнего фото записать до смены: иначе их правка затрёт новую клавиатуру
+    await like_debouncer.settle(query.from_user.id, query.message)
+
     chat_key = (query.message.chat.id, slug)
-    last_idx = LAST_CATEGORY_PHOTO.get(chat_key)
-    if last_idx is None:
-        idx = len(photos) - 1
-    else:
-        idx = last_idx - 1
-        if idx < 0:
-            idx = len(photos) - 1
+    idx, walk = next_photo(viewer_positions.get(chat_key), total)
 
-    fid = photos[idx]
-    cat_text = next((c.get('text') for c in await get_portfolio_categories() if c.get('slug') == slug), slug)
+    fid = await portfolio_catalog.photo(slug, idx)
+    cat_text = await portfolio_catalog.title(slug)
     try:
         await query.message.edit_media(InputMediaPhoto(media=fid, caption=f'📸 {cat_text}'))
-        keyboard = get_portfolio_keyboard_with_likes(slug, idx, query.from_user.id)
+        keyboard = await get_portfolio_keyboard_with_likes(slug, idx, query.from_user.id)
         await query.message.edit_reply_markup(reply_markup=keyboard)
-        LAST_CATEGORY_PHOTO[chat_key] = idx
+        viewer_positions.set(chat_key, walk)
     except Exception as exc:
         logging.warning("Failed to edit_media, fallback new message: %s", exc)
-        keyboard = get_portfolio_keyboard_with_likes(slug, idx, query.from_user.id)
+        keyboard = await get_portfolio_keyboard_with_likes(slug, idx, query.from_user.id)
         await bot.send_photo(chat_id=query.message.chat.id, photo=fid, caption=f'📸 {cat_text}', reply_markup=keyboard)
-        LAST_CATEGORY_PHOTO[chat_key] = idx
+        viewer_positions.set(chat_key, walk)
 
 
 @portfolio_router.callback_query(F.data.startswith('like:'))
@@ -178,18 +170,9 @@ async def cb_like_photo(query: CallbackQuery) -> None:
         await query.answer("❌ Ошибка: неверный индекс фото")
         return
 
-    user_id = query.from_user.id
-    liked = toggle_photo_like(slug, photo_idx, user_id)
-    likes_count = get_photo_likes_count(slug, photo_idx)
-    user_has_liked = user_has_liked_photo(slug, photo_idx, user_id)
-
-    try:
-        keyboard = build_category_photo_nav_keyboard(slug, photo_idx, user_id, likes_count, user_has_liked)
-        await query.message.edit_reply_markup(reply_markup=keyboard)
-        await query.answer("❤️ Лайк поставлен!" if liked else "💔 Лайк убран")
-    except Exception as exc:
-        logging.warning("Failed to update like button: %s", exc)
-        await query.answer("❤️ Лайк обновлён!")
+    # запись в БД и правка клавиатуры — одна на серию нажатий, ответ — на каждое
+    liked = await like_debouncer.tap(query.from_user.id, query.message, slug, photo_idx)
+    await query.answer("❤️ Лайк поставлен!" if liked else "💔 Лайк убран")
 
 
 @portfolio_router.callback_query(F.data.startswith('pf_back_cat:'))
@@ -199,14 +182,8 @@ async def cb_back_to_category_admin(query: CallbackQuery) -> None:
         await query.message.answer('🚫 Нет доступа.')
         return
 
-    raw = get_setting(f'portfolio_{slug}', '[]')
-    try:
-        photos = json.loads(raw)
-        if not isinstance(photos, list):
-            photos = []
-    except Exception:
-        photos = []
-    kb = build_category_admin_keyboard(slug, has_photos=bool(photos))
+    total = await portfolio_catalog.count(slug)
+    kb = build_category_admin_keyboard(slug, has_photos=bool(total))
     await query.message.answer('Управление категорией:', reply_markup=kb)
 
 
@@ -218,8 +195,8 @@ async def cb_add_photo_request(query: CallbackQuery) -> None:
     slug = query.data.split(':', 1)[1]
     admin_key = (query.from_user.username or '').lstrip('@').lower()
     ADMIN_PENDING_ACTIONS[admin_key] = {'action': 'add_photo_cat', 'payload': {'slug': slug}}
-    save_pending_actions(ADMIN_PENDING_ACTIONS)
-    await query.message.answer('Пришлите фото одним сообщением (из галереи).')
+    await db_async.save_pending_actions(ADMIN_PENDING_ACTIONS)
+    await query.message.answer('Пришлите фото: можно по одному, альбомом или несколько альбомов подряд.')
 
 
 @portfolio_router.callback_query(F.data.startswith('pf_del_all_confirm:'))
@@ -228,18 +205,12 @@ async def cb_confirm_delete_all(query: CallbackQuery) -> None:
         await query.message.answer('🚫 Нет доступа.')
         return
     slug = query.data.split(':', 1)[1]
-    raw = get_setting(f'portfolio_{slug}', '[]')
-    try:
-        photos = json.loads(raw)
-        if not isinstance(photos, list):
-            photos = []
-    except Exception:
-        photos = []
-    if not photos:
+    total = await portfolio_catalog.count(slug)
+    if not total:
         await query.message.answer('Нет фото для очистки.')
         return
     await query.message.answer(
-        f'Очистить ВСЕ фото ({len(photos)}) в категории? Это можно будет отменить.',
+        f'Очистить ВСЕ фото ({total}) в категории? Это можно будет отменить.',
         reply_markup=build_confirm_delete_all_photos_kb(slug),
     )
 
@@ -250,18 +221,12 @@ async def cb_delete_all_photos(query: CallbackQuery) -> None:
         await query.message.answer('🚫 Нет доступа.')
         return
     slug = query.data.split(':', 1)[1]
-    raw = get_setting(f'portfolio_{slug}', '[]')
-    try:
-        photos = json.loads(raw)
-        if not isinstance(photos, list):
-            photos = []
-    except Exception:
-        photos = []
+    photos = await portfolio_catalog.clear_photos(slug)
     if not photos:
         await query.message.answer('Категория уже пуста.')
         return
-    UNDO_DELETED_CATEGORY_PHOTOS[slug] = photos.copy()
-    set_setting(f'portfolio_{slug}', json.dumps([], ensure_ascii=False))
+    UNDO_DELETED_CATEGORY_PHOTOS[slug] = photos
+    reset_last_category_position(slug)
     await query.message.answer(
         f'✅ Все фото ({len(photos)}) удалены.',
         reply_markup=build_undo_photo_delete_kb(slug),
@@ -286,13 +251,7 @@ async def cb_start_delete_mode(query: CallbackQuery) -> None:
     if len(parts) < 2:
         return
     slug = parts[1]
-    raw = get_setting(f'portfolio_{slug}', '[]')
-    try:
-        photos = json.loads(raw)
-        if not isinstance(photos, list):
-            photos = []
-    except Exception:
-        photos = []
+    photos = await portfolio_catalog.photos(slug)
     if not photos:
         await query.message.answer('Нет фото в категории.')
         return
@@ -308,19 +267,13 @@ async def cb_open_delete_viewer(query: CallbackQuery) -> None:
     if len(parts) < 3:
         return
     slug = parts[1]
-    raw = get_setting(f'portfolio_{slug}', '[]')
-    try:
-        photos = json.loads(raw)
-        if not isinstance(photos, list):
-            photos = []
-    except Exception:
-        photos = []
-    if not photos:
+    total = await portfolio_catalog.count(slug)
+    if not total:
         await query.message.answer('Нет фото.')
         return
     idx = int(parts[2]) if parts[2].isdigit() else 0
-    idx = max(0, min(idx, len(photos) - 1))
-    fid = photos[idx]
+    idx = max(0, min(idx, total - 1))
+    fid = await portfolio_catalog.photo(slug, idx)
     try:
         await query.message.edit_media(InputMediaPhoto(media=fid, caption='🗑 Режим удаления'))
         await query.message.edit_reply_markup(reply_markup=build_category_delete_viewer_keyboard(slug, idx))
@@ -342,26 +295,20 @@ async def cb_delete_nav(query: CallbackQuery) -> None:
         return
     slug = parts[1]
     cur_idx = int(parts[2]) if parts[2].isdigit() else 0
-    raw = get_setting(f'portfolio_{slug}', '[]')
-    try:
-        photos = json.loads(raw)
-        if not isinstance(photos, list):
-            photos = []
-    except Exception:
-        photos = []
-    if not photos:
+    total = await portfolio_catalog.count(slug)
+    if not total:
         await query.message.answer('Нет фото.')
         return
     import random
 
-    if len(photos) > 1:
-        candidates = [i for i in range(len(photos)) if i != cur_idx]
-        if not candidates:
-            candidates = list(range(len(photos)))
-        new_idx = random.choice(candidates)
+    if total > 1:
+        # any index except the current one
+        new_idx = random.randrange(total - 1)
+        if new_idx >= cur_idx:
+            new_idx += 1
     else:
         new_idx = 0
-    fid = photos[new_idx]
+    fid = await portfolio_catalog.photo(slug, new_idx)
     try:
         await query.message.edit_media(InputMediaPhoto(media=fid, caption='🗑 Режим удаления'))
         await query.message.edit_reply_markup(reply_markup=build_category_delete_viewer_keyboard(slug, new_idx))
@@ -383,24 +330,18 @@ async def cb_delete_current_photo(query: CallbackQuery) -> None:
         return
     slug = parts[1]
     del_idx = int(parts[2]) if parts[2].isdigit() else 0
-    key = f'portfolio_{slug}'
-    raw = get_setting(key, '[]')
-    try:
-        photos = json.loads(raw)
-        if not isinstance(photos, list):
-            photos = []
-    except Exception:
-        photos = []
-    if not photos or not (0 <= del_idx < len(photos)):
+    removed = await portfolio_catalog.delete_photo(slug, del_idx)
+    if removed is None:
         await query.message.answer('Индекс вне диапазона.')
         return
 
-    removed = photos.pop(del_idx)
     UNDO_DELETED_PHOTO[slug] = removed
-    set_setting(key, json.dumps(photos, ensure_ascii=False))
-    next_idx = 0 if not photos else min(del_idx, len(photos) - 1)
-    if photos:
-        fid = photos[next_idx]
+    # позиции после удалённого сдвинулись: обходы зрителей начинаются заново
+    reset_last_category_position(slug)
+    total = await portfolio_catalog.count(slug)
+    next_idx = 0 if not total else min(del_idx, total - 1)
+    if total:
+        fid = await portfolio_catalog.photo(slug, next_idx)
         try:
             await query.message.edit_media(
                 InputMediaPhoto(media=fid, caption='🗑 Удалено. Следующее.'),
@@ -425,14 +366,8 @@ async def cb_delete_done(query: CallbackQuery) -> None:
     if not await is_admin_view_enabled((query.from_user.username or "").lstrip("@").lower(), query.from_user.id):
         return
     slug = query.data.split(':', 1)[1]
-    raw = get_setting(f'portfolio_{slug}', '[]')
-    try:
-        photos = json.loads(raw)
-        if not isinstance(photos, list):
-            photos = []
-    except Exception:
-        photos = []
-    kb = build_category_admin_keyboard(slug, has_photos=bool(photos))
+    total = await portfolio_catalog.count(slug)
+    kb = build_category_admin_keyboard(slug, has_photos=bool(total))
     await query.message.answer('Управление категорией:', reply_markup=kb)
 
 
@@ -445,7 +380,7 @@ async def cb_portfolio_page(query: CallbackQuery) -> None:
         page = int(part)
     except Exception:
         page = 0
-    cats = await get_portfolio_categories()
+    cats = await portfolio_catalog.categories()
     is_admin = await is_admin_view_enabled((query.from_user.username or "").lstrip("@").lower(), query.from_user.id)
     kb = build_portfolio_keyboard(cats, page=page, is_admin=is_admin)
     try:
@@ -461,7 +396,7 @@ async def cb_new_category(query: CallbackQuery) -> None:
         return
     admin_key = (query.from_user.username or '').lstrip('@').lower()
     ADMIN_PENDING_ACTIONS[admin_key] = {'action': 'new_category', 'payload': {}}
-    save_pending_actions(ADMIN_PENDING_ACTIONS)
+    await db_async.save_pending_actions(ADMIN_PENDING_ACTIONS)
     await query.message.answer('Введите название новой категории:')
 
 
@@ -471,14 +406,13 @@ async def cb_rename_category(query: CallbackQuery) -> None:
         await query.message.answer('🚫 Нет доступа.')
         return
     slug = query.data.split(':', 1)[1]
-    cats = await get_portfolio_categories()
-    cat = next((c for c in cats if c.get('slug') == slug), None)
+    cat = await portfolio_catalog.category(slug)
     if not cat:
         await query.message.answer('Категория не найдена.')
         return
     admin_key = (query.from_user.username or '').lstrip('@').lower()
     ADMIN_PENDING_ACTIONS[admin_key] = {'action': 'rename_category', 'payload': {'slug': slug}}
-    save_pending_actions(ADMIN_PENDING_ACTIONS)
+    await db_async.save_pending_actions(ADMIN_PENDING_ACTIONS)
     await query.message.answer(f"Введите новое название для категории '{cat.get('text')}'")
 
 
@@ -488,8 +422,7 @@ async def cb_delete_category_confirm(query: CallbackQuery) -> None:
         await query.message.answer('🚫 Нет доступа.')
         return
     slug = query.data.split(':', 1)[1]
-    cats = await get_portfolio_categories()
-    cat = next((c for c in cats if c.get('slug') == slug), None)
+    cat = await portfolio_catalog.category(slug)
     if not cat:
         await query.message.answer('Категория не найдена.')
         return
@@ -505,22 +438,13 @@ async def cb_delete_category(query: CallbackQuery) -> None:
         await query.message.answer('🚫 Нет доступа.')
         return
     slug = query.data.split(':', 1)[1]
-    cats = await get_portfolio_categories()
-    cat = next((c for c in cats if c.get('slug') == slug), None)
-    if not cat:
+    removed = await portfolio_catalog.remove_category(slug)
+    if not removed:
         await query.message.answer('Категория уже отсутствует.')
         return
-    new_cats = [c for c in cats if c is not cat]
-    raw_ph = get_setting(f'portfolio_{slug}', '[]')
-    try:
-        photos_backup = json.loads(raw_ph)
-    except Exception:
-        photos_backup = []
-    UNDO_DELETED_CATEGORY[slug] = cat
-    UNDO_DELETED_CATEGORY_PHOTOS[slug] = photos_backup
-    set_setting('portfolio_categories', json.dumps(new_cats, ensure_ascii=False))
-    set_setting(f'portfolio_{slug}', json.dumps([]))
-    kb = build_portfolio_keyboard(new_cats, is_admin=True)
+    UNDO_DELETED_CATEGORY[slug], UNDO_DELETED_CATEGORY_PHOTOS[slug] = removed
+    reset_last_category_position(slug)
+    kb = build_portfolio_keyboard(await portfolio_catalog.categories(), is_admin=True)
     await query.message.answer('Категория удалена. Можно отменить.', reply_markup=kb)
     await query.message.answer('↩️ Отменить удаление?', reply_markup=build_undo_category_delete_kb(slug))
 
@@ -540,12 +464,8 @@ async def cb_undo_category(query: CallbackQuery) -> None:
     if not cat:
         await query.message.answer('Нечего восстанавливать.')
         return
-    cats = await get_portfolio_categories()
-    cats.append(cat)
-    set_setting('portfolio_categories', json.dumps(cats, ensure_ascii=False))
-    if photos_restore is not None:
-        set_setting(f'portfolio_{slug}', json.dumps(photos_restore, ensure_ascii=False))
-    kb = build_portfolio_keyboard(cats, is_admin=True)
+    await portfolio_catalog.restore_category(cat, photos_restore)
+    kb = build_portfolio_keyboard(await portfolio_catalog.categories(), is_admin=True)
     await query.message.answer('✅ Категория восстановлена.', reply_markup=kb)
 
 
@@ -554,26 +474,39 @@ async def cb_undo_photo(query: CallbackQuery) -> None:
     if not await is_admin_view_enabled((query.from_user.username or "").lstrip("@").lower(), query.from_user.id):
         return
     slug = query.data.split(':', 1)[1]
-    photo_id = UNDO_DELETED_PHOTO.pop(slug, None)
-    if not photo_id:
+    removed = UNDO_DELETED_PHOTO.pop(slug, None)
+    if not removed:
         await query.message.answer('Нет фото для восстановления.')
         return
-    key = f'portfolio_{slug}'
-    raw = get_setting(key, '[]')
-    try:
-        photos = json.loads(raw)
-        if not isinstance(photos, list):
-            photos = []
-    except Exception:
-        photos = []
-    if photo_id not in photos:
-        photos.append(photo_id)
-        set_setting(key, json.dumps(photos, ensure_ascii=False))
+    photo_id, photo_unique_id = removed
+    if await portfolio_catalog.add_photo(slug, photo_id, photo_unique_id):
         await query.message.answer('✅ Фото восстановлено.')
     else:
         await query.message.answer('Фото уже существует в категории.')
 
 
+async def _collect_photo_upload(message: Message, slug: str) -> None:
+    key = (message.chat.id, slug)
+    photo = message.photo[-1]
+    loop = asyncio.get_running_loop()
+    upload = _photo_uploads.get(key)
+    first = upload is None
+    if first:
+        upload = _photo_uploads[key] = _PhotoUpload()
+    upload.photos.append((photo.file_id, photo.file_unique_id))
+    upload.deadline = loop.time() + PHOTO_UPLOAD_COLLECT_DELAY
+    if not first:
+        return
+    # первый апдейт ждёт остальные и добавляет всю пачку
+    while (delay := upload.deadline - loop.time()) > 0:
+        await asyncio.sleep(delay)
+    del _photo_uploads[key]
+    # позиции не сдвигаются: обходы зрителей подхватят новые фото сами
+    added = await portfolio_catalog.add_photos(slug, upload.photos)
+    skipped = len(upload.photos) - added
+    await message.answer(f'✅ Добавлено {added}.' + (f' Пропущено повторов: {skipped}.' if skipped else ''))
+
+
 async def handle_portfolio_pending_action(
     message: Message,
     username: str,
@@ -589,26 +522,23 @@ async def handle_portfolio_pending_action(
         if not title:
             await message.answer('Название не может быть пустым.')
             ADMIN_PENDING_ACTIONS.pop(username, None)
-            save_pending_actions(ADMIN_PENDING_ACTIONS)
+            await db_async.save_pending_actions(ADMIN_PENDING_ACTIONS)
             return True
         from utils import normalize_callback
 
         slug = normalize_callback(title)
-        cats = await get_portfolio_categories()
-        if any(c.get('slug') == slug for c in cats):
+        if not await portfolio_catalog.add_category(title, slug):
             await message.answer(f'Категория со slug "{slug}" уже существует. Измените название.')
             return True
-        cats.append({'text': title, 'slug': slug})
-        set_setting('portfolio_categories', json.dumps(cats, ensure_ascii=False))
         folder = Path('media') / 'portfolio' / slug
         try:
             folder.mkdir(parents=True, exist_ok=True)
         except Exception:
             pass
         ADMIN_PENDING_ACTIONS.pop(username, None)
-        save_pending_actions(ADMIN_PENDING_ACTIONS)
+        await db_async.save_pending_actions(ADMIN_PENDING_ACTIONS)
         await message.answer(f'✅ Категория "{title}" создана.')
-        kb = build_portfolio_keyboard(cats, is_admin=True)
+        kb = build_portfolio_keyboard(await portfolio_catalog.categories(), is_admin=True)
         await message.answer('Обновлённый список категорий:', reply_markup=kb)
         return True
 
@@ -620,49 +550,27 @@ async def handle_portfolio_pending_action(
         if not new_title:
             await message.answer('Название не может быть пустым.')
             ADMIN_PENDING_ACTIONS.pop(username, None)
-            save_pending_actions(ADMIN_PENDING_ACTIONS)
+            await db_async.save_pending_actions(ADMIN_PENDING_ACTIONS)
             return True
         slug = payload.get('slug')
-        cats = await get_portfolio_categories()
-        cat = next((c for c in cats if c.get('slug') == slug), None)
-        if not cat:
+        old_title = await portfolio_catalog.rename_category(slug, new_title)
+        if old_title is None:
             await message.answer('Категория не найдена.')
             ADMIN_PENDING_ACTIONS.pop(username, None)
-            save_pending_actions(ADMIN_PENDING_ACTIONS)
+            await db_async.save_pending_actions(ADMIN_PENDING_ACTIONS)
             return True
-        old_title = cat.get('text')
-        cat['text'] = new_title
-        set_setting('portfolio_categories', json.dumps(cats, ensure_ascii=False))
         ADMIN_PENDING_ACTIONS.pop(username, None)
-        save_pending_actions(ADMIN_PENDING_ACTIONS)
+        await db_async.save_pending_actions(ADMIN_PENDING_ACTIONS)
         await message.answer(f'✅ Категория "{old_title}" переименована в "{new_title}".')
-        kb = build_portfolio_keyboard(cats, is_admin=True)
+        kb = build_portfolio_keyboard(await portfolio_catalog.categories(), is_admin=True)
         await message.answer('Обновлённый список категорий:', reply_markup=kb)
         return True
 
     if action == 'add_photo_cat':
         slug = payload.get('slug')
         if message.photo:
-            key = f'portfolio_{slug}'
-            raw = get_setting(key, '[]')
-            try:
-                photos = json.loads(raw)
-                if not isinstance(photos, list):
-                    photos = []
-            except Exception:
-                photos = []
-            file_id = message.photo[-1].file_id
-            changed = False
-            if file_id not in photos:
-                photos.append(file_id)
-                changed = True
-            if changed:
-                set_setting(key, json.dumps(photos, ensure_ascii=False))
-                reset_last_category_position(slug)
-            added = 1 if changed else 0
-            await message.answer(f'✅ Добавлено {added}.')
-            ADMIN_PENDING_ACTIONS[username] = {'action': 'add_photo_cat', 'payload': {'slug': slug}}
-            save_pending_actions(ADMIN_PENDING_ACTIONS)
+            # действие остаётся прежним: можно присылать ещё фото, сохранять его заново незачем
+            await _collect_photo_upload(message, slug)
             return True
         await message.answer('Пришлите фото.')
         return True
@@ -1,26 +1,199 @@
 from __future__ import annotations
 
-from typing import Dict, List, Tuple
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 
-# track last shown photo index per chat+category to avoid repeats
-LAST_CATEGORY_PHOTO: Dict[Tuple[int, str], int] = {}
+import db_async
+
+# сколько пар (чат, категория) помнить; вытесняются давно не смотревшие
+VIEWER_POSITIONS_MAX = int(os.getenv('VIEWER_POSITIONS_MAX', '50000'))
+# позиция, не обновлявшаяся столько секунд, забывается
+VIEWER_POSITIONS_TTL = float(os.getenv('VIEWER_POSITIONS_TTL', str(30 * 24 * 3600)))
+# как часто сохранять изменения в БД; 0 — не сохранять (позиции живут до перезапуска)
+VIEWER_POSITIONS_FLUSH_INTERVAL = float(os.getenv('VIEWER_POSITIONS_FLUSH_INTERVAL', '300'))
+
+# (chat_id, slug)
+_ViewerKey = tuple[int, str]
+
+
+class ViewerPositions:
+    """Где каждый чат остановился в категории (или в отзывах): LRU с TTL и индексом по slug.
+
+    Сброс категории трогает только её записи. При включённом сохранении изменения
+    пишутся в БД пачкой раз в flush_interval секунд и при остановке, а при запуске
+    подгружаются свежие позиции — зрители продолжают с того же места после перезапуска.
+    """
+
+    def __init__(self, max_size: int = VIEWER_POSITIONS_MAX, ttl: float = VIEWER_POSITIONS_TTL,
+                 flush_interval: float = VIEWER_POSITIONS_FLUSH_INTERVAL) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        # ключ -> (значение, время последней записи); порядок — от давно использованных к недавним
+        self._entries: OrderedDict[_ViewerKey, tuple[Any, float]] = OrderedDict()
+        self._by_slug: dict[str, set[_ViewerKey]] = {}
+        # что записать в БД и что из неё удалить при следующем сбросе
+        self._dirty: set[_ViewerKey] = set()
+        self._removed: set[_ViewerKey] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def persistent(self) -> bool:
+        return self.flush_interval > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: _ViewerKey, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        value, touched_at = entry
+        if time.time() - touched_at > self.ttl:
+            self._forget(key)
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: _ViewerKey, value: Any) -> None:
+        now = time.time()
+        if key not in self._entries:
+            self._by_slug.setdefault(key[1], set()).add(key)
+        self._entries[key] = (value, now)
+        self._entries.move_to_end(key)
+        self._dirty.add(key)
+        self._removed.discard(key)
+        self._evict(now)
+
+    def reset(self, slug: str) -> int:
+        """Забыть позиции всех чатов в категории; возвращает, сколько их было."""
+        keys = self._by_slug.pop(slug, set())
+        for key in keys:
+            del self._entries[key]
+            self._dirty.discard(key)
+            if self.persistent:
+                self._removed.add(key)
+        return len(keys)
+
+    async def load(self) -> int:
+        """Подгрузить из БД позиции, обновлённые за последние ttl секунд (не больше max_size)."""
+        rows = await db_async.get_viewer_positions(time.time() - self.ttl, self.max_size)
+        loaded = 0
+        # строки идут от свежих к старым и встают в начало LRU: записанное после запуска
+        # остаётся самым недавним, его же из БД не перетираем
+        for chat_id, slug, state, touched_at in rows:
+            key = (chat_id, slug)
+            if key in self._entries or key in self._removed:
+                continue
+            try:
+                value = json.loads(state)
+            except ValueError:
+                continue
+            self._by_slug.setdefault(slug, set()).add(key)
+            self._entries[key] = (value, touched_at)
+            self._entries.move_to_end(key, last=False)
+            loaded += 1
+        self._evict(time.time())
+        return loaded
+
+    async def flush(self) -> int:
+        """Записать изменения с прошлого сброса одной транзакцией."""
+        async with self._flush_lock:
+            if not self.persistent or not (self._dirty or self._removed):
+                return 0
+            dirty, self._dirty = self._dirty, set()
+            removed, self._removed = self._removed, set()
+            rows = [
+                (key[0], key[1], json.dumps(self._entries[key][0]), self._entries[key][1])
+                for key in dirty if key in self._entries
+            ]
+            try:
+                await db_async.save_viewer_positions(rows, list(removed), time.time() - self.ttl)
+            except Exception:
+                # вернуть в очередь то, что с тех пор не изменилось
+                self._dirty.update(key for key in dirty if key in self._entries and key not in self._removed)
+                self._removed.update(key for key in removed if key not in self._entries)
+                raise
+            return len(rows) + len(removed)
+
+    def _forget(self, key: _ViewerKey) -> None:
+        del self._entries[key]
+        keys = self._by_slug.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_slug[key[1]]
+        self._dirty.discard(key)
+        if self.persistent:
+            self._removed.add(key)
+
+    def _evict(self, now: float) -> None:
+        while len(self._entries) > self.max_size:
+            self._forget(next(iter(self._entries)))
+        # просроченные копятся в начале (их давно не читали) — снимаем, пока попадаются
+        while self._entries:
+            key = next(iter(self._entries))
+            if now - self._entries[key][1] <= self.ttl:
+                break
+            self._forget(key)
+
+    async def _run(self) -> None:
+        try:
+            loaded = await self.load()
+            logging.info('Restored %s viewer position(s)', loaded)
+        except Exception:
+            logging.exception('Failed to load viewer positions')
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logging.exception('Failed to save viewer positions')
+
+    def start(self) -> None:
+        if self.persistent and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановить фоновый сброс и дописать то, что накопилось."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logging.exception('Failed to save viewer positions on shutdown')
+
+
+# последнее показанное фото по чату и категории (ключ (chat_id, slug); для отзывов slug 'reviews')
+viewer_positions = ViewerPositions()
 
 # In-memory state containers (not persisted unless explicitly written via set_setting)
 UNDO_DELETED_CATEGORY: Dict[str, Dict] = {}
 UNDO_DELETED_CATEGORY_PHOTOS: Dict[str, List] = {}
-UNDO_DELETED_PHOTO: Dict[str, str] = {}
+# (file_id, file_unique_id) удалённых фото: отмена возвращает их с проверкой повторов
+UNDO_DELETED_PHOTO: Dict[str, Tuple[str, Optional[str]]] = {}
 
 def reset_last_category_position(slug: str) -> None:
     """Сбросить последнюю позицию просмотра для всех чатов по категории."""
-    keys_to_remove = [key for key in LAST_CATEGORY_PHOTO if key[1] == slug]
-    for key in keys_to_remove:
-        LAST_CATEGORY_PHOTO.pop(key, None)
+    viewer_positions.reset(slug)
 
 
 __all__ = [
-    "LAST_CATEGORY_PHOTO",
     "UNDO_DELETED_CATEGORY",
     "UNDO_DELETED_CATEGORY_PHOTOS",
     "UNDO_DELETED_PHOTO",
+    "ViewerPositions",
     "reset_last_category_position",
+    "viewer_positions",
 ]
@@ -9,9 +9,15 @@ import welcome_messages  # импорт модуля приветственны
 from birthday_scheduler import setup_birthday_scheduler
 from aiogram.types import BotCommand
 from booking_handlers import booking_router
+from broadcast import resume_broadcast_jobs, stop_broadcast_jobs
+from broadcast_handlers import broadcast_router
 from content_handlers import content_router
 from portfolio_handlers import portfolio_router
-from db_async import init_db  # ensure DB initialized без блокировки события
+from like_debounce import like_debouncer
+from media_validator import media_validator
+from db_async import init_db, shutdown_executor  # ensure DB initialized без блокировки события
+from portfolio_state import viewer_positions
+from user_activity import activity_tracker
 
 
 async def _set_bot_commands():
@@ -48,6 +54,13 @@ async def main():
             logging.info('Database initialized (tables ensured)')
         except Exception:
             logging.exception('Failed to initialize database')
+        try:
+            await handlers.drop_legacy_pending_actions()
+        except Exception:
+            logging.exception('Failed to drop legacy pending actions')
+        activity_tracker.start()
+        viewer_positions.start()
+        media_validator.start()
 
         # Настройка стандартной системы приветствий (для групп/супергрупп)
         welcome_messages.setup_welcome_handlers()
@@ -95,15 +108,30 @@ async def main():
         dp.include_router(booking_router)
         dp.include_router(content_router)
         dp.include_router(portfolio_router)
+        dp.include_router(broadcast_router)
         await _set_bot_commands()
 
+        # Незавершённые рассылки продолжаются с места остановки
+        try:
+            resumed = await resume_broadcast_jobs()
+            if resumed:
+                logging.info('Resumed %s broadcast job(s)', resumed)
+        except Exception:
+            logging.exception('Failed to resume broadcast jobs')
+
         # Запускаем Bot API polling
         logging.info("🤖 Запускаем Bot API polling...")
         await dp.start_polling(bot)
         
         # await dp.start_polling(bot)
     finally:
+        await stop_broadcast_jobs()
+        await media_validator.stop()
+        await like_debouncer.flush()
+        await activity_tracker.stop()
+        await viewer_positions.stop()
         await bot.session.close()
+        shutdown_executor()
 
 
 if __name__ == '__main__':
@@ -15,7 +15,12 @@ import os
 from dotenv import load_dotenv
 import handlers  # импорт основных обработчиков
 import welcome_messages  # импорт приветственных сообщений
-from db import init_db
+from broadcast import resume_broadcast_jobs, stop_broadcast_jobs
+from db_async import init_db, shutdown_executor
+from like_debounce import like_debouncer
+from media_validator import media_validator
+from portfolio_state import viewer_positions
+from user_activity import activity_tracker
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -49,13 +54,36 @@ async def webhook_handler(request: Request, bot: Bot) -> web.Response:
         logging.error(f"Ошибка в webhook handler: {e}")
         return web.Response(status=500)
 
+async def on_startup(app: web.Application) -> None:
+    """Те же фоновые службы, что и в run.py: БД, буферы записи, проверка медиа, рассылки"""
+    await init_db()
+    logging.info('Database initialized')
+    await handlers.drop_legacy_pending_actions()
+    activity_tracker.start()
+    viewer_positions.start()
+    media_validator.start()
+    # Незавершённые рассылки продолжаются с места остановки
+    try:
+        resumed = await resume_broadcast_jobs()
+        if resumed:
+            logging.info('Resumed %s broadcast job(s)', resumed)
+    except Exception:
+        logging.exception('Failed to resume broadcast jobs')
+
+
+async def on_shutdown(app: web.Application) -> None:
+    """Дописать накопленные лайки, позиции и last_seen, как при остановке run.py"""
+    await stop_broadcast_jobs()
+    await media_validator.stop()
+    await like_debouncer.flush()
+    await activity_tracker.stop()
+    await viewer_positions.stop()
+    shutdown_executor()
+
+
 async def main():
     """Основная функция запуска"""
     try:
-        # Инициализация БД
-        init_db()
-        logging.info('Database initialized')
-        
         # Настройка приветственных сообщений
         welcome_messages.setup_welcome_handlers()
         
@@ -65,6 +93,8 @@ async def main():
         
         # Создание веб-приложения
         app = web.Application()
+        app.on_startup.append(on_startup)
+        app.on_shutdown.append(on_shutdown)
         
         # Регистрация обработчика webhook
         app.router.add_post(WEBHOOK_PATH, 
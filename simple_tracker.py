@@ -15,6 +15,7 @@ from typing import Dict, Set
 from aiogram.types import Message
 from aiogram.filters import Command
 from config import dp, bot
+from db import init_db
 
 # Конфигурация
 TARGET_CHANNEL_ID = -1002553563891
@@ -124,35 +125,9 @@ async def _telethon_fetch_birthdate(user_id: int, username: str | None) -> str |
         return None
 
 def create_subscribers_table():
-    """Создает/мигрирует таблицу подписчиков в БД"""
+    """Создает/мигрирует таблицу подписчиков в БД (через версионные миграции db.init_db)"""
     try:
-        conn = sqlite3.connect('data.db')
-        cursor = conn.cursor()
-
-        # Базовое создание, если таблицы нет
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS subscribers (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                join_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Миграции: добавляем недостающие колонки (last_name, birthdate)
-        try:
-            cursor.execute("PRAGMA table_info(subscribers)")
-            cols = {row[1] for row in cursor.fetchall()}
-            if 'last_name' not in cols:
-                cursor.execute('ALTER TABLE subscribers ADD COLUMN last_name TEXT')
-            if 'birthdate' not in cols:
-                cursor.execute('ALTER TABLE subscribers ADD COLUMN birthdate TEXT')
-        except Exception as me:
-            # Логируем, но не валим инициализацию
-            logging.warning(f"Не удалось выполнить миграцию таблицы subscribers: {me}")
-
-        conn.commit()
-        conn.close()
+        init_db()
         logging.info("✅ Таблица подписчиков создана/обновлена")
 
     except Exception as e:
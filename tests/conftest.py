@@ -0,0 +1,19 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import db  # noqa: E402
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    """db.py on an empty temporary database with empty caches."""
+    monkeypatch.setattr(db, 'DB_PATH', tmp_path / 'test.db')
+    db.clear_settings_cache()
+    db._like_counts.clear()
+    db.init_db()
+    yield db
+    db.close_connections()
@@ -0,0 +1,47 @@
+def _run_job(db, results):
+    job_id = db.create_broadcast_job('text', None, 'admin', None)
+    db.claim_broadcast_recipients(job_id, [user_id for user_id, _, _ in results])
+    db.record_broadcast_results(job_id, results)
+    return job_id
+
+
+def _deliverability(db):
+    return db._connect().execute('SELECT user_id, fail_count, blocked_at FROM users ORDER BY user_id').fetchall()
+
+
+def test_broken_job_does_not_suppress_audience(fresh_db):
+    db = fresh_db
+    for user_id in (1, 2, 3):
+        db.add_user(user_id, f'user{user_id}', 'Имя', 'Фамилия')
+
+    # caption over 1024 chars: every recipient gets the same Bad Request, job after job
+    for _ in range(db.SUPPRESS_AFTER_FAILURES + 1):
+        job_id = _run_job(db, [(user_id, False, 'bad_request') for user_id in (1, 2, 3)])
+        assert db.get_broadcast_job(job_id)['failed'] == 3
+
+    assert _deliverability(db) == [(1, 0, None), (2, 0, None), (3, 0, None)]
+    assert db.count_users() == 3
+    assert db.get_broadcast_failure_reasons(job_id) == {'bad_request': 3}
+
+
+def test_chat_failures_suppress_after_limit(fresh_db):
+    db = fresh_db
+    db.add_user(1, 'gone', 'Имя', 'Фамилия')
+    db.add_user(2, 'blocked', 'Имя', 'Фамилия')
+
+    _run_job(db, [(2, False, 'unreachable')])
+    for _ in range(db.SUPPRESS_AFTER_FAILURES):
+        _run_job(db, [(1, False, 'chat_unavailable')])
+
+    rows = _deliverability(db)
+    assert rows[0][1] == db.SUPPRESS_AFTER_FAILURES and rows[0][2] is not None
+    assert rows[1][2] is not None
+    assert db.count_users() == 0
+
+
+def test_transport_errors_are_not_counted(fresh_db):
+    db = fresh_db
+    db.add_user(1, 'user', 'Имя', 'Фамилия')
+    for reason in ('telegramnetworkerror', 'telegramservererror', 'flood_wait'):
+        _run_job(db, [(1, False, reason)])
+    assert _deliverability(db) == [(1, 0, None)]
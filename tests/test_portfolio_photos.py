@@ -0,0 +1,60 @@
+def _likes(db, slug):
+    con = db._connect()
+    likes = con.execute('SELECT photo_index, user_id FROM photo_likes WHERE category_slug=? ORDER BY 1, 2',
+                        (slug,)).fetchall()
+    counts = con.execute('SELECT photo_index, likes FROM photo_like_counts WHERE category_slug=? AND likes > 0 '
+                         'ORDER BY 1', (slug,)).fetchall()
+    return likes, counts
+
+
+def test_delete_photo_moves_later_likes_up(fresh_db):
+    db = fresh_db
+    db.set_portfolio_photos('family', [('f0', 'u0'), ('f1', 'u1'), ('f2', 'u2')])
+    db.set_photo_like('family', 1, 10, True)
+    db.set_photo_like('family', 2, 20, True)
+    db.set_photo_like('family', 2, 21, True)
+    # warm the like-count cache before the delete
+    assert db.get_photo_likes_count('family', 1) == 1
+
+    assert db.delete_portfolio_photo('family', 1) == ('f1', 'u1')
+
+    assert db.get_portfolio_photos('family') == ['f0', 'f2']
+    assert _likes(db, 'family') == ([(1, 20), (1, 21)], [(1, 2)])
+    assert db.get_photo_likes_count('family', 1) == 2
+    assert db.get_photo_like_states([('family', 1)], 20) == {('family', 1): (2, True)}
+
+
+def test_cleared_category_does_not_pass_likes_to_new_photos(fresh_db):
+    db = fresh_db
+    db.set_portfolio_photos('family', [('f0', 'u0'), ('f1', 'u1')])
+    db.set_photo_like('family', 0, 10, True)
+    assert db.get_photo_likes_count('family', 0) == 1
+
+    assert db.clear_portfolio_photos('family') == [('f0', 'u0'), ('f1', 'u1')]
+    db.add_portfolio_photo('family', 'new-0', 'u-new-0')
+
+    assert _likes(db, 'family') == ([], [])
+    assert db.get_photo_likes_count('family', 0) == 0
+
+
+def test_duplicate_upload_rejected_after_undo_delete(fresh_db):
+    db = fresh_db
+    db.add_portfolio_photos('family', [('f0', 'u0'), ('f1', 'u1')])
+
+    removed = db.delete_portfolio_photo('family', 1)
+    assert removed == ('f1', 'u1')
+    assert db.add_portfolio_photo('family', *removed)
+
+    # the same image uploaded again comes with a new file_id but the same file_unique_id
+    assert not db.add_portfolio_photo('family', 'f1-again', 'u1')
+    assert db.get_portfolio_photos('family') == ['f0', 'f1']
+
+
+def test_duplicate_upload_rejected_after_undo_clear(fresh_db):
+    db = fresh_db
+    db.add_portfolio_photos('family', [('f0', 'u0'), ('f1', 'u1')])
+
+    db.set_portfolio_photos('family', db.clear_portfolio_photos('family'))
+
+    assert db.add_portfolio_photos('family', [('f0-again', 'u0'), ('f2', 'u2')]) == ['f2']
+    assert db.get_portfolio_photos('family') == ['f0', 'f1', 'f2']
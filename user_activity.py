@@ -0,0 +1,112 @@
+"""Учёт активности пользователей без записи в БД на каждый /start.
+
+Новый (для этого процесса) пользователь и смена username/имени/фамилии пишутся сразу
+через db_async.add_user, чтобы регистрация для рассылки не терялась. Остальные визиты
+только обновляют last_seen в памяти; накопленное сбрасывается одной пакетной
+операцией db_async.touch_users раз в ACTIVITY_FLUSH_INTERVAL секунд и при остановке.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+from aiogram.types import User
+
+import db_async
+
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv('ACTIVITY_FLUSH_INTERVAL', '30'))
+# сколько профилей помнить; вытесненный пользователь просто будет записан заново
+ACTIVITY_PROFILE_CACHE_SIZE = int(os.getenv('ACTIVITY_PROFILE_CACHE_SIZE', '50000'))
+
+_Profile = tuple[Optional[str], Optional[str], Optional[str]]
+
+
+def _utc_now() -> str:
+    # тот же формат, что у datetime('now') в SQLite
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class ActivityTracker:
+    def __init__(self, flush_interval: float = ACTIVITY_FLUSH_INTERVAL,
+                 profile_cache_size: int = ACTIVITY_PROFILE_CACHE_SIZE) -> None:
+        self.flush_interval = flush_interval
+        self._profile_cache_size = profile_cache_size
+        self._profiles: OrderedDict[int, _Profile] = OrderedDict()
+        self._last_seen: dict[int, str] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    async def seen(self, user: User) -> None:
+        """Отметить визит пользователя; пишет в БД только нового пользователя или новый профиль."""
+        profile = (user.username, user.first_name, user.last_name)
+        known = self._profiles.get(user.id)
+        if known == profile:
+            self._profiles.move_to_end(user.id)
+            self._last_seen[user.id] = _utc_now()
+            return
+        await db_async.add_user(
+            user_id=user.id,
+            username=user.username,
+            first_name=user.first_name,
+            last_name=user.last_name,
+        )
+        # add_user уже записал last_seen
+        self._last_seen.pop(user.id, None)
+        self._profiles[user.id] = profile
+        self._profiles.move_to_end(user.id)
+        while len(self._profiles) > self._profile_cache_size:
+            self._profiles.popitem(last=False)
+
+    async def flush(self) -> int:
+        """Записать накопленные last_seen одной транзакцией."""
+        async with self._flush_lock:
+            if not self._last_seen:
+                return 0
+            batch, self._last_seen = self._last_seen, {}
+            try:
+                await db_async.touch_users(list(batch.items()))
+            except Exception:
+                # вернуть в очередь, не затирая более свежие отметки
+                for user_id, ts in batch.items():
+                    self._last_seen.setdefault(user_id, ts)
+                raise
+            return len(batch)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logging.exception('Failed to flush user activity')
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановить фоновый сброс и дописать то, что накопилось."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logging.exception('Failed to flush user activity on shutdown')
+
+
+activity_tracker = ActivityTracker()
+
+
+__all__ = [
+    "ActivityTracker",
+    "activity_tracker",
+]